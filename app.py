@@ -3,7 +3,12 @@ import streamlit as st
 # set_page_config MUST be the first Streamlit command
 st.set_page_config(page_title="Expense Tracker AI Agent", layout="centered")
 
+import time
+_RUN_STARTED = time.perf_counter()
+
 import pandas as pd
+import numpy as np
+from PIL import Image, ImageOps
 import sqlite3
 from datetime import datetime
 
@@ -13,33 +18,41 @@ try:
 except ImportError:
     HAS_LIBSQL = False
 import os
+import io
+import importlib
+import importlib.util
 import re
+import atexit
+import threading
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+import asyncio
 import json
+import queue
+import random
 import hashlib
+import socket
+import subprocess
+import uuid
+import wave
+from abc import ABC, abstractmethod
 import requests
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
+from langchain_core.caches import BaseCache
+from langchain_core.exceptions import OutputParserException
+from langchain_core.load import dumps, loads
 from langchain_core.output_parsers import PydanticOutputParser
-from pydantic import BaseModel, Field
-
-# Heavy ML imports — graceful fallback if unavailable (e.g. Streamlit Cloud memory limits)
-try:
-    import torch
-    HAS_TORCH = True
-except ImportError:
-    HAS_TORCH = False
-
-try:
-    import easyocr
-    HAS_OCR = True
-except ImportError:
-    HAS_OCR = False
+from langchain_core.utils.json import parse_json_markdown
+from pydantic import BaseModel, Field, ValidationError
 
-try:
-    import whisper
-    HAS_WHISPER = True
-except ImportError:
-    HAS_WHISPER = False
+# Heavy ML packages are only looked up here; they are imported on first use (see Model loading),
+# so text-only sessions never pay for torch/EasyOCR/Whisper
+HAS_TORCH = importlib.util.find_spec("torch") is not None
+HAS_OCR = importlib.util.find_spec("easyocr") is not None
+HAS_WHISPER = importlib.util.find_spec("whisper") is not None
+HAS_FASTER_WHISPER = importlib.util.find_spec("faster_whisper") is not None
 
 try:
     import fitz  # PyMuPDF — for PDF to image conversion
@@ -47,6 +60,24 @@ try:
 except ImportError:
     HAS_PDF = False
 
+# ========================
+# Load environment variables (once per process, before any setting is read)
+# ========================
+_env_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env')
+
+@st.cache_resource
+def _load_env_file() -> bool:
+    load_dotenv(_env_path, override=True)
+    if not os.getenv("XAI_API_KEY") and os.path.exists(_env_path):
+        with open(_env_path) as _f:
+            for _line in _f:
+                _line = _line.strip()
+                if _line.startswith("XAI_API_KEY=") or _line.startswith("xAI_API_KEY="):
+                    os.environ["XAI_API_KEY"] = _line.split("=", 1)[1]
+    return True
+
+_load_env_file()
+
 # ========================
 # Database (Turso cloud DB if credentials available, else local SQLite)
 # ========================
@@ -60,66 +91,373 @@ def _get_secret(key: str) -> str | None:
             val = None
     return val
 
+def _get_bool_secret(key: str, default: bool) -> bool:
+    """Read an on/off setting ("1", "true", "yes", "on" count as on), falling back to the default if unset."""
+    val = _get_secret(key)
+    if val is None or str(val).strip() == "":
+        return default
+    return str(val).strip().lower() in ("1", "true", "yes", "on")
+
+def _get_int_secret(key: str, default: int) -> int:
+    """Read an integer setting, falling back to the default if unset or invalid."""
+    try:
+        return int(_get_secret(key) or default)
+    except (TypeError, ValueError):
+        return default
+
+# Per-rerun timing: with RERUN_TIMING set, each run logs how long every stage of the script took
+RERUN_TIMING = _get_bool_secret("RERUN_TIMING", False)
+_run_marks = [("start", _RUN_STARTED)]
+
+def _mark_timing(stage: str):
+    """Close the current stage of the RERUN_TIMING log at this point of the script."""
+    if RERUN_TIMING:
+        _run_marks.append((stage, time.perf_counter()))
+
+@st.cache_resource
+def _process_run_counter() -> Counter:
+    return Counter()
+
+def _log_run_timing(last_stage: str):
+    if not RERUN_TIMING:
+        return
+    _mark_timing(last_stage)
+    runs = _process_run_counter()
+    runs["total"] += 1
+    stages = " | ".join(f"{stage} {(end - begin) * 1000:.1f}ms"
+                        for (_, begin), (stage, end) in zip(_run_marks, _run_marks[1:]))
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] [TIMING] run #{runs['total']} "
+          f"({'cold' if runs['total'] == 1 else 'warm'}): {stages} | "
+          f"total {(_run_marks[-1][1] - _RUN_STARTED) * 1000:.1f}ms")
+
+_mark_timing("imports+config")
+
 _turso_url = _get_secret("TURSO_DATABASE_URL")
 _turso_token = _get_secret("TURSO_AUTH_TOKEN")
+_USING_CLOUD_DB = bool(HAS_LIBSQL and _turso_url and _turso_token)
 
-if HAS_LIBSQL and _turso_url and _turso_token:
-    # Cloud mode: connect to Turso (persistent)
+if _USING_CLOUD_DB:
+    # Cloud mode: embedded replica of the Turso database (persistent)
     _db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'local_replica.db')
-    conn = libsql.connect(_db_path, sync_url=_turso_url, auth_token=_turso_token)
-    conn.sync()
-    _USING_CLOUD_DB = True
 else:
     # Local mode: plain SQLite file
     _db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'expenses.db')
-    conn = sqlite3.connect(_db_path, check_same_thread=False)
-    _USING_CLOUD_DB = False
-
-# Users table
-conn.execute('''CREATE TABLE IF NOT EXISTS users
-                (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                 username TEXT UNIQUE NOT NULL,
-                 password_hash TEXT NOT NULL,
-                 created_at TEXT DEFAULT CURRENT_TIMESTAMP)''')
-
-# Expenses table (with username)
-conn.execute('''CREATE TABLE IF NOT EXISTS expenses
-                (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                 username TEXT NOT NULL,
-                 date TEXT,
-                 merchant TEXT,
-                 category TEXT,
-                 currency TEXT DEFAULT 'HKD',
-                 amount REAL,
-                 amount_hkd REAL,
-                 items TEXT,
-                 source TEXT)''')
-conn.commit()
-if _USING_CLOUD_DB:
-    conn.sync()
 
-# Migrate: add username column if missing (for existing DBs)
-try:
-    conn.execute("ALTER TABLE expenses ADD COLUMN username TEXT DEFAULT ''")
-    conn.commit()
-except (sqlite3.OperationalError, Exception):
-    pass
-try:
-    conn.execute("ALTER TABLE expenses ADD COLUMN currency TEXT DEFAULT 'HKD'")
-    conn.commit()
-except (sqlite3.OperationalError, Exception):
-    pass
-try:
-    conn.execute("ALTER TABLE expenses ADD COLUMN amount_hkd REAL")
-    conn.commit()
-except (sqlite3.OperationalError, Exception):
-    pass
-
-def _commit():
-    """Commit and sync to cloud DB if using Turso."""
-    conn.commit()
+def _connect():
+    """Open a new connection to the configured database."""
     if _USING_CLOUD_DB:
-        conn.sync()
+        return libsql.connect(_db_path, sync_url=_turso_url, auth_token=_turso_token)
+    return sqlite3.connect(_db_path, check_same_thread=False)
+
+class SyncScheduler:
+    """Coalesces committed writes and syncs the Turso replica on a background thread.
+
+    A sync runs SYNC_INTERVAL_SECONDS after the first unsynced write, or as soon as
+    SYNC_MAX_PENDING writes are waiting. flush() syncs immediately in the caller's thread. Syncs go
+    through the pool's one replica connection, so they never run in the middle of a transaction."""
+
+    def __init__(self, interval: float, max_pending: int):
+        self.interval = interval
+        self.max_pending = max_pending
+        self.pending = 0
+        self.last_sync_at: float | None = None
+        self.last_error: str | None = None
+        self._first_pending_at: float | None = None
+        self._force = False
+        self._state_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._wake = threading.Event()
+        threading.Thread(target=self._run, name="turso-sync", daemon=True).start()
+        atexit.register(self.flush)
+
+    def mark_dirty(self, writes: int = 1):
+        with self._state_lock:
+            self.pending += writes
+            if self._first_pending_at is None:
+                # Wake the idle thread so it starts the debounce timer
+                self._first_pending_at = time.monotonic()
+                self._wake.set()
+            if self.pending >= self.max_pending:
+                self._wake.set()
+
+    def request_sync(self):
+        """Ask the background thread to sync as soon as possible."""
+        with self._state_lock:
+            self._force = True
+        self._wake.set()
+
+    def flush(self):
+        """Sync now, blocking until done (used on logout and shutdown)."""
+        self._sync()
+
+    def _sync(self):
+        with self._sync_lock:
+            with self._state_lock:
+                synced_writes = self.pending
+                self.pending = 0
+                self._first_pending_at = None
+            try:
+                with db_pool.connection() as db:
+                    db.sync()
+                self.last_sync_at = time.time()
+                self.last_error = None
+            except Exception as e:
+                # Keep the writes pending so the next round retries them
+                with self._state_lock:
+                    self.pending += synced_writes
+                    if self.pending and self._first_pending_at is None:
+                        self._first_pending_at = time.monotonic()
+                self.last_error = str(e)
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] [SYNC ERROR] {e}")
+
+    def _run(self):
+        while True:
+            with self._state_lock:
+                if self._force:
+                    timeout = 0.0
+                elif self._first_pending_at is None:
+                    timeout = None
+                else:
+                    timeout = max(0.0, self._first_pending_at + self.interval - time.monotonic())
+            if timeout is None or timeout > 0:
+                self._wake.wait(timeout)
+            self._wake.clear()
+            with self._state_lock:
+                due = self._force or (self.pending > 0 and (
+                    self.pending >= self.max_pending
+                    or time.monotonic() - self._first_pending_at >= self.interval))
+                self._force = False
+            if due:
+                self._sync()
+
+@st.cache_resource
+def _get_sync_scheduler() -> SyncScheduler:
+    """One scheduler per process; performs the startup sync."""
+    scheduler = SyncScheduler(
+        interval=_get_int_secret("SYNC_INTERVAL_SECONDS", 5),
+        max_pending=_get_int_secret("SYNC_MAX_PENDING", 20),
+    )
+    if os.path.exists(_db_path):
+        # Serve from the existing replica right away and catch up in the background
+        scheduler.request_sync()
+    else:
+        # First start on this machine: nothing to read until the replica is pulled
+        scheduler.flush()
+    return scheduler
+
+# Cloud mode keeps a single embedded replica connection: a write is only guaranteed visible to the
+# connection that made it until the replica syncs, and several handles on one replica file conflict
+DB_POOL_SIZE = 1 if _USING_CLOUD_DB else max(1, _get_int_secret("DB_POOL_SIZE", 4))
+DB_BUSY_TIMEOUT_MS = _get_int_secret("DB_BUSY_TIMEOUT_MS", 5000)
+
+class ConnectionPool:
+    """A small set of connections shared by every session and worker thread.
+
+    A connection belongs to one borrower at a time, so transactions from different users never
+    interleave. Borrow with connection() for reads and transaction() for writes; take care not to
+    borrow again while holding one, or a full pool would wait on itself."""
+
+    def __init__(self, size: int):
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @staticmethod
+    def _open():
+        db = _connect()
+        if not _USING_CLOUD_DB:
+            # WAL lets readers run alongside a writer; NORMAL sync is durable enough with WAL
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+            db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    @contextmanager
+    def connection(self):
+        if not self._slots.acquire(timeout=30):
+            raise TimeoutError("No database connection became free")
+        try:
+            try:
+                db = self._idle.get_nowait()
+            except queue.Empty:
+                db = self._open()
+            try:
+                yield db
+            finally:
+                # Never hand the next borrower someone else's half-finished transaction
+                if getattr(db, "in_transaction", False):
+                    db.rollback()
+                self._idle.put(db)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def transaction(self):
+        """Borrow a connection and commit on success, roll back on error.
+
+        The Turso sync is deferred to the background scheduler."""
+        with self.connection() as db:
+            try:
+                yield db
+                db.commit()
+            except BaseException:
+                db.rollback()
+                raise
+        if _sync_scheduler is not None:
+            _sync_scheduler.mark_dirty()
+
+@st.cache_resource
+def _get_db_pool() -> ConnectionPool:
+    return ConnectionPool(DB_POOL_SIZE)
+
+db_pool = _get_db_pool()
+_sync_scheduler = _get_sync_scheduler() if _USING_CLOUD_DB else None
+
+# ========================
+# Schema migrations — each step runs once, in order, recorded in schema_version
+# ========================
+def _normalize_date(value) -> str | None:
+    """Coerce a stored or user-entered date to sortable YYYY-MM-DD (None if unparseable)."""
+    if value is None:
+        return None
+    text = str(value).strip()
+    if not text:
+        return None
+    parsed = pd.to_datetime(text, errors='coerce')
+    if pd.isna(parsed):
+        return None
+    return parsed.strftime('%Y-%m-%d')
+
+def _table_columns(conn, table: str) -> set[str]:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+
+def _migrate_legacy_columns(conn):
+    """Columns added after the first release (older DBs lack them)."""
+    columns = _table_columns(conn, "expenses")
+    if "username" not in columns:
+        conn.execute("ALTER TABLE expenses ADD COLUMN username TEXT DEFAULT ''")
+    if "currency" not in columns:
+        conn.execute("ALTER TABLE expenses ADD COLUMN currency TEXT DEFAULT 'HKD'")
+    if "amount_hkd" not in columns:
+        conn.execute("ALTER TABLE expenses ADD COLUMN amount_hkd REAL")
+
+def _migrate_normalize_dates(conn):
+    """Rewrite non-ISO dates as YYYY-MM-DD so date ranges can use the indexes."""
+    rows = conn.execute("""
+        SELECT id, date FROM expenses
+        WHERE date IS NOT NULL AND date NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+    """).fetchall()
+    updates = [(normalized, row_id) for row_id, raw in rows
+               if (normalized := _normalize_date(raw)) is not None]
+    if updates:
+        conn.executemany("UPDATE expenses SET date = ? WHERE id = ?", updates)
+
+def _migrate_expense_indexes(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_expenses_user_date ON expenses (username, date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_expenses_user_category_date ON expenses (username, category, date)")
+
+def _migrate_parse_cache(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS parse_cache
+                    (cache_key TEXT PRIMARY KEY,
+                     kind TEXT NOT NULL,
+                     result TEXT NOT NULL,
+                     ref_date TEXT NOT NULL,
+                     created_at REAL NOT NULL,
+                     last_used_at REAL NOT NULL,
+                     hits INTEGER DEFAULT 0)''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_parse_cache_last_used ON parse_cache (last_used_at)")
+
+def _migrate_category_keywords(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS category_keywords
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     username TEXT NOT NULL,
+                     keyword TEXT NOT NULL,
+                     category TEXT NOT NULL,
+                     UNIQUE (username, keyword))''')
+
+def _migrate_jobs(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS jobs
+                    (id TEXT PRIMARY KEY,
+                     username TEXT NOT NULL,
+                     kind TEXT NOT NULL,
+                     name TEXT,
+                     status TEXT NOT NULL DEFAULT 'queued',
+                     progress REAL NOT NULL DEFAULT 0,
+                     result TEXT,
+                     error TEXT,
+                     created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                     updated_at TEXT DEFAULT CURRENT_TIMESTAMP)''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_user_created ON jobs (username, created_at)")
+
+def _migrate_fx_rates(conn):
+    # rate is units of currency per 1 HKD, as shown in the sidebar
+    conn.execute('''CREATE TABLE IF NOT EXISTS fx_rates
+                    (date TEXT NOT NULL,
+                     currency TEXT NOT NULL,
+                     rate REAL NOT NULL,
+                     source TEXT,
+                     PRIMARY KEY (date, currency))''')
+
+def _migrate_job_owner(conn):
+    # host:pid of the process holding the job's payload; NULL for jobs queued before this column
+    if "owner" not in _table_columns(conn, "jobs"):
+        conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+
+MIGRATIONS = [
+    (1, _migrate_legacy_columns),
+    (2, _migrate_normalize_dates),
+    (3, _migrate_expense_indexes),
+    (4, _migrate_parse_cache),
+    (5, _migrate_category_keywords),
+    (6, _migrate_jobs),
+    (7, _migrate_fx_rates),
+    (8, _migrate_job_owner),
+]
+
+def run_migrations():
+    """Apply every migration newer than the recorded schema version, each in its own transaction."""
+    with db_pool.transaction() as conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS schema_version
+                        (version INTEGER PRIMARY KEY,
+                         applied_at TEXT DEFAULT CURRENT_TIMESTAMP)''')
+        applied = {row[0] for row in conn.execute("SELECT version FROM schema_version").fetchall()}
+    for version, step in MIGRATIONS:
+        if version in applied:
+            continue
+        with db_pool.transaction() as conn:
+            step(conn)
+            conn.execute("INSERT INTO schema_version (version) VALUES (?)", (version,))
+
+def _create_base_tables():
+    with db_pool.transaction() as conn:
+        # Users table
+        conn.execute('''CREATE TABLE IF NOT EXISTS users
+                        (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                         username TEXT UNIQUE NOT NULL,
+                         password_hash TEXT NOT NULL,
+                         created_at TEXT DEFAULT CURRENT_TIMESTAMP)''')
+
+        # Expenses table (with username)
+        conn.execute('''CREATE TABLE IF NOT EXISTS expenses
+                        (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                         username TEXT NOT NULL,
+                         date TEXT,
+                         merchant TEXT,
+                         category TEXT,
+                         currency TEXT DEFAULT 'HKD',
+                         amount REAL,
+                         amount_hkd REAL,
+                         items TEXT,
+                         source TEXT)''')
+
+@st.cache_resource
+def _init_schema() -> bool:
+    """Create and migrate the schema once per process rather than on every rerun."""
+    _create_base_tables()
+    run_migrations()
+    return True
+
+_init_schema()
+_mark_timing("db")
 
 # ========================
 # Auth helpers
@@ -131,9 +469,9 @@ def _hash_password(password: str) -> str:
 
 def register_user(username: str, password: str) -> bool:
     try:
-        conn.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)",
-                     (username.strip().lower(), _hash_password(password)))
-        _commit()
+        with db_pool.transaction() as conn:
+            conn.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)",
+                         (username.strip().lower(), _hash_password(password)))
         return True
     except (sqlite3.IntegrityError, Exception) as e:
         if "UNIQUE" in str(e).upper() or "IntegrityError" in type(e).__name__:
@@ -141,8 +479,9 @@ def register_user(username: str, password: str) -> bool:
         return False
 
 def authenticate_user(username: str, password: str) -> bool:
-    row = conn.execute("SELECT password_hash FROM users WHERE username = ?",
-                       (username.strip().lower(),)).fetchone()
+    with db_pool.connection() as conn:
+        row = conn.execute("SELECT password_hash FROM users WHERE username = ?",
+                           (username.strip().lower(),)).fetchone()
     if row and row[0] == _hash_password(password):
         return True
     return False
@@ -158,7 +497,7 @@ TRANSLATIONS = {
         "tab_photo": "Photo Receipt",
         "tab_voice": "Voice Input",
         "tab_free": "Free Text",
-        "upload_label": "Upload a receipt (JPG/PNG/PDF)",
+        "upload_label": "Upload receipts (JPG/PNG/PDF)",
         "extracted_text": "**Extracted Text:**",
         "btn_parse_photo": "Parse with AI Agent & Save (Photo)",
         "btn_parse_voice": "Parse with AI Agent & Save (Voice)",
@@ -172,6 +511,7 @@ TRANSLATIONS = {
         "free_text_confirm": "Confirm & Save",
         "free_text_saved": "Saved — zero API calls!",
         "success_added": "Added: **{merchant}** — {amount} {currency} = {amount_hkd:.2f} HKD ({category}) on {date}",
+        "save_invalid": "Not saved: the expense didn't pass validation. Check the fields and try again.",
         "parsed_local": "Parsed locally (free)",
         "parsed_api": "Parsed via API",
         "header_all_expenses": "All Recorded Expenses",
@@ -198,6 +538,16 @@ TRANSLATIONS = {
         "sidebar_fx_live": "Rates auto-updated daily from open.er-api.com. You can override below.",
         "sidebar_fx_fallback": "Using fallback rates (offline). Edit manually below.",
         "sidebar_fx_refresh": "Refresh rates now",
+        "sidebar_fx_stale": "Using live rates from {date}; newer rates are fetched in the background.",
+        "sidebar_fx_refreshing": "Fetching the latest rates…",
+        "fx_history_header": "Historical rates",
+        "fx_history_count": "{count} dated rate(s) stored. Past expenses convert at the rate for their date.",
+        "fx_import_label": "Backfill from CSV (date, currency, rate per 1 HKD)",
+        "fx_import_btn": "Import rates",
+        "fx_import_done": "Imported {count} rate(s), skipped {skipped} invalid row(s).",
+        "fx_import_failed": "Could not import rates: {error}",
+        "fx_recompute_btn": "Recompute HKD amounts",
+        "fx_recompute_done": "Updated the HKD amount of {count} expense(s).",
         "tab_quick": "Quick Form",
         "quick_date": "Date",
         "quick_merchant": "Merchant / Store",
@@ -227,6 +577,9 @@ TRANSLATIONS = {
         "register_error_empty": "Please fill in all fields.",
         "logout": "Logout",
         "logged_in_as": "Logged in as",
+        "sync_pending": "{count} change(s) waiting to sync to the cloud",
+        "sync_ok": "All changes synced to the cloud",
+        "sync_error": "Cloud sync failed — changes are kept locally and will be retried",
         "switch_to_register": "Don't have an account? Register",
         "switch_to_login": "Already have an account? Login",
         "delete_selected": "Delete Selected",
@@ -243,12 +596,34 @@ TRANSLATIONS = {
         "save_changes": "Save Changes",
         "save_changes_success": "{count} expense(s) updated.",
         "save_changes_none": "No changes detected.",
+        "filters": "Filters",
+        "filter_date_range": "Date range",
+        "filter_categories": "Categories",
+        "filter_merchant": "Merchant contains",
+        "page_size": "Rows per page",
+        "page_prev": "Previous",
+        "page_next": "Next",
+        "page_info": "Page {page} · {count} matching expense(s)",
+        "no_expenses_filtered": "No expenses match these filters.",
         "missing_api_key_title": "API key missing",
         "missing_api_key_body": "Set XAI_API_KEY in Streamlit Secrets (or .env locally) to enable AI parsing.",
         "multi_found": "Found **{count}** transaction(s). Review and edit below, then save.",
         "multi_save_all": "Save All ({count})",
         "multi_saved": "Saved {count} expense(s)!",
         "multi_remove": "Remove",
+        "ocr_cached": "Reused the text extracted from this file earlier",
+        "job_queued": "waiting in queue",
+        "job_failed": "failed ({error})",
+        "job_pick_receipt": "Receipt to review",
+        "pdf_page_method": "Page {page}: {method}",
+        "pdf_method_text": "text layer",
+        "pdf_method_ocr": "OCR",
+        "pdf_method_none": "no text",
+        "kw_header": "My category keywords",
+        "kw_caption": "Keywords added here take priority over the built-in ones when a category is guessed.",
+        "kw_keyword": "Keyword",
+        "kw_add": "Add keyword",
+        "kw_remove": "Remove keyword",
     },
     "zh-TW": {
         "page_title": "AI 記帳助手",
@@ -257,7 +632,7 @@ TRANSLATIONS = {
         "tab_photo": "拍照收據",
         "tab_voice": "語音輸入",
         "tab_free": "自由輸入",
-        "upload_label": "上傳收據（JPG/PNG/PDF）",
+        "upload_label": "上傳收據（JPG/PNG/PDF，可多張）",
         "extracted_text": "**擷取文字：**",
         "btn_parse_photo": "AI 解析並儲存（照片）",
         "btn_parse_voice": "AI 解析並儲存（語音）",
@@ -271,6 +646,7 @@ TRANSLATIONS = {
         "free_text_confirm": "確認並儲存",
         "free_text_saved": "已儲存 — 未使用 API！",
         "success_added": "已新增：**{merchant}** — {amount} {currency} = {amount_hkd:.2f} HKD（{category}）{date}",
+        "save_invalid": "未儲存：資料未通過驗證，請檢查欄位後再試。",
         "parsed_local": "本地解析（免費）",
         "parsed_api": "透過 API 解析",
         "header_all_expenses": "所有支出記錄",
@@ -297,6 +673,16 @@ TRANSLATIONS = {
         "sidebar_fx_live": "匯率每日自動更新自 open.er-api.com，可手動覆寫。",
         "sidebar_fx_fallback": "目前使用離線匯率，請手動編輯。",
         "sidebar_fx_refresh": "立即更新匯率",
+        "sidebar_fx_stale": "目前使用 {date} 的匯率，正在背景更新。",
+        "sidebar_fx_refreshing": "正在取得最新匯率…",
+        "fx_history_header": "歷史匯率",
+        "fx_history_count": "已儲存 {count} 筆日期匯率，過往支出會按當日匯率換算。",
+        "fx_import_label": "從 CSV 匯入（date、currency、每 1 HKD 的 rate）",
+        "fx_import_btn": "匯入匯率",
+        "fx_import_done": "已匯入 {count} 筆匯率，略過 {skipped} 筆無效資料。",
+        "fx_import_failed": "無法匯入匯率：{error}",
+        "fx_recompute_btn": "重新計算 HKD 金額",
+        "fx_recompute_done": "已更新 {count} 筆支出的 HKD 金額。",
         "tab_quick": "快速表單",
         "quick_date": "日期",
         "quick_merchant": "商家 / 店名",
@@ -326,6 +712,9 @@ TRANSLATIONS = {
         "register_error_empty": "請填寫所有欄位。",
         "logout": "登出",
         "logged_in_as": "目前登入",
+        "sync_pending": "{count} 筆變更等待同步至雲端",
+        "sync_ok": "所有變更已同步至雲端",
+        "sync_error": "雲端同步失敗 — 變更已保存在本機，稍後會重試",
         "switch_to_register": "還沒有帳號？註冊",
         "switch_to_login": "已有帳號？登入",
         "delete_selected": "刪除所選",
@@ -342,12 +731,34 @@ TRANSLATIONS = {
         "save_changes": "儲存修改",
         "save_changes_success": "已更新 {count} 筆支出。",
         "save_changes_none": "未偵測到任何變更。",
+        "filters": "篩選",
+        "filter_date_range": "日期範圍",
+        "filter_categories": "分類",
+        "filter_merchant": "商家包含",
+        "page_size": "每頁筆數",
+        "page_prev": "上一頁",
+        "page_next": "下一頁",
+        "page_info": "第 {page} 頁 · 共 {count} 筆符合",
+        "no_expenses_filtered": "沒有符合篩選條件的支出。",
         "missing_api_key_title": "缺少 API 金鑰",
         "missing_api_key_body": "請在 Streamlit Secrets 設定 XAI_API_KEY（本機可用 .env）。",
         "multi_found": "找到 **{count}** 筆交易，請在下方檢查並編輯後儲存。",
         "multi_save_all": "全部儲存（{count}筆）",
         "multi_saved": "已儲存 {count} 筆支出！",
         "multi_remove": "移除",
+        "ocr_cached": "已沿用先前從此檔案擷取的文字",
+        "job_queued": "排隊等候中",
+        "job_failed": "失敗（{error}）",
+        "job_pick_receipt": "要檢視的收據",
+        "pdf_page_method": "第 {page} 頁：{method}",
+        "pdf_method_text": "文字層",
+        "pdf_method_ocr": "OCR",
+        "pdf_method_none": "無文字",
+        "kw_header": "我的分類關鍵字",
+        "kw_caption": "在此新增的關鍵字在猜測分類時優先於內建關鍵字。",
+        "kw_keyword": "關鍵字",
+        "kw_add": "新增關鍵字",
+        "kw_remove": "移除關鍵字",
     },
 }
 
@@ -430,34 +841,32 @@ if st.session_state.logged_in_user is None:
             st.session_state.auth_mode = "login"
             st.rerun()
 
+    _log_run_timing("login")
     st.stop()  # Don't render the rest of the app until logged in
 
 # ========================
 # User is logged in — show main app
 # ========================
+_mark_timing("i18n+auth")
 CURRENT_USER = st.session_state.logged_in_user
 
 # Sidebar: user info + logout
 with st.sidebar:
     st.divider()
     st.write(f"👤 **{t('logged_in_as')}:** {CURRENT_USER}")
+    if _sync_scheduler is not None:
+        if _sync_scheduler.last_error:
+            st.caption(f"⚠️ {t('sync_error')}")
+        elif _sync_scheduler.pending:
+            st.caption(f"⏳ {t('sync_pending', count=_sync_scheduler.pending)}")
+        else:
+            st.caption(f"☁️ {t('sync_ok')}")
     if st.button(f"🚪 {t('logout')}"):
+        if _sync_scheduler is not None:
+            _sync_scheduler.flush()
         st.session_state.logged_in_user = None
         st.rerun()
 
-# ========================
-# Load environment variables
-# ========================
-_env_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env')
-load_dotenv(_env_path, override=True)
-
-if not os.getenv("XAI_API_KEY") and os.path.exists(_env_path):
-    with open(_env_path) as _f:
-        for _line in _f:
-            _line = _line.strip()
-            if _line.startswith("XAI_API_KEY=") or _line.startswith("xAI_API_KEY="):
-                os.environ["XAI_API_KEY"] = _line.split("=", 1)[1]
-
 def _get_xai_api_key() -> str | None:
     key = os.getenv("XAI_API_KEY") or os.getenv("xAI_API_KEY")
     if not key:
@@ -473,35 +882,600 @@ def _get_xai_api_key() -> str | None:
     return key
 
 # ========================
-# Device detection
+# Model loading (cached, on first use) — only if available
 # ========================
-if HAS_TORCH:
+MODEL_PREWARM = _get_bool_secret("MODEL_PREWARM", False)
+
+@st.cache_resource
+def get_device() -> str:
+    """Best torch device; importing torch is deferred to the first model that needs it."""
+    if not HAS_TORCH:
+        return "cpu"
+    torch = importlib.import_module("torch")
     if torch.backends.mps.is_available():
-        DEVICE = "mps"
-    elif torch.cuda.is_available():
-        DEVICE = "cuda"
-    else:
-        DEVICE = "cpu"
-else:
-    DEVICE = "cpu"
+        return "mps"
+    if torch.cuda.is_available():
+        return "cuda"
+    return "cpu"
+
+@st.cache_resource
+def load_ocr_reader():
+    start = time.perf_counter()
+    easyocr = importlib.import_module("easyocr")
+    ocr_reader = easyocr.Reader(['en', 'ch_tra'], gpu=get_device() == "cuda")
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] [OCR] Loaded EasyOCR in {time.perf_counter() - start:.1f}s")
+    return ocr_reader
 
 # ========================
-# Model loading (cached) — only if available
+# Receipt text extraction (PDF text layer first, OCR pages in parallel)
 # ========================
-reader = None
-whisper_model = None
+OCR_WORKERS = max(1, _get_int_secret("OCR_WORKERS", os.cpu_count() or 1))
+PDF_RENDER_ZOOM = 2
+
+@st.cache_resource
+def _get_ocr_pool() -> ThreadPoolExecutor:
+    """Process-wide OCR worker pool, shared by all sessions so uploads can't oversubscribe the CPU.
+
+    Threads rather than processes: EasyOCR's torch inference releases the GIL, and every worker
+    shares the one loaded reader instead of holding its own copy of the model."""
+    if HAS_TORCH and OCR_WORKERS > 1:
+        # Split the cores between concurrent pages instead of letting each page grab all of them
+        importlib.import_module("torch").set_num_threads(max(1, (os.cpu_count() or 1) // OCR_WORKERS))
+    return ThreadPoolExecutor(max_workers=OCR_WORKERS, thread_name_prefix="ocr")
+
+# Preprocessing: phone photos arrive at 12+ MP and OCR cost grows with pixel count, so rotate,
+# crop to the receipt and shrink until text lines are about OCR_TARGET_TEXT_HEIGHT pixels tall
+OCR_PREPROCESS = _get_bool_secret("OCR_PREPROCESS", True)
+OCR_MAX_SIDE = _get_int_secret("OCR_MAX_SIDE", 2000)
+OCR_TARGET_TEXT_HEIGHT = _get_int_secret("OCR_TARGET_TEXT_HEIGHT", 32)
+OCR_CROP = _get_bool_secret("OCR_CROP", True)
+OCR_BINARIZE = _get_bool_secret("OCR_BINARIZE", False)
+
+def _otsu_threshold(gray: np.ndarray) -> int:
+    """Grey level that best separates ink from paper (Otsu's between-class variance)."""
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    weight_bg = np.cumsum(hist)
+    weight_fg = weight_bg[-1] - weight_bg
+    cum_mean = np.cumsum(hist * np.arange(256))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_bg = cum_mean / weight_bg
+        mean_fg = (cum_mean[-1] - cum_mean) / weight_fg
+        variance = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return int(np.nanargmax(variance))
+
+def _receipt_bbox(gray: np.ndarray) -> tuple[int, int, int, int] | None:
+    """Bounding box (left, top, right, bottom) of the bright paper, or None to keep the full frame.
+
+    Works on a small thumbnail: rows/columns that are mostly paper-bright belong to the receipt."""
+    height, width = gray.shape
+    step = max(1, max(height, width) // 256)
+    small = gray[::step, ::step]
+    paper = small > _otsu_threshold(small)
+    rows = np.flatnonzero(paper.mean(axis=1) > 0.3)
+    cols = np.flatnonzero(paper.mean(axis=0) > 0.3)
+    if rows.size == 0 or cols.size == 0:
+        return None
+    margin = 2
+    top, bottom = max(0, rows[0] - margin) * step, min(small.shape[0], rows[-1] + 1 + margin) * step
+    left, right = max(0, cols[0] - margin) * step, min(small.shape[1], cols[-1] + 1 + margin) * step
+    area = (bottom - top) * (right - left) / (height * width)
+    # Tiny boxes are glare, near-full boxes mean there is no background worth removing
+    if area < 0.15 or area > 0.9:
+        return None
+    return left, top, min(right, width), min(bottom, height)
+
+def _median_text_height(gray: np.ndarray) -> float | None:
+    """Median height in pixels of the text lines, from the horizontal ink projection profile."""
+    # Skip the outer columns so background left around the crop doesn't mark every row as ink
+    inner = gray[:, gray.shape[1] // 20:gray.shape[1] - gray.shape[1] // 20]
+    ink_rows = ((inner < _otsu_threshold(inner)).mean(axis=1) > 0.01).astype(np.int8)
+    edges = np.diff(np.concatenate(([0], ink_rows, [0])))
+    heights = np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+    # Specks and rules are too short, photos and shadows too tall to be text lines
+    heights = heights[(heights >= 4) & (heights <= gray.shape[0] // 4)]
+    return float(np.median(heights)) if heights.size else None
+
+def preprocess_receipt_image(image) -> np.ndarray:
+    """Turn receipt bytes or a PIL image into an upright, cropped, downscaled grayscale array for OCR."""
+    if not isinstance(image, Image.Image):
+        image = Image.open(io.BytesIO(image))
+    image = ImageOps.exif_transpose(image).convert("L")
+    if OCR_CROP:
+        bbox = _receipt_bbox(np.asarray(image))
+        if bbox is not None:
+            image = image.crop(bbox)
+
+    scale = min(1.0, OCR_MAX_SIDE / max(image.size))
+    text_height = _median_text_height(np.asarray(image))
+    if text_height:
+        # Only ever shrink; the floor keeps a mis-measured profile from collapsing the image
+        scale = min(scale, max(OCR_TARGET_TEXT_HEIGHT / text_height, 0.1))
+    if scale < 0.95:
+        image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                             Image.Resampling.LANCZOS)
+
+    pixels = np.asarray(image)
+    if OCR_BINARIZE:
+        pixels = np.where(pixels > _otsu_threshold(pixels), 255, 0).astype(np.uint8)
+    return pixels
+
+def _ocr_raw(image) -> str:
+    if isinstance(image, Image.Image):
+        image = np.asarray(image)
+    return "\n".join(load_ocr_reader().readtext(image, detail=0, paragraph=True))
+
+def ocr_image(image) -> str:
+    """OCR receipt bytes or a PIL image, preprocessed unless OCR_PREPROCESS is off.
+
+    benchmarks/ocr_benchmark.py compares both paths for latency and accuracy."""
+    if not OCR_PREPROCESS:
+        return _ocr_raw(image)
+    return "\n".join(load_ocr_reader().readtext(preprocess_receipt_image(image), detail=0, paragraph=True))
+
+PDF_TEXT_MIN_CHARS = 20
+
+def _pdf_page_text_layer(page) -> str:
+    """The page's embedded text, text blocks in reading order (top-to-bottom, left-to-right)."""
+    blocks = [b for b in page.get_text("blocks") if b[6] == 0 and b[4].strip()]
+    blocks.sort(key=lambda b: (round(b[1]), b[0]))
+    return "\n".join(b[4].strip() for b in blocks)
+
+def _text_layer_usable(text: str) -> bool:
+    """Reject empty layers and garbage (unmapped glyphs, symbol soup) so those pages go to OCR."""
+    chars = ''.join(text.split())
+    if len(chars) < PDF_TEXT_MIN_CHARS:
+        return False
+    if chars.count('\ufffd') / len(chars) > 0.05:
+        return False
+    return sum(ch.isalnum() for ch in chars) / len(chars) >= 0.5
 
-if HAS_OCR:
-    @st.cache_resource
-    def load_ocr_reader():
-        return easyocr.Reader(['en', 'ch_tra'], gpu=(HAS_TORCH and torch.cuda.is_available()))
-    reader = load_ocr_reader()
+def extract_pdf_text(file_bytes: bytes, on_page=None) -> tuple[str, list[str]]:
+    """Extract every page of a PDF, joined in page order, plus how each page was read.
 
+    Pages with a usable embedded text layer are read directly ("text"); the rest are rasterised on
+    the calling thread (PyMuPDF is not thread-safe) and OCR'd on the worker pool ("ocr"), or marked
+    "none" when OCR is unavailable. on_page(page_num, page_text, method, done, total) is called as
+    each page finishes."""
+    futures = {}
+    doc = fitz.open(stream=file_bytes, filetype="pdf")
+    try:
+        total = len(doc)
+        page_texts = [""] * total
+        methods = ["none"] * total
+        done = 0
+        for page_num in range(total):
+            page = doc[page_num]
+            text_layer = _pdf_page_text_layer(page)
+            if _text_layer_usable(text_layer):
+                page_texts[page_num], methods[page_num] = text_layer, "text"
+            elif HAS_OCR:
+                pix = page.get_pixmap(matrix=fitz.Matrix(PDF_RENDER_ZOOM, PDF_RENDER_ZOOM),
+                                      colorspace=fitz.csGRAY, alpha=False)
+                page_image = Image.frombytes("L", (pix.width, pix.height), pix.samples, "raw", "L", pix.stride)
+                futures[_get_ocr_pool().submit(ocr_image, page_image)] = page_num
+                methods[page_num] = "ocr"
+                continue
+            done += 1
+            if on_page is not None:
+                on_page(page_num, page_texts[page_num], methods[page_num], done, total)
+    finally:
+        doc.close()
+
+    for future in as_completed(futures):
+        page_num = futures[future]
+        page_texts[page_num] = future.result()
+        done += 1
+        if on_page is not None:
+            on_page(page_num, page_texts[page_num], "ocr", done, total)
+    text = "\n\n".join(f"--- Page {page_num + 1} ---\n{page_text}"
+                       for page_num, page_text in enumerate(page_texts) if page_text.strip())
+    return text, methods
+
+# Extracted text is cached by a hash of the file bytes plus everything that changes the output,
+# so reruns and re-uploads of the same receipt skip OCR entirely
+OCR_CACHE_MAX_ENTRIES = _get_int_secret("OCR_CACHE_MAX_ENTRIES", 64)
+OCR_CACHE_DIR = _get_secret("OCR_CACHE_DIR")
+OCR_CACHE_DIR_MAX_ENTRIES = _get_int_secret("OCR_CACHE_DIR_MAX_ENTRIES", 1000)
+OCR_SETTINGS = (f"easyocr:en+ch_tra:paragraph|zoom={PDF_RENDER_ZOOM}|min_chars={PDF_TEXT_MIN_CHARS}|ocr={HAS_OCR}"
+                f"|prep={OCR_PREPROCESS}:{OCR_MAX_SIDE}:{OCR_TARGET_TEXT_HEIGHT}:{OCR_CROP}:{OCR_BINARIZE}")
+
+class OcrResultCache:
+    """Thread-safe LRU of extracted receipt text, optionally persisted as one JSON file per entry.
+
+    The directory is bounded too: files beyond max_disk_entries are pruned oldest-first by mtime,
+    which a disk hit refreshes, so it behaves as an LRU shared by every process using it."""
+
+    def __init__(self, max_entries: int, cache_dir: str | None = None, max_disk_entries: int = 1000):
+        self.max_entries = max(1, max_entries)
+        self.cache_dir = cache_dir
+        self.max_disk_entries = max(1, max_disk_entries)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._prune_disk()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> tuple[str, list[str]] | None:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                data = json.load(f)
+            value = (data["text"], list(data["methods"]))
+            os.utime(self._path(key))
+        except (OSError, ValueError, KeyError):
+            return None
+        self._remember(key, value)
+        return value
+
+    def put(self, key: str, value: tuple[str, list[str]], username: str):
+        self._remember(key, value)
+        if not self.cache_dir:
+            return
+        tmp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"text": value[0], "methods": value[1]}, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] [OCR] [{username}] Cache write failed: {e}")
+            return
+        self._prune_disk()
+
+    def _prune_disk(self):
+        def mtime(entry) -> float:
+            try:
+                return entry.stat().st_mtime
+            except OSError:
+                return 0.0
+
+        try:
+            files = [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".json")]
+        except OSError:
+            return
+        if len(files) <= self.max_disk_entries:
+            return
+        files.sort(key=mtime)
+        for entry in files[:len(files) - self.max_disk_entries]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass  # Already pruned by another process
+
+    def _remember(self, key: str, value: tuple[str, list[str]]):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+@st.cache_resource
+def _get_ocr_cache() -> OcrResultCache:
+    return OcrResultCache(OCR_CACHE_MAX_ENTRIES, OCR_CACHE_DIR, OCR_CACHE_DIR_MAX_ENTRIES)
+
+def _ocr_cache_key(file_bytes: bytes, is_pdf: bool) -> str:
+    digest = hashlib.sha256(file_bytes)
+    digest.update(f"|pdf={is_pdf}|{OCR_SETTINGS}".encode())
+    return digest.hexdigest()
+
+def extract_receipt_text(file_bytes: bytes, is_pdf: bool, username: str,
+                         on_page=None) -> tuple[str, list[str], bool]:
+    """Text of an uploaded receipt image or PDF, plus per-page methods (empty for images).
+
+    The third element is True when the result came from the cache; on_page is only called on a miss."""
+    cache = _get_ocr_cache()
+    key = _ocr_cache_key(file_bytes, is_pdf)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached[0], cached[1], True
+    start = time.perf_counter()
+    if is_pdf:
+        text, methods = extract_pdf_text(file_bytes, on_page=on_page)
+    else:
+        text, methods = ocr_image(file_bytes), []
+    cache.put(key, (text, methods), username)
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] [OCR] [{username}] "
+          f"Extracted {len(text)} chars in {time.perf_counter() - start:.2f}s (cached as {key[:12]})")
+    return text, methods, False
+
+# ========================
+# Speech-to-text backends
+# ========================
+WHISPER_SAMPLE_RATE = 16000
+
+def _resample(samples: np.ndarray, rate: int) -> np.ndarray:
+    """Resample mono float32 audio to Whisper's 16 kHz."""
+    if rate == WHISPER_SAMPLE_RATE or samples.size == 0:
+        return samples
+    if rate % WHISPER_SAMPLE_RATE == 0:
+        # Integer factor (32/48 kHz): averaging each block doubles as the anti-alias filter
+        factor = rate // WHISPER_SAMPLE_RATE
+        usable = samples.size - samples.size % factor
+        return samples[:usable].reshape(-1, factor).mean(axis=1).astype(np.float32)
+    duration = samples.size / rate
+    target_times = np.arange(int(duration * WHISPER_SAMPLE_RATE)) / WHISPER_SAMPLE_RATE
+    return np.interp(target_times, np.arange(samples.size) / rate, samples).astype(np.float32)
+
+def _decode_wav(data: bytes) -> np.ndarray:
+    """PCM WAV bytes (what st.audio_input records) to mono float32 at 16 kHz, without touching disk."""
+    with wave.open(io.BytesIO(data)) as wav:
+        channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+    if width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 2:
+        samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
+    elif width == 4:
+        samples = np.frombuffer(frames, dtype="<i4").astype(np.float32) / 2147483648.0
+    else:
+        raise wave.Error(f"unsupported sample width: {width} bytes")
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return _resample(samples, rate)
+
+def _decode_with_ffmpeg(data: bytes) -> np.ndarray:
+    """Any other container/codec, piped through ffmpeg's stdin/stdout (no temp files)."""
+    proc = subprocess.run(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+         "-f", "s16le", "-ac", "1", "-ar", str(WHISPER_SAMPLE_RATE), "pipe:1"],
+        input=data, capture_output=True, check=True,
+    )
+    return np.frombuffer(proc.stdout, dtype=np.int16).astype(np.float32) / 32768.0
+
+def decode_audio(data: bytes) -> np.ndarray:
+    """Recorded audio bytes to the mono float32 16 kHz array Whisper takes directly."""
+    try:
+        return _decode_wav(data)
+    except (wave.Error, EOFError):
+        try:
+            return _decode_with_ffmpeg(data)
+        except FileNotFoundError:
+            raise RuntimeError("Audio is not PCM WAV and ffmpeg is not installed to decode it") from None
+
+STT_BACKEND = (_get_secret("STT_BACKEND") or "auto").lower()
+STT_MODEL_SIZE = _get_secret("STT_MODEL_SIZE") or "base"
+STT_PRECISION = (_get_secret("STT_PRECISION") or "auto").lower()  # auto, int8, float16, float32
+STT_LANGUAGE = _get_secret("STT_LANGUAGE") or None  # "en" or "zh"; None lets the model detect it
+STT_THREADS = _get_int_secret("STT_THREADS", 0)  # 0 keeps the runtime's default
+
+class TranscriptionBackend(ABC):
+    """Turns mono float32 16 kHz audio into text; implementations wrap one runtime."""
+    name = ""
+
+    def __init__(self, model_size: str, precision: str, language: str | None, threads: int):
+        self.model_size = model_size
+        self.precision = precision
+        self.language = language
+        self.threads = threads
+
+    @abstractmethod
+    def transcribe(self, audio: np.ndarray) -> str:
+        ...
+
+    def describe(self) -> str:
+        return f"{self.name}:{self.model_size}:{self.precision}"
+
+class WhisperBackend(TranscriptionBackend):
+    """openai-whisper on torch; int8 applies dynamic quantization to the Linear layers (CPU only)."""
+    name = "whisper"
+
+    def __init__(self, model_size: str, precision: str, language: str | None, threads: int):
+        super().__init__(model_size, precision, language, threads)
+        torch = importlib.import_module("torch")
+        whisper = importlib.import_module("whisper")
+        device = get_device()
+        if threads:
+            torch.set_num_threads(threads)
+        model = whisper.load_model(model_size, device=device)
+        if precision == "auto":
+            self.precision = "float16" if device == "cuda" else "float32"
+        if self.precision == "int8":
+            if device != "cpu":
+                raise ValueError("STT_PRECISION=int8 with openai-whisper needs the CPU device")
+            # whisper subclasses nn.Linear only to cast weights to the input dtype, a no-op in
+            # fp32; plain nn.Linear lets quantize_dynamic recognise and swap those layers
+            for module in model.modules():
+                if isinstance(module, torch.nn.Linear):
+                    module.__class__ = torch.nn.Linear
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model
+
+    def transcribe(self, audio: np.ndarray) -> str:
+        result = self.model.transcribe(audio, language=self.language, fp16=self.precision == "float16")
+        return result["text"].strip()
+
+class FasterWhisperBackend(TranscriptionBackend):
+    """faster-whisper (CTranslate2), typically several times faster than torch on CPU with int8."""
+    name = "faster-whisper"
+
+    def __init__(self, model_size: str, precision: str, language: str | None, threads: int):
+        super().__init__(model_size, precision, language, threads)
+        faster_whisper = importlib.import_module("faster_whisper")
+        device = "cuda" if get_device() == "cuda" else "cpu"
+        if precision == "auto":
+            self.precision = "float16" if device == "cuda" else "int8"
+        self.model = faster_whisper.WhisperModel(model_size, device=device, compute_type=self.precision,
+                                                 cpu_threads=threads)
+
+    def transcribe(self, audio: np.ndarray) -> str:
+        segments, _ = self.model.transcribe(audio, language=self.language)
+        return "".join(segment.text for segment in segments).strip()
+
+STT_BACKENDS = {}
+if HAS_FASTER_WHISPER:
+    STT_BACKENDS["faster-whisper"] = FasterWhisperBackend
 if HAS_WHISPER:
-    @st.cache_resource
-    def load_whisper_model():
-        return whisper.load_model("base", device=DEVICE)
-    whisper_model = load_whisper_model()
+    STT_BACKENDS["whisper"] = WhisperBackend
+HAS_STT = bool(STT_BACKENDS)
+
+@st.cache_resource
+def load_stt_backend(backend: str, model_size: str, precision: str, language: str | None,
+                     threads: int) -> TranscriptionBackend:
+    """Load the configured backend; "auto" picks the first installed one (faster-whisper preferred)."""
+    backend_cls = STT_BACKENDS[next(iter(STT_BACKENDS))] if backend == "auto" else STT_BACKENDS.get(backend)
+    if backend_cls is None:
+        raise ValueError(f"STT_BACKEND={backend} is not installed; available: {', '.join(STT_BACKENDS)}")
+    start = time.perf_counter()
+    stt = backend_cls(model_size, precision, language, threads)
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] [STT] Loaded {stt.describe()} "
+          f"in {time.perf_counter() - start:.1f}s")
+    return stt
+
+def transcribe_audio(audio: np.ndarray) -> str:
+    """Transcribe with the configured backend (benchmarks/stt_benchmark.py compares the options)."""
+    stt = load_stt_backend(STT_BACKEND, STT_MODEL_SIZE, STT_PRECISION, STT_LANGUAGE, STT_THREADS)
+    return stt.transcribe(audio)
+
+@st.cache_resource
+def _start_model_prewarm() -> threading.Thread:
+    """Load the OCR and speech models on a background thread, once per process."""
+    def _prewarm():
+        loaders = []
+        if HAS_OCR:
+            loaders.append(("OCR", load_ocr_reader))
+        if HAS_STT:
+            loaders.append(("STT", lambda: load_stt_backend(STT_BACKEND, STT_MODEL_SIZE, STT_PRECISION,
+                                                           STT_LANGUAGE, STT_THREADS)))
+        for tag, loader in loaders:
+            try:
+                loader()
+            except Exception as e:
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] [{tag} ERROR] Prewarm failed: {e}")
+
+    thread = threading.Thread(target=_prewarm, name="model-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+# ========================
+# Background jobs (OCR and transcription run off the script thread)
+# ========================
+JOB_CONCURRENCY = {
+    "ocr": max(1, _get_int_secret("OCR_JOB_CONCURRENCY", 2)),
+    "transcribe": max(1, _get_int_secret("STT_JOB_CONCURRENCY", 1)),
+}
+JOB_POLL_SECONDS = max(1, _get_int_secret("JOB_POLL_SECONDS", 1))
+JOB_RETENTION_HOURS = _get_int_secret("JOB_RETENTION_HOURS", 24)
+JOB_ACTIVE_STATUSES = ("queued", "running")
+
+def _process_alive(pid: int) -> bool:
+    if pid == os.getpid() or os.name == "nt":
+        return True  # os.kill can't probe a process on Windows; assume it's alive
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class JobQueue:
+    """Runs uploaded files through a handler on a per-resource worker pool, tracking status in the jobs table.
+
+    Each kind gets its own pool sized to its concurrency limit, so a queue of receipts never holds up
+    a transcription. Payloads stay in memory; only status, progress and results are written to the DB."""
+
+    def __init__(self, concurrency: dict[str, int]):
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._pools = {kind: ThreadPoolExecutor(max_workers=limit, thread_name_prefix=f"job-{kind}")
+                       for kind, limit in concurrency.items()}
+        self._fail_orphaned_jobs()
+
+    def _fail_orphaned_jobs(self):
+        """Fail unfinished jobs whose payloads are gone, leaving other live instances' jobs alone.
+
+        The jobs table can be shared by several processes and hosts, so only owners on this host
+        whose process has exited are failed here. Anything unfinished and untouched for
+        JOB_RETENTION_HOURS (an instance that never came back) is failed too, then old rows are dropped."""
+        host = socket.gethostname()
+        with db_pool.transaction() as conn:
+            owners = [row[0] for row in conn.execute(
+                "SELECT DISTINCT owner FROM jobs WHERE status IN ('queued', 'running') AND owner IS NOT NULL")]
+            dead = [owner for owner in owners
+                    if owner.rpartition(":")[0] == host and not _process_alive(int(owner.rpartition(":")[2]))]
+            conn.executemany("UPDATE jobs SET status = 'failed', error = 'Interrupted by a restart', "
+                             "updated_at = CURRENT_TIMESTAMP WHERE owner = ? AND status IN ('queued', 'running')",
+                             [(owner,) for owner in dead])
+            conn.execute("UPDATE jobs SET status = 'failed', error = 'Abandoned', updated_at = CURRENT_TIMESTAMP "
+                         "WHERE status IN ('queued', 'running') AND updated_at < datetime('now', ?)",
+                         (f"-{JOB_RETENTION_HOURS} hours",))
+            conn.execute("DELETE FROM jobs WHERE status NOT IN ('queued', 'running') "
+                         "AND updated_at < datetime('now', ?)", (f"-{JOB_RETENTION_HOURS} hours",))
+
+    @staticmethod
+    def _update(job_id: str, **fields):
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with db_pool.transaction() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                         list(fields.values()) + [job_id])
+
+    def submit(self, username: str, kind: str, name: str, payload: bytes, handler) -> str:
+        """Queue payload for handler(payload, name, username, report_progress) and return the job id."""
+        job_id = uuid.uuid4().hex
+        with db_pool.transaction() as conn:
+            conn.execute("INSERT INTO jobs (id, username, kind, name, owner) VALUES (?, ?, ?, ?, ?)",
+                         (job_id, username, kind, name, self.owner))
+        self._pools[kind].submit(self._run, job_id, username, kind, name, payload, handler)
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] [JOB] [{username}] Queued {kind} job {job_id[:8]} ({name})")
+        return job_id
+
+    def _run(self, job_id: str, username: str, kind: str, name: str, payload: bytes, handler):
+        start = time.perf_counter()
+        self._update(job_id, status="running")
+        last_reported = [0.0]
+
+        def report_progress(fraction: float):
+            # Throttle DB writes; pollers only need coarse progress
+            if fraction >= 1.0 or fraction - last_reported[0] >= 0.1:
+                last_reported[0] = fraction
+                self._update(job_id, progress=round(fraction, 3))
+
+        try:
+            result = handler(payload, name, username, report_progress)
+        except Exception as e:
+            self._update(job_id, status="failed", error=str(e))
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] [JOB ERROR] {kind} job {job_id[:8]}: {e}")
+            return
+        self._update(job_id, status="done", progress=1.0, result=json.dumps(result, ensure_ascii=False))
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] [JOB] {kind} job {job_id[:8]} "
+              f"done in {time.perf_counter() - start:.2f}s")
+
+@st.cache_resource
+def _get_job_queue() -> JobQueue:
+    return JobQueue(JOB_CONCURRENCY)
+
+def submit_job(username: str, kind: str, name: str, payload: bytes) -> str:
+    return _get_job_queue().submit(username, kind, name, payload, JOB_HANDLERS[kind])
+
+def get_jobs(username: str, job_ids: list[str]) -> list[dict]:
+    """Status rows for the given jobs, in the order requested; results are decoded from JSON."""
+    if not job_ids:
+        return []
+    placeholders = ','.join('?' * len(job_ids))
+    with db_pool.connection() as conn:
+        rows = conn.execute(f"SELECT id, kind, name, status, progress, result, error FROM jobs "
+                            f"WHERE id IN ({placeholders}) AND username = ?", job_ids + [username]).fetchall()
+    jobs = {row[0]: {"id": row[0], "kind": row[1], "name": row[2], "status": row[3], "progress": row[4],
+                     "result": json.loads(row[5]) if row[5] else None, "error": row[6]} for row in rows}
+    return [jobs[job_id] for job_id in job_ids if job_id in jobs]
+
+def _ocr_job(payload: bytes, name: str, username: str, report_progress) -> dict:
+    is_pdf = HAS_PDF and name.lower().endswith('.pdf')
+    text, methods, from_cache = extract_receipt_text(
+        payload, is_pdf, username, on_page=lambda page_num, page_text, method, done, total: report_progress(done / total))
+    return {"text": text, "methods": methods, "cached": from_cache}
+
+def _transcribe_job(payload: bytes, name: str, username: str, report_progress) -> dict:
+    # Decoded in memory, so concurrent transcriptions never share a file
+    return {"text": transcribe_audio(decode_audio(payload))}
+
+JOB_HANDLERS = {"ocr": _ocr_job, "transcribe": _transcribe_job}
 
 # ========================
 # FX Rates
@@ -512,10 +1486,92 @@ FALLBACK_FX_RATES = {
 }
 SUPPORTED_CURRENCIES = ["HKD", "TWD", "USD", "CNY", "JPY", "EUR", "GBP", "SGD", "KRW", "MYR"]
 
-@st.cache_data(ttl=86400)
-def fetch_fx_rates() -> dict:
+class FxRateStore:
+    """Historical rates (units of currency per 1 HKD), kept per currency as date-sorted arrays.
+
+    A lookup uses the latest rate on or before the requested date, or the earliest one for dates
+    before the history starts. Arrays are swapped whole, so readers never need the lock."""
+
+    def __init__(self, rows):
+        self._lock = threading.Lock()
+        self._by_currency: dict[str, dict[str, float]] = {}
+        self._index: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        self.add(rows)
+
+    def add(self, rows):
+        with self._lock:
+            touched = set()
+            for date, currency, rate in rows:
+                self._by_currency.setdefault(currency, {})[date] = float(rate)
+                touched.add(currency)
+            for currency in touched:
+                dates = sorted(self._by_currency[currency])
+                self._index[currency] = (np.array(dates), np.array([self._by_currency[currency][d] for d in dates]))
+
+    def __len__(self) -> int:
+        return sum(len(dates) for dates, _ in self._index.values())
+
+    def rate_on(self, currency: str, date: str) -> float | None:
+        entry = self._index.get(currency)
+        if entry is None:
+            return None
+        dates, rates = entry
+        return float(rates[max(np.searchsorted(dates, date, side='right') - 1, 0)])
+
+    def rates_on(self, currencies: pd.Series, dates: pd.Series) -> pd.Series:
+        """Vectorized rate_on: one searchsorted per currency present, NaN where a currency has no history."""
+        result = pd.Series(np.nan, index=currencies.index)
+        for currency, positions in currencies.groupby(currencies).groups.items():
+            entry = self._index.get(currency)
+            if entry is None:
+                continue
+            known_dates, rates = entry
+            wanted = dates.loc[positions].to_numpy(dtype=str)
+            result.loc[positions] = rates[np.maximum(np.searchsorted(known_dates, wanted, side='right') - 1, 0)]
+        return result
+
+@st.cache_resource
+def get_fx_store() -> FxRateStore:
+    with db_pool.connection() as conn:
+        rows = conn.execute("SELECT date, currency, rate FROM fx_rates").fetchall()
+    return FxRateStore(rows)
+
+def save_fx_rates(rows: list[tuple[str, str, float]], source: str) -> int:
+    """Upsert (date, currency, rate) rows in one transaction and add them to the in-memory index."""
+    if not rows:
+        return 0
+    with db_pool.transaction() as conn:
+        conn.executemany("""
+            INSERT INTO fx_rates (date, currency, rate, source) VALUES (?, ?, ?, ?)
+            ON CONFLICT (date, currency) DO UPDATE SET rate = excluded.rate, source = excluded.source
+        """, [(*row, source) for row in rows])
+    get_fx_store().add(rows)
+    return len(rows)
+
+def import_fx_rates_csv(data: bytes) -> tuple[int, int]:
+    """Backfill history from a CSV with date, currency and rate columns (rate per 1 HKD).
+
+    Returns (imported, skipped); rows with an unparseable date or a non-positive rate are skipped."""
+    df = pd.read_csv(io.BytesIO(data))
+    df.columns = [str(col).strip().lower() for col in df.columns]
+    if not {"date", "currency", "rate"} <= set(df.columns):
+        raise ValueError("CSV needs date, currency and rate columns")
+    # Parsed per row: inferring one format from the first row would drop rows written differently
+    dates = pd.to_datetime(df["date"], errors='coerce', format='mixed').dt.strftime('%Y-%m-%d')
+    currencies = df["currency"].astype(str).str.strip().str.upper()
+    rates = pd.to_numeric(df["rate"], errors='coerce')
+    valid = dates.notna() & currencies.str.fullmatch(r"[A-Z]{3}") & (rates > 0)
+    rows = list(zip(dates[valid], currencies[valid], rates[valid].astype(float)))
+    return save_fx_rates(rows, "csv"), int((~valid).sum())
+
+FX_LIVE_SOURCE = "open.er-api.com"
+# Minimum gap between background fetch attempts, so an offline instance doesn't retry on every rerun
+FX_RETRY_SECONDS = _get_int_secret("FX_RETRY_SECONDS", 300)
+
+def fetch_fx_rates() -> dict | None:
+    """Today's rates from the live API, or None when it can't be reached."""
     try:
-        resp = requests.get("https://open.er-api.com/v6/latest/HKD", timeout=10)
+        resp = requests.get(f"https://{FX_LIVE_SOURCE}/v6/latest/HKD", timeout=10)
         resp.raise_for_status()
         data = resp.json()
         if data.get("result") == "success":
@@ -523,44 +1579,173 @@ def fetch_fx_rates() -> dict:
                     for cur in SUPPORTED_CURRENCIES}
             live["HKD"] = 1.0
             return live
-    except Exception:
-        pass
-    return FALLBACK_FX_RATES.copy()
-
-_live_rates = fetch_fx_rates()
+    except Exception as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] [FX ERROR] live rates unavailable: {e}")
+    return None
 
-if "fx_rates" not in st.session_state:
-    st.session_state.fx_rates = _live_rates.copy()
-if "fx_source" not in st.session_state:
-    st.session_state.fx_source = "live" if _live_rates != FALLBACK_FX_RATES else "fallback"
+class FxRefresher:
+    """Stale-while-revalidate access to the latest live rates, shared through the fx_rates table.
+
+    current() never touches the network: it serves whatever is stored (or the fallback table) and,
+    when that isn't from today, starts a background refresh. The refresh first re-reads the table,
+    since another app instance may already have fetched today's rates, and only then calls the API."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._last_attempt = float('-inf')
+        self._rates, self.as_of = self._load_latest()
+
+    @staticmethod
+    def _load_latest() -> tuple[dict | None, str | None]:
+        with db_pool.connection() as conn:
+            as_of = conn.execute("SELECT MAX(date) FROM fx_rates WHERE source = ?", (FX_LIVE_SOURCE,)).fetchone()[0]
+            if as_of is None:
+                return None, None
+            rows = conn.execute("SELECT currency, rate FROM fx_rates WHERE source = ? AND date = ?",
+                                (FX_LIVE_SOURCE, as_of)).fetchall()
+        rates = FALLBACK_FX_RATES.copy()
+        rates.update({currency: rate for currency, rate in rows if currency in rates})
+        rates["HKD"] = 1.0
+        return rates, as_of
+
+    @property
+    def refreshing(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def current(self) -> tuple[dict, str]:
+        """(rates, "live" | "stale" | "fallback") as of now, scheduling a refresh if they're not today's."""
+        today = datetime.now().strftime('%Y-%m-%d')
+        if self.as_of != today and time.monotonic() - self._last_attempt >= FX_RETRY_SECONDS:
+            self.refresh()
+        if self._rates is None:
+            return FALLBACK_FX_RATES.copy(), "fallback"
+        return self._rates.copy(), "live" if self.as_of == today else "stale"
+
+    def refresh(self, force: bool = False) -> bool:
+        """Start a background refresh unless one is already running; force skips the shared-table check."""
+        with self._lock:
+            if self.refreshing:
+                return False
+            self._last_attempt = time.monotonic()
+            self._thread = threading.Thread(target=self._refresh, args=(force,), daemon=True, name="fx-refresh")
+            self._thread.start()
+        return True
 
-def convert_to_hkd(amount: float, currency: str) -> float:
-    rate = st.session_state.fx_rates.get(currency.upper(), None)
+    def _refresh(self, force: bool):
+        today = datetime.now().strftime('%Y-%m-%d')
+        if not force:
+            rates, as_of = self._load_latest()
+            if as_of == today:
+                get_fx_store().add([(as_of, cur, rate) for cur, rate in rates.items() if cur != "HKD"])
+                self._rates, self.as_of = rates, as_of
+                return
+        live = fetch_fx_rates()
+        if live is None:
+            return
+        save_fx_rates([(today, cur, rate) for cur, rate in live.items() if cur != "HKD"], FX_LIVE_SOURCE)
+        self._rates, self.as_of = live, today
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] [FX] live rates refreshed for {today}")
+
+@st.cache_resource
+def get_fx_refresher() -> FxRefresher:
+    return FxRefresher()
+
+def _apply_fx_rates(rates: dict, source: str, as_of: str | None):
+    """Adopt a new set of rates for this session, replacing any sidebar overrides."""
+    st.session_state.fx_rates = rates
+    st.session_state.fx_source = source
+    st.session_state.fx_as_of = as_of
+    for cur, rate in rates.items():
+        st.session_state[f"fx_{cur}"] = rate
+
+fx_refresher = get_fx_refresher()
+_latest_rates, _latest_source = fx_refresher.current()
+_fx_refresh_landed = st.session_state.get("fx_refresh_requested") and not fx_refresher.refreshing
+if ("fx_rates" not in st.session_state or _fx_refresh_landed
+        or (st.session_state.fx_source != "live" and _latest_source == "live")):
+    # First run, a refresh this session asked for, or newer rates than the offline/stale ones it has
+    st.session_state.pop("fx_refresh_requested", None)
+    _apply_fx_rates(_latest_rates, _latest_source, fx_refresher.as_of)
+
+def convert_to_hkd(amount: float, currency: str, date: str | None = None) -> float:
+    """Convert at the rate for the expense's date; today and later use the sidebar rates."""
+    rate = None
+    day = str(date or '').strip()[:10]
+    if day and day < datetime.now().strftime('%Y-%m-%d'):
+        rate = get_fx_store().rate_on(currency.upper(), day)
+    if rate is None:
+        rate = st.session_state.fx_rates.get(currency.upper(), None)
     if rate is None or rate == 0:
         return amount
     return round(amount / rate, 2)
 
+def convert_series_to_hkd(amounts: pd.Series, currencies: pd.Series, dates: pd.Series | None = None) -> pd.Series:
+    """Vectorized convert_to_hkd over aligned amount/currency(/date) columns."""
+    codes = currencies.astype(str).str.upper()
+    rates = codes.map(st.session_state.fx_rates)
+    if dates is not None:
+        days = dates.fillna('').astype(str).str.strip().str[:10]
+        # Undated rows use the sidebar rates, as convert_to_hkd does
+        past = (days != '') & (days < datetime.now().strftime('%Y-%m-%d'))
+        if past.any():
+            historical = get_fx_store().rates_on(codes[past], days[past])
+            rates = rates.where(~past, historical.reindex(rates.index)).fillna(rates)
+    valid = rates.notna() & (rates != 0)
+    return (amounts / rates.where(valid, 1.0)).round(2).where(valid, amounts)
+
+def recompute_amounts_hkd(username: str) -> int:
+    """Re-derive amount_hkd for all of a user's expenses in one vectorized pass; returns rows changed."""
+    with db_pool.connection() as conn:
+        df = pd.read_sql_query("SELECT id, date, currency, amount, amount_hkd FROM expenses WHERE username = ?",
+                               conn, params=(username,))
+    if df.empty:
+        return 0
+    amounts = pd.to_numeric(df['amount'], errors='coerce').fillna(0.0)
+    fresh = convert_series_to_hkd(amounts, df['currency'].fillna('HKD'), df['date'].fillna(''))
+    changed = df['amount_hkd'].isna() | ((fresh - df['amount_hkd']).abs() >= 0.005)
+    params = list(zip(fresh[changed].tolist(), df['id'][changed].astype(int).tolist(),
+                      [username] * int(changed.sum())))
+    if params:
+        with db_pool.transaction() as conn:
+            conn.executemany("UPDATE expenses SET amount_hkd = ? WHERE id = ? AND username = ?", params)
+    return len(params)
+
 # Sidebar: FX rates
 with st.sidebar:
     st.header(f"💱 {t('sidebar_fx_header')}")
-    if st.session_state.fx_source == "live":
-        st.caption(t("sidebar_fx_live"))
-    else:
-        st.caption(t("sidebar_fx_fallback"))
 
     if st.button(f"🔄 {t('sidebar_fx_refresh')}"):
-        st.cache_data.clear()
-        fresh = fetch_fx_rates()
-        st.session_state.fx_rates = fresh.copy()
-        st.session_state.fx_source = "live" if fresh != FALLBACK_FX_RATES else "fallback"
-        st.rerun()
+        fx_refresher.refresh(force=True)
+        st.session_state.fx_refresh_requested = True
+
+    fx_polling = fx_refresher.refreshing
+
+    @st.fragment(run_every=JOB_POLL_SECONDS if fx_polling else None)
+    def _fx_status():
+        if st.session_state.fx_source == "live":
+            st.caption(t("sidebar_fx_live"))
+        elif st.session_state.fx_source == "stale":
+            st.caption(t("sidebar_fx_stale", date=st.session_state.fx_as_of))
+        else:
+            st.caption(t("sidebar_fx_fallback"))
+        if fx_refresher.refreshing:
+            st.caption(f"⏳ {t('sidebar_fx_refreshing')}")
+        elif fx_polling:
+            # The refresh finished: rerun the whole page so it can pick up the new rates
+            st.rerun()
+
+    _fx_status()
 
     for cur in SUPPORTED_CURRENCIES:
         if cur == "HKD":
             continue
+        # Seeded through session state, so no value= here. Streamlit drops widget keys on runs
+        # that don't render them (the login page), so restore any missing one from fx_rates.
+        if f"fx_{cur}" not in st.session_state:
+            st.session_state[f"fx_{cur}"] = st.session_state.fx_rates[cur]
         new_rate = st.number_input(
             f"1 HKD = ? {cur}",
-            value=st.session_state.fx_rates[cur],
             min_value=0.0001,
             step=0.01,
             format="%.4f",
@@ -568,6 +1753,18 @@ with st.sidebar:
         )
         st.session_state.fx_rates[cur] = new_rate
 
+    with st.expander(f"📜 {t('fx_history_header')}"):
+        st.caption(t("fx_history_count", count=len(get_fx_store())))
+        fx_csv = st.file_uploader(t("fx_import_label"), type=["csv"], key="fx_import_csv")
+        if fx_csv is not None and st.button(t("fx_import_btn")):
+            try:
+                imported, skipped = import_fx_rates_csv(fx_csv.getvalue())
+                st.success(t("fx_import_done", count=imported, skipped=skipped))
+            except (ValueError, pd.errors.ParserError) as e:
+                st.error(t("fx_import_failed", error=str(e)))
+        if st.button(t("fx_recompute_btn")):
+            st.success(t("fx_recompute_done", count=recompute_amounts_hkd(CURRENT_USER)))
+
 # ========================
 # Expense model
 # ========================
@@ -613,141 +1810,654 @@ CURRENCY_PATTERNS = {
     "MYR": [r'\bMYR\b', r'\bRM\b'],
 }
 
+class KeywordAutomaton:
+    """Aho–Corasick multi-pattern matcher: reports every keyword occurrence in one pass over the text."""
+
+    def __init__(self, patterns: dict[str, object]):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[list] = [[]]
+        for pattern, payload in patterns.items():
+            state = 0
+            for ch in pattern:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[state][ch] = nxt
+                state = nxt
+            if state:
+                self._out[state].append(payload)
+
+        # Breadth-first so every failure target is finished before the states that point to it
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def iter_matches(self, text: str):
+        """Yield the payload of every keyword found in text (overlaps included)."""
+        state = 0
+        for ch in text:
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            yield from self._out[state]
+
+_CATEGORY_ORDER = list(CATEGORY_KEYWORDS)
+
+@st.cache_resource
+def _get_category_automaton() -> KeywordAutomaton:
+    """Built once per process; the payload is the category's rank in CATEGORY_KEYWORDS."""
+    patterns: dict[str, int] = {}
+    for rank, keywords in enumerate(CATEGORY_KEYWORDS.values()):
+        for kw in keywords:
+            patterns.setdefault(kw.lower(), rank)
+    return KeywordAutomaton(patterns)
+
+def get_user_keywords(username: str) -> list[tuple[int, str, str]]:
+    """The user's (id, keyword, category) overrides, oldest first."""
+    with db_pool.connection() as conn:
+        return conn.execute("SELECT id, keyword, category FROM category_keywords WHERE username = ? ORDER BY id",
+                            (username,)).fetchall()
+
+def add_user_keyword(username: str, keyword: str, category: str):
+    with db_pool.transaction() as conn:
+        conn.execute("""
+            INSERT INTO category_keywords (username, keyword, category) VALUES (?, ?, ?)
+            ON CONFLICT (username, keyword) DO UPDATE SET category = excluded.category
+        """, (username, keyword.strip().lower(), category))
+    _get_user_keyword_automaton.clear()
+
+def delete_user_keyword(username: str, keyword_id: int):
+    with db_pool.transaction() as conn:
+        conn.execute("DELETE FROM category_keywords WHERE id = ? AND username = ?", (keyword_id, username))
+    _get_user_keyword_automaton.clear()
+
+@st.cache_resource(max_entries=256)
+def _get_user_keyword_automaton(username: str) -> KeywordAutomaton | None:
+    """Per-user override matcher; payloads sort so the longest (then oldest) keyword wins."""
+    rows = get_user_keywords(username)
+    if not rows:
+        return None
+    return KeywordAutomaton({kw: (-len(kw), kw_id, category) for kw_id, kw, category in rows})
+
+def _user_keyword_category(text: str) -> str | None:
+    """Category of the user's own keyword rule that matches the text, if any."""
+    user_automaton = _get_user_keyword_automaton(CURRENT_USER)
+    if user_automaton is None:
+        return None
+    best_override = min(user_automaton.iter_matches(text.lower()), default=None)
+    return best_override[2] if best_override is not None else None
+
+def _builtin_keyword_category(text: str) -> str:
+    best_rank = None
+    for rank in _get_category_automaton().iter_matches(text.lower()):
+        if best_rank is None or rank < best_rank:
+            best_rank = rank
+            if rank == 0:
+                break
+    return _CATEGORY_ORDER[best_rank] if best_rank is not None else "Other"
+
 def guess_category(text: str) -> str:
-    text_lower = text.lower()
-    for category, keywords in CATEGORY_KEYWORDS.items():
-        if any(kw in text_lower for kw in keywords):
-            return category
-    return "Other"
+    return _user_keyword_category(text) or _builtin_keyword_category(text)
+
+_MERCHANT_PUNCT_RE = re.compile(r'[^\w\s]')
+
+def _normalize_merchant(name) -> str:
+    """Case-fold and strip punctuation so "McDonald's" and "mcdonalds " share one entry."""
+    return ' '.join(_MERCHANT_PUNCT_RE.sub('', str(name or '').casefold()).split())
+
+class MerchantIndex:
+    """What a user usually records for each merchant: category, currency and typical amount.
+
+    Built once from the user's history, then kept current by the insert/update/delete paths."""
+
+    MIN_TEXT_MATCH_LENGTH = 3
+
+    def __init__(self, rows):
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict] = {}
+        self._automaton: KeywordAutomaton | None = None
+        for merchant, category, currency, amount in rows:
+            self._apply(merchant, category, currency, amount, 1)
+
+    def _apply(self, merchant, category, currency, amount, delta: int):
+        key = _normalize_merchant(merchant)
+        if not key:
+            return
+        entry = self._entries.get(key)
+        if entry is None:
+            if delta < 0:
+                return
+            entry = self._entries[key] = {"name": str(merchant).strip(), "count": 0, "categories": Counter(),
+                                          "currencies": Counter(), "amounts": Counter()}
+            self._automaton = None
+        elif delta > 0:
+            entry["name"] = str(merchant).strip()
+        entry["count"] += delta
+        for counter, value in ((entry["categories"], category), (entry["currencies"], currency),
+                               (entry["amounts"], amount)):
+            if value is None:
+                continue
+            counter[value] += delta
+            if counter[value] <= 0:
+                del counter[value]
+        if entry["count"] <= 0:
+            del self._entries[key]
+            self._automaton = None
+
+    def add(self, merchant, category, currency, amount):
+        with self._lock:
+            self._apply(merchant, category, currency, amount, 1)
+
+    def remove(self, merchant, category, currency, amount):
+        with self._lock:
+            self._apply(merchant, category, currency, amount, -1)
+
+    def lookup(self, merchant) -> dict | None:
+        """Most frequent category/currency and median amount for this merchant, if seen before."""
+        with self._lock:
+            entry = self._entries.get(_normalize_merchant(merchant))
+            if entry is None:
+                return None
+            amounts = sorted(entry["amounts"].elements())
+            return {
+                "merchant": entry["name"],
+                "category": entry["categories"].most_common(1)[0][0] if entry["categories"] else None,
+                "currency": entry["currencies"].most_common(1)[0][0] if entry["currencies"] else None,
+                "amount": amounts[len(amounts) // 2] if amounts else None,
+            }
+
+    def find_in_text(self, text: str) -> str | None:
+        """Name of the longest known merchant mentioned in free text."""
+        with self._lock:
+            if self._automaton is None:
+                # Latin names must match whole words; CJK text has no spaces to anchor on
+                self._automaton = KeywordAutomaton({
+                    (f" {key} " if key.isascii() else key): key
+                    for key in self._entries if len(key) >= self.MIN_TEXT_MATCH_LENGTH
+                })
+            automaton = self._automaton
+            matches = list(automaton.iter_matches(f" {_normalize_merchant(text)} "))
+            if not matches:
+                return None
+            entry = self._entries.get(max(matches, key=len))
+            return entry["name"] if entry else None
+
+@st.cache_resource(max_entries=64)
+def get_merchant_index(username: str) -> MerchantIndex:
+    with db_pool.connection() as conn:
+        rows = conn.execute("SELECT merchant, category, currency, amount FROM expenses WHERE username = ?",
+                            (username,)).fetchall()
+    return MerchantIndex(rows)
+
+def _resolve_category_currency(merchant: str | None, text: str) -> tuple[str, str]:
+    """Category and currency for a parsed expense.
+
+    The user's own keyword rules decide the category first, then what they chose at this merchant
+    before, then the built-in keywords."""
+    history = get_merchant_index(CURRENT_USER).lookup(merchant) if merchant else None
+    category = _user_keyword_category(text) or (history and history["category"]) or _builtin_keyword_category(text)
+    currency = _detect_explicit_currency(text) or (history and history["currency"]) or "HKD"
+    return category, currency
+
+# Precompiled once at import; the parsers below never build patterns inline
+_CURRENCY_PREFIX = r'(?:NT\$?|HK\$?|US\$?|SG\$?|RM|€|£|\$)'
+_CURRENCY_SUFFIX = r'(?:TWD|HKD|USD|CNY|JPY|EUR|GBP|SGD|KRW|MYR|元|dollars?|塊|円|원)'
+_CURRENCY_CODES = r'(?:TWD|HKD|USD|CNY|JPY|EUR|GBP|SGD|KRW|MYR)'
+_NUMBER = r'\d+(?:\.\d+)?'
+
+# Every currency pattern as one named-group alternation inside a lookahead, so a single scan
+# reports each position's match without consuming text (元 inside 港元 still counts as TWD)
+_CURRENCY_RE = re.compile(
+    '(?=' + '|'.join(f"(?P<{currency}>{'|'.join(patterns)})"
+                     for currency, patterns in CURRENCY_PATTERNS.items()) + ')',
+    re.IGNORECASE,
+)
+_CURRENCY_PRIORITY = {currency: rank for rank, currency in enumerate(CURRENCY_PATTERNS)}
+
+# Tokeniser for try_local_parse: dates and every kind of amount in one pass
+_PARSE_TOKEN_RE = re.compile(
+    r'(?P<date>\d{4}-\d{2}-\d{2})'
+    rf'|(?:spent|paid|花了|付了|消費)\s*(?:NT\$?|HK\$?|US\$?|\$)?\s*(?P<spent>{_NUMBER})'
+    rf'|{_CURRENCY_PREFIX}\s*(?P<prefixed>{_NUMBER})'
+    rf'|(?P<suffixed>{_NUMBER})\s*{_CURRENCY_SUFFIX}'
+    rf'|\b(?P<number>{_NUMBER})\b',
+    re.IGNORECASE,
+)
+_RECEIPT_TOTAL_RE = re.compile(
+    r'(?:TOTAL|Grand\s*Total|Amount\s*Due|合計|總計|小計|應付|總額)\s*[:\s]*(?:NT\$?|HK\$?|US\$?|\$)?\s*(\d[\d,]*\.?\d*)',
+    re.IGNORECASE,
+)
+_NUMERIC_LINE_RE = re.compile(r'^[\d\s/:.\-]+$')
+_MERCHANT_AT_RE = re.compile(r'(?:at|from|在)\s+(.+?)(?:\s+(?:for|spent|paid|花|付|\d))', re.IGNORECASE)
+_MARKED_AMOUNT_RE = re.compile(rf'{_CURRENCY_PREFIX}\s*{_NUMBER}|{_NUMBER}\s*{_CURRENCY_SUFFIX}', re.IGNORECASE)
+_ANY_AMOUNT_RE = re.compile(rf'{_CURRENCY_PREFIX}?\s*{_NUMBER}\s*{_CURRENCY_SUFFIX}?', re.IGNORECASE)
+_ISO_DATE_RE = re.compile(r'\d{4}-\d{2}-\d{2}')
+_BARE_NUMBER_RE = re.compile(rf'\b{_NUMBER}\b')
+_ITEM_FILLER_RE = re.compile(
+    r'\b(?:spent|paid|bought|at|from|for|on|today|yesterday|I|在|花了|付了|消費|買了)\b', re.IGNORECASE)
+_MERCHANT_FILLER_RE = re.compile(r'\b(?:on|at|for|spent|paid|bought|today|yesterday|I|from)\b', re.IGNORECASE)
+_MERCHANT_FILLER_ZH_RE = re.compile(r'(?:花了|付了|消費|買了|在)')
+_CURRENCY_CODE_RE = re.compile(rf'\b{_CURRENCY_CODES}\b', re.IGNORECASE)
+
+def _detect_explicit_currency(text: str) -> str | None:
+    """The highest-priority currency marked in the text, or None if there is no marker."""
+    best = None
+    for match in _CURRENCY_RE.finditer(text):
+        currency = match.lastgroup
+        if best is None or _CURRENCY_PRIORITY[currency] < _CURRENCY_PRIORITY[best]:
+            best = currency
+            if _CURRENCY_PRIORITY[best] == 0:
+                break
+    return best
 
 def detect_currency(text: str) -> str:
-    for currency, patterns in CURRENCY_PATTERNS.items():
-        for pattern in patterns:
-            if re.search(pattern, text, re.IGNORECASE):
-                return currency
-    return "HKD"
+    return _detect_explicit_currency(text) or "HKD"
 
 def _extract_receipt_total(text: str) -> float | None:
-    patterns = [
-        r'(?:TOTAL|Grand\s*Total|Amount\s*Due|合計|總計|小計|應付|總額)\s*[:\s]*(?:NT\$?|HK\$?|US\$?|\$)?\s*(\d[\d,]*\.?\d*)',
-    ]
-    for pat in patterns:
-        match = re.search(pat, text, re.IGNORECASE)
-        if match:
-            return float(match.group(1).replace(',', ''))
+    match = _RECEIPT_TOTAL_RE.search(text)
+    if match:
+        return float(match.group(1).replace(',', ''))
     return None
 
 def _extract_receipt_merchant(text: str) -> str | None:
     lines = [l.strip() for l in text.split('\n') if l.strip()]
     if lines:
         first = lines[0]
-        if not re.match(r'^[\d\s/:.\-]+$', first) and len(first) <= 40:
+        if not _NUMERIC_LINE_RE.match(first) and len(first) <= 40:
             return first
     return None
 
+def _scan_amount_and_date(text: str) -> tuple[float | None, str | None]:
+    """Find the amount and first ISO date in a single tokenisation pass.
+
+    Amount priority: "spent/paid N" > first currency-marked amount > largest plausible bare number.
+    Digits inside a date are never taken as a bare amount."""
+    spent = marked = date = None
+    bare_amounts = []
+    for match in _PARSE_TOKEN_RE.finditer(text):
+        kind = match.lastgroup
+        if kind == 'date':
+            date = date or match.group('date')
+        elif kind == 'spent':
+            if spent is None:
+                spent = float(match.group('spent'))
+        elif kind in ('prefixed', 'suffixed'):
+            if marked is None:
+                marked = float(match.group(kind))
+        else:
+            number = match.group('number')
+            if len(number) <= 6 and 1 <= float(number) <= 100000:
+                bare_amounts.append(float(number))
+
+    if spent is not None:
+        return spent, date
+    if marked is not None:
+        return marked, date
+    return (max(bare_amounts) if bare_amounts else None), date
+
 def try_local_parse(text: str) -> Expense | None:
     today = datetime.now().strftime('%Y-%m-%d')
-    currency = detect_currency(text)
     is_multiline = '\n' in text
+    merchant_index = get_merchant_index(CURRENT_USER)
 
-    amount = None
+    amount, date = _scan_amount_and_date(text)
     if is_multiline:
-        amount = _extract_receipt_total(text)
+        receipt_total = _extract_receipt_total(text)
+        if receipt_total is not None:
+            amount = receipt_total
 
-    if amount is None:
-        nl_match = re.search(r'(?:spent|paid|花了|付了|消費)\s*(?:NT\$?|HK\$?|US\$?|\$)?\s*(\d+(?:\.\d+)?)', text, re.IGNORECASE)
-        if nl_match:
-            amount = float(nl_match.group(1))
-
-    if amount is None:
-        amount_match = re.search(
-            r'(?:NT\$?|HK\$?|US\$?|SG\$?|RM|€|£|\$)\s*(\d+(?:\.\d+)?)'
-            r'|(\d+(?:\.\d+)?)\s*(?:TWD|HKD|USD|CNY|JPY|EUR|GBP|SGD|KRW|MYR|元|dollars?|塊|円|원)',
-            text, re.IGNORECASE
-        )
-        if amount_match:
-            amount = float(amount_match.group(1) or amount_match.group(2))
-
-    if amount is None:
-        numbers = re.findall(r'\b(\d+(?:\.\d+)?)\b', text)
-        amounts = [float(n) for n in numbers if 1 <= float(n) <= 100000 and len(n) <= 6]
-        if len(amounts) == 1:
-            amount = amounts[0]
-        elif len(amounts) > 1:
-            amount = max(amounts)
+    # A merchant the user has bought from before can stand in for a missing amount
+    known_merchant = None if is_multiline else merchant_index.find_in_text(text)
+    if amount is None and known_merchant:
+        amount = merchant_index.lookup(known_merchant)["amount"]
 
     if amount is None:
         return None
 
-    date_match = re.search(r'(\d{4}-\d{2}-\d{2})', text)
-    date = date_match.group(1) if date_match else today
+    date = date or today
 
     if is_multiline:
         merchant = _extract_receipt_merchant(text) or "Unknown"
         items = merchant
-        category = guess_category(text)
+        category, currency = _resolve_category_currency(merchant, text)
         return Expense(date=date, merchant=merchant, category=category, currency=currency, amount=amount, items=items)
 
-    at_match = re.search(r'(?:at|from|在)\s+(.+?)(?:\s+(?:for|spent|paid|花|付|\d))', text, re.IGNORECASE)
+    at_match = _MERCHANT_AT_RE.search(text)
     if at_match:
         merchant = at_match.group(1).strip()
-        category = guess_category(text)
+        category, currency = _resolve_category_currency(merchant, text)
         items_text = re.sub(re.escape(merchant), '', text, flags=re.IGNORECASE).strip()
-        items_text = re.sub(r'(?:NT\$?|HK\$?|US\$?|SG\$?|RM|€|£|\$)?\s*\d+(?:\.\d+)?\s*(?:TWD|HKD|USD|CNY|JPY|EUR|GBP|SGD|KRW|MYR|元|dollars?|塊|円|원)?', '', items_text, flags=re.IGNORECASE)
-        items_text = re.sub(r'\b(?:spent|paid|bought|at|from|for|on|today|yesterday|I|在|花了|付了|消費|買了)\b', '', items_text, flags=re.IGNORECASE).strip().strip('—-,. ')
+        items_text = _ANY_AMOUNT_RE.sub('', items_text)
+        items_text = _ITEM_FILLER_RE.sub('', items_text).strip().strip('—-,. ')
         items = items_text if items_text else merchant
         return Expense(date=date, merchant=merchant, category=category, currency=currency, amount=amount, items=items)
 
-    remaining = text
-    remaining = re.sub(
-        r'(?:NT\$?|HK\$?|US\$?|SG\$?|RM|€|£|\$)\s*\d+(?:\.\d+)?'
-        r'|\d+(?:\.\d+)?\s*(?:TWD|HKD|USD|CNY|JPY|EUR|GBP|SGD|KRW|MYR|元|dollars?|塊|円|원)',
-        '', remaining, flags=re.IGNORECASE
-    )
-    remaining = re.sub(r'\d{4}-\d{2}-\d{2}', '', remaining)
-    remaining = re.sub(r'\b(?:on|at|for|spent|paid|bought|today|yesterday|I|from)\b', '', remaining, flags=re.IGNORECASE)
-    remaining = re.sub(r'(?:花了|付了|消費|買了|在)', '', remaining)
-    remaining = re.sub(r'\b(?:TWD|HKD|USD|CNY|JPY|EUR|GBP|SGD|KRW|MYR)\b', '', remaining, flags=re.IGNORECASE)
+    remaining = _MARKED_AMOUNT_RE.sub('', text)
+    remaining = _ISO_DATE_RE.sub('', remaining)
+    remaining = _MERCHANT_FILLER_RE.sub('', remaining)
+    remaining = _MERCHANT_FILLER_ZH_RE.sub('', remaining)
+    remaining = _CURRENCY_CODE_RE.sub('', remaining)
     remaining = remaining.strip().strip('—-,.')
 
     if not remaining:
         return None
 
     words = remaining.split()
-    if len(words) <= 2:
+    if known_merchant:
+        merchant = known_merchant
+        items_text = re.sub(re.escape(known_merchant), '', remaining, flags=re.IGNORECASE)
+        items = _BARE_NUMBER_RE.sub('', items_text).strip() or merchant
+    elif len(words) <= 2:
         merchant = remaining
         items = remaining
     else:
         merchant = words[0]
         items = ' '.join(words[1:])
 
-    category = guess_category(text)
+    category, currency = _resolve_category_currency(merchant, text)
     return Expense(date=date, merchant=merchant, category=category, currency=currency, amount=amount, items=items)
 
 # ========================
 # LLM (API fallback)
 # ========================
-_xai_api_key = _get_xai_api_key()
-if not _xai_api_key:
-    st.error(f"🚫 {t('missing_api_key_title')}")
-    st.info(t("missing_api_key_body"))
+# LLM_BACKEND: "xai" (default), "openai-compatible" (any OpenAI-style server at LLM_BASE_URL, e.g. a
+# local stub for load tests), or "replay" (answers only from responses recorded with LLM_RECORD=1;
+# no network and no API key, for offline CI and benchmarks)
+LLM_BACKEND = (_get_secret("LLM_BACKEND") or "xai").lower()
+LLM_MODEL = _get_secret("LLM_MODEL") or "grok-3-mini-fast"
+LLM_BASE_URL = _get_secret("LLM_BASE_URL")
+LLM_RECORD = _get_bool_secret("LLM_RECORD", False)
+LLM_REPLAY_DIR = (_get_secret("LLM_REPLAY_DIR")
+                  or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'llm_replay'))
+
+# The prompts' "Today: YYYY-MM-DD" line, which would otherwise expire every recording at midnight.
+# The prompt reaches the cache as serialized messages, so its newlines may be escaped.
+_REPLAY_TODAY_RE = re.compile(r'((?:^|\n|\\n)Today: )\d{4}-\d{2}-\d{2}')
+
+class ReplayCache(BaseCache):
+    """LangChain cache that records model responses to disk and serves them back.
+
+    Entries are keyed by the model name, call parameters (including the structured-output schema)
+    and prompt, but not the endpoint or key, so a recording made against x.ai replays anywhere.
+    The prompt's date is left out of the key, so a replay answers with the dates as recorded.
+    Recording always calls the model; replaying never does, and a miss is an error."""
+
+    def __init__(self, directory: str, replay: bool):
+        self.directory = directory
+        self.replay = replay
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, prompt: str, llm_string: str) -> str:
+        model_part, _, call_params = llm_string.partition("---")
+        try:
+            model_name = json.loads(model_part)["kwargs"]["model_name"]
+        except (ValueError, KeyError, TypeError):
+            model_name = model_part
+        prompt = _REPLAY_TODAY_RE.sub(r'\1', prompt)
+        key = hashlib.sha256(f"{model_name}\n{call_params}\n{prompt}".encode()).hexdigest()
+        return os.path.join(self.directory, f"{key}.json")
+
+    def lookup(self, prompt: str, llm_string: str):
+        if not self.replay:
+            return None
+        try:
+            with open(self._path(prompt, llm_string), encoding="utf-8") as f:
+                return [loads(generation) for generation in json.load(f)["generations"]]
+        except FileNotFoundError:
+            raise LookupError(f"No recorded LLM response for this prompt in {self.directory} "
+                              f"(LLM_BACKEND=replay); record one with LLM_RECORD=1") from None
+
+    def update(self, prompt: str, llm_string: str, return_val):
+        if self.replay:
+            return
+        path = self._path(prompt, llm_string)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"prompt": prompt, "llm": llm_string,
+                       "generations": [dumps(generation) for generation in return_val]}, f, ensure_ascii=False)
+        os.replace(f"{path}.tmp", path)
+
+    def clear(self, **kwargs):
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                os.remove(os.path.join(self.directory, name))
+
+if LLM_BACKEND == "xai":
+    _llm_api_key = _get_xai_api_key()
+    if not _llm_api_key:
+        st.error(f"🚫 {t('missing_api_key_title')}")
+        st.info(t("missing_api_key_body"))
+        st.stop()
+elif LLM_BACKEND == "openai-compatible":
+    if not LLM_BASE_URL:
+        st.error("🚫 LLM_BACKEND=openai-compatible needs LLM_BASE_URL.")
+        st.stop()
+    _llm_api_key = _get_secret("LLM_API_KEY") or "not-needed"
+elif LLM_BACKEND == "replay":
+    _llm_api_key = "replay"
+else:
+    st.error(f"🚫 Unknown LLM_BACKEND: {LLM_BACKEND} (use xai, openai-compatible or replay).")
     st.stop()
 
-llm = ChatOpenAI(
-    model="grok-3-mini-fast",
-    temperature=0,
-    api_key=_xai_api_key,
-    base_url="https://api.x.ai/v1",
-)
+@st.cache_resource
+def get_llm(backend: str, api_key: str, max_retries: int = 2) -> ChatOpenAI:
+    """One client (and its HTTP connection pool) per process, backend, key and retry policy."""
+    base_url = {"xai": "https://api.x.ai/v1", "openai-compatible": LLM_BASE_URL,
+                "replay": "http://replay.invalid/v1"}[backend]
+    cache = None
+    if backend == "replay":
+        cache = ReplayCache(LLM_REPLAY_DIR, replay=True)
+    elif LLM_RECORD:
+        cache = ReplayCache(LLM_REPLAY_DIR, replay=False)
+    return ChatOpenAI(
+        model=LLM_MODEL,
+        temperature=0,
+        api_key=api_key,
+        base_url=base_url,
+        cache=cache,
+        max_retries=0 if backend == "replay" else max_retries,
+    )
+
+llm = get_llm(LLM_BACKEND, _llm_api_key)
+
+# Structured output: "json_schema" constrains the reply to the schema, "function_calling" returns it
+# as a tool call, "off" sends a plain prompt; any reply that still fails validation is repaired by
+# PydanticOutputParser before the call is counted as failed
+LLM_STRUCTURED_METHOD = (_get_secret("LLM_STRUCTURED_METHOD") or "json_schema").lower()
+LLM_INPUT_TOKEN_BUDGET = _get_int_secret("LLM_INPUT_TOKEN_BUDGET", 1500)
+
+class ExpenseList(BaseModel):
+    """Multi-transaction reply; structured output needs an object at the top level, not an array."""
+    expenses: list[Expense] = Field(description="Every individual expense/transaction in the text")
+
+_OUTPUT_PARSERS = {
+    "Expense": PydanticOutputParser(pydantic_object=Expense),
+    "ExpenseList": PydanticOutputParser(pydantic_object=ExpenseList),
+}
+
+@st.cache_resource
+def get_structured_llm(backend: str, api_key: str, schema_name: str, method: str, max_retries: int = 2):
+    schema = {"Expense": Expense, "ExpenseList": ExpenseList}[schema_name]
+    return get_llm(backend, api_key, max_retries).with_structured_output(schema, method=method, include_raw=True)
+
+def _llm_runnable(schema_name: str, max_retries: int = 2):
+    """The runnable for one schema; max_retries is the HTTP client's own retry count."""
+    if LLM_STRUCTURED_METHOD == "off":
+        return get_llm(LLM_BACKEND, _llm_api_key, max_retries)
+    return get_structured_llm(LLM_BACKEND, _llm_api_key, schema_name, LLM_STRUCTURED_METHOD, max_retries)
+
+def _salvage_expense_list(text: str) -> ExpenseList:
+    """Keep the valid items of a reply whose list failed validation as a whole."""
+    data = parse_json_markdown(text)
+    items = data.get("expenses", []) if isinstance(data, dict) else data
+    expenses = []
+    for item in items if isinstance(items, list) else []:
+        try:
+            expenses.append(Expense(**item))
+        except (TypeError, ValidationError):
+            continue
+    return ExpenseList(expenses=expenses)
+
+def _read_llm_reply(schema_name: str, reply) -> tuple[BaseModel, dict | None]:
+    """The validated model from a reply, plus the token usage reported with it."""
+    raw = reply if LLM_STRUCTURED_METHOD == "off" else reply["raw"]
+    if LLM_STRUCTURED_METHOD != "off" and reply["parsed"] is not None:
+        return reply["parsed"], raw.usage_metadata
+    text = raw.content
+    if not text and getattr(raw, "tool_calls", None):
+        text = json.dumps(raw.tool_calls[0]["args"])
+    try:
+        return _OUTPUT_PARSERS[schema_name].parse(text), raw.usage_metadata
+    except OutputParserException:
+        if schema_name != "ExpenseList":
+            raise
+        return _salvage_expense_list(text), raw.usage_metadata
+
+_NOISE_LINE_RE = re.compile(r'^[\W_]*$')  # rules, box drawing, stray punctuation
+
+def _estimate_tokens(text: str) -> int:
+    """Rough token count: ~4 ASCII characters per token, one token per CJK character."""
+    ascii_chars = sum(ch.isascii() for ch in text)
+    return ascii_chars // 4 + (len(text) - ascii_chars)
+
+def _clean_prompt_lines(text: str, drop_repeats: bool) -> list[str]:
+    """Lines with whitespace collapsed and OCR noise removed; drop_repeats also skips consecutive duplicates."""
+    lines, previous = [], None
+    for raw_line in text.splitlines():
+        line = ' '.join(raw_line.split())
+        if not line or (drop_repeats and line == previous) or _NOISE_LINE_RE.match(line):
+            continue
+        if len(line) <= 2 and line.isascii() and not any(ch.isdigit() for ch in line):
+            continue  # stray OCR glyphs; one or two CJK characters are real words (菜, 全聯)
+        lines.append(line)
+        previous = line
+    return lines
+
+def compact_for_prompt(text: str, budget: int = LLM_INPUT_TOKEN_BUDGET) -> str:
+    """Strip OCR noise lines and repeats, then trim to the token budget keeping the head and tail.
+
+    For a single expense only: receipts keep the merchant and date at the top and totals at the
+    bottom, so the middle goes first. Multi-expense text is never trimmed; it is chunked instead."""
+    lines = _clean_prompt_lines(text, drop_repeats=True)
+    compact = '\n'.join(lines)
+    if _estimate_tokens(compact) <= budget:
+        return compact
+
+    head, tail, used = [], [], _estimate_tokens("[...]")
+    front, back = 0, len(lines) - 1
+    while front <= back:
+        take_front = len(head) <= len(tail)
+        line = lines[front] if take_front else lines[back]
+        cost = _estimate_tokens(line) + 1
+        if used + cost > budget:
+            break
+        used += cost
+        if take_front:
+            head.append(line)
+            front += 1
+        else:
+            tail.append(line)
+            back -= 1
+    return '\n'.join(head + ["[...]"] + tail[::-1])
+_mark_timing("models+parsers+llm")
 
-if "parse_cache" not in st.session_state:
-    st.session_state.parse_cache = {}
 if "api_call_count" not in st.session_state:
     st.session_state.api_call_count = 0
 if "local_parse_count" not in st.session_state:
     st.session_state.local_parse_count = 0
 if "cache_hit_count" not in st.session_state:
     st.session_state.cache_hit_count = 0
+if "llm_metrics" not in st.session_state:
+    st.session_state.llm_metrics = Counter()
+
+# ========================
+# Persistent parse cache (shared across sessions, users and app instances)
+# ========================
+PARSE_CACHE_MAX_ENTRIES = _get_int_secret("PARSE_CACHE_MAX_ENTRIES", 5000)
+PARSE_CACHE_TTL_DAYS = _get_int_secret("PARSE_CACHE_TTL_DAYS", 30)
+_MONTH_NAME = (r'(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?'
+               r'|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\.?')
+# Any way a text can pin a calendar day; texts matching none of these get their dates rebased
+_ABSOLUTE_DATE_RE = re.compile(
+    r'\d{4}[-/.]\d{1,2}[-/.]\d{1,2}'               # 2025-10-05, 2025/10/5
+    r'|(?<![\d.])\d{1,2}/\d{1,2}(?![\d/])'            # 5/10, 10/5
+    r'|\d{1,2}\s*月\s*\d{1,2}'                      # 10月5日
+    rf'|\b{_MONTH_NAME}\s+\d{{1,2}}\b'                # Jan 5, October 05
+    rf'|\b\d{{1,2}}(?:st|nd|rd|th)?\s+{_MONTH_NAME}(?![a-z])',  # 5 Jan, 5th October
+    re.IGNORECASE)
+_RELATIVE_DATE_WINDOW_DAYS = 7
+
+def _parse_cache_key(kind: str, text: str) -> str:
+    """Key on case-folded, whitespace-collapsed text so trivial variations share an entry."""
+    normalized = ' '.join(text.casefold().split())
+    return hashlib.sha256(f"{kind}:{normalized}".encode()).hexdigest()
+
+def _rebase_relative_dates(records: list[dict], ref_date: str) -> list[dict]:
+    """Move dates the LLM derived from "today" to the current day.
+
+    Only used for texts that name no calendar day (see _ABSOLUTE_DATE_RE): a record dated within
+    a week of the day it was first parsed ("today", "yesterday", no date at all) keeps the same
+    offset from today."""
+    ref = datetime.strptime(ref_date, '%Y-%m-%d')
+    today = datetime.strptime(datetime.now().strftime('%Y-%m-%d'), '%Y-%m-%d')
+    if today == ref:
+        return records
+    rebased = []
+    for record in records:
+        record = dict(record)
+        try:
+            record_date = datetime.strptime(record["date"], '%Y-%m-%d')
+        except (KeyError, TypeError, ValueError):
+            rebased.append(record)
+            continue
+        if abs((ref - record_date).days) <= _RELATIVE_DATE_WINDOW_DAYS:
+            record["date"] = (today - (ref - record_date)).strftime('%Y-%m-%d')
+        rebased.append(record)
+    return rebased
+
+def parse_cache_get(kind: str, text: str) -> list[dict] | None:
+    """Return cached parse results for this text, or None on a miss or expired entry."""
+    key = _parse_cache_key(kind, text)
+    with db_pool.connection() as conn:
+        row = conn.execute("SELECT result, ref_date, created_at FROM parse_cache WHERE cache_key = ?",
+                           (key,)).fetchone()
+    if row is None:
+        return None
+    result, ref_date, created_at = row
+    now = time.time()
+    if now - created_at > PARSE_CACHE_TTL_DAYS * 86400:
+        return None
+    with db_pool.transaction() as conn:
+        conn.execute("UPDATE parse_cache SET last_used_at = ?, hits = hits + 1 WHERE cache_key = ?", (now, key))
+    records = json.loads(result)
+    if not _ABSOLUTE_DATE_RE.search(text):
+        records = _rebase_relative_dates(records, ref_date)
+    return records
+
+def parse_cache_put(kind: str, text: str, records: list[dict]):
+    """Store parse results, then evict expired entries and the least recently used overflow."""
+    now = time.time()
+    with db_pool.transaction() as conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO parse_cache (cache_key, kind, result, ref_date, created_at, last_used_at, hits)
+            VALUES (?, ?, ?, ?, ?, ?, 0)
+        """, (_parse_cache_key(kind, text), kind, json.dumps(records, ensure_ascii=False),
+              datetime.now().strftime('%Y-%m-%d'), now, now))
+        conn.execute("DELETE FROM parse_cache WHERE created_at < ?", (now - PARSE_CACHE_TTL_DAYS * 86400,))
+        conn.execute("""
+            DELETE FROM parse_cache WHERE cache_key IN
+                (SELECT cache_key FROM parse_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)
+        """, (PARSE_CACHE_MAX_ENTRIES,))
 
 def _log_stats(method: str, text: str, expense):
     now = datetime.now().strftime('%H:%M:%S')
@@ -760,36 +2470,35 @@ def _log_stats(method: str, text: str, expense):
         print(f"         -> {expense.merchant} | {expense.amount} {expense.currency} | {expense.category}")
     print(f"         Session stats: {total} total parses | {api} API calls | {local} local | {cached} cache hits")
     print(f"         API cost ratio: {api}/{total} ({api/total*100:.0f}%)" if total > 0 else "")
+    metrics = st.session_state.llm_metrics
+    if metrics["calls"]:
+        calls = metrics["calls"]
+        print(f"         LLM calls: {calls} | failure rate {metrics['failures'] / calls:.0%} | "
+              f"tokens/call {metrics['input_tokens'] / calls:.0f} in, {metrics['output_tokens'] / calls:.0f} out | "
+              f"avg latency {metrics['latency_ms'] / calls:.0f} ms")
 
 def parse_expense_with_api(text: str) -> Expense | None:
-    cache_key = hashlib.md5(text.encode()).hexdigest()
-    if cache_key in st.session_state.parse_cache:
+    cached = parse_cache_get("single", text)
+    if cached:
         st.session_state.cache_hit_count += 1
-        expense = st.session_state.parse_cache[cache_key]
+        expense = Expense(**cached[0])
         _log_stats("CACHE HIT", text, expense)
         return expense
 
-    prompt = f"""Extract expense info from this text as JSON.
-Text: {text}
-Today: {datetime.now().strftime('%Y-%m-%d')}
-Return ONLY JSON: {{"date":"YYYY-MM-DD","merchant":"name","category":"Food|Transport|Shopping|Entertainment|Groceries|Utilities|Health|Other","currency":"HKD|TWD|USD|CNY|JPY|EUR|GBP|SGD|KRW|MYR","amount":0.0,"items":"description"}}"""
-
+    start = time.perf_counter()
     try:
-        result = llm.invoke(prompt)
-        content = result.content.strip()
-        if "```" in content:
-            content = re.search(r'```(?:json)?\s*(.*?)```', content, re.DOTALL).group(1).strip()
-        data = json.loads(content)
-        expense = Expense(**data)
-        st.session_state.parse_cache[cache_key] = expense
-        st.session_state.api_call_count += 1
-        _log_stats("API CALL", text, expense)
-        return expense
+        expense, usage = _read_llm_reply("Expense", _llm_runnable("Expense").invoke(_single_prompt(text)))
     except Exception as e:
+        _record_llm_call(time.perf_counter() - start, None, failed=True)
         st.session_state.api_call_count += 1
         print(f"[{datetime.now().strftime('%H:%M:%S')}] [API ERROR] [{CURRENT_USER}] \"{text[:60]}\" -> {str(e)}")
         st.error(f"Parsing failed: {str(e)}. Try clearer input or rephrase.")
         return None
+    _record_llm_call(time.perf_counter() - start, usage, failed=False)
+    parse_cache_put("single", text, [expense.model_dump()])
+    st.session_state.api_call_count += 1
+    _log_stats("API CALL", text, expense)
+    return expense
 
 def parse_expense_only(text: str):
     """Parse text into an Expense object (local first, then API fallback). Does NOT save to DB."""
@@ -805,6 +2514,25 @@ def parse_expense_only(text: str):
 
     return expense, used_api
 
+# Pattern: a line that contains both a merchant-like name and a monetary amount
+# e.g. "Starbucks $45.00", "McDonald's HK$32.50", "MTR 12.00", "7-Eleven -$28.00"
+_LINE_MERCHANT_AMOUNT_RE = re.compile(
+    r'^(.+?)\s+'                                         # merchant name
+    r'[-]?\s*(?:NT\$?|HK\$?|US\$?|SG\$?|RM|€|£|\$)?\s*' # optional currency symbol
+    r'(\d+(?:[,]\d{3})*(?:\.\d+)?)\s*'                   # amount
+    r'(?:TWD|HKD|USD|CNY|JPY|EUR|GBP|SGD|KRW|MYR)?$',    # optional currency code
+    re.IGNORECASE
+)
+# Also match: amount first, then merchant  (e.g. "$45.00 Starbucks")
+_LINE_AMOUNT_MERCHANT_RE = re.compile(
+    r'^[-]?\s*(?:NT\$?|HK\$?|US\$?|SG\$?|RM|€|£|\$)\s*'
+    r'(\d+(?:[,]\d{3})*(?:\.\d+)?)\s+'
+    r'(.+?)$',
+    re.IGNORECASE
+)
+# Date header lines in transaction lists (e.g. "2025-12-01", "2025/12/1")
+_DATE_HEADER_RE = re.compile(r'(\d{4}[-/]\d{1,2}[-/]\d{1,2})')
+
 def try_local_parse_multi(text: str) -> list[dict]:
     """Try to split OCR text into multiple transaction lines and parse each one locally.
     Handles Apple Pay / Wallet transaction lists where each line has merchant + amount."""
@@ -812,28 +2540,11 @@ def try_local_parse_multi(text: str) -> list[dict]:
     lines = [l.strip() for l in text.split('\n') if l.strip()]
     results = []
 
-    # Pattern: a line that contains both a merchant-like name and a monetary amount
-    # e.g. "Starbucks $45.00", "McDonald's HK$32.50", "MTR 12.00", "7-Eleven -$28.00"
-    line_pattern = re.compile(
-        r'^(.+?)\s+'                                         # merchant name
-        r'[-]?\s*(?:NT\$?|HK\$?|US\$?|SG\$?|RM|€|£|\$)?\s*' # optional currency symbol
-        r'(\d+(?:[,]\d{3})*(?:\.\d+)?)\s*'                   # amount
-        r'(?:TWD|HKD|USD|CNY|JPY|EUR|GBP|SGD|KRW|MYR)?$',    # optional currency code
-        re.IGNORECASE
-    )
-    # Also match: amount first, then merchant  (e.g. "$45.00 Starbucks")
-    line_pattern_rev = re.compile(
-        r'^[-]?\s*(?:NT\$?|HK\$?|US\$?|SG\$?|RM|€|£|\$)\s*'
-        r'(\d+(?:[,]\d{3})*(?:\.\d+)?)\s+'
-        r'(.+?)$',
-        re.IGNORECASE
-    )
-
     # Try to detect a date on a nearby line
     current_date = today
     for line in lines:
         # Check if line is a date header (e.g. "2025-12-01", "Jan 15, 2025", "12/01")
-        date_match = re.search(r'(\d{4}[-/]\d{1,2}[-/]\d{1,2})', line)
+        date_match = _DATE_HEADER_RE.search(line)
         if date_match:
             try:
                 parsed = datetime.strptime(date_match.group(1).replace('/', '-'), '%Y-%m-%d')
@@ -843,76 +2554,210 @@ def try_local_parse_multi(text: str) -> list[dict]:
             continue
 
         # Match "merchant amount" pattern
-        m = line_pattern.match(line)
+        m = _LINE_MERCHANT_AMOUNT_RE.match(line)
         if m:
             merchant = m.group(1).strip().rstrip('-–— ')
             amount = float(m.group(2).replace(',', ''))
             if amount <= 0 or amount > 999999:
                 continue
-            currency = detect_currency(line)
+            category, currency = _resolve_category_currency(merchant, line)
             results.append({
                 "date": current_date, "merchant": merchant,
                 "items": merchant, "currency": currency,
-                "amount": amount, "category": guess_category(line),
+                "amount": amount, "category": category,
             })
             continue
 
         # Match "amount merchant" pattern
-        m2 = line_pattern_rev.match(line)
+        m2 = _LINE_AMOUNT_MERCHANT_RE.match(line)
         if m2:
             amount = float(m2.group(1).replace(',', ''))
             merchant = m2.group(2).strip().rstrip('-–— ')
             if amount <= 0 or amount > 999999:
                 continue
-            currency = detect_currency(line)
+            category, currency = _resolve_category_currency(merchant, line)
             results.append({
                 "date": current_date, "merchant": merchant,
                 "items": merchant, "currency": currency,
-                "amount": amount, "category": guess_category(line),
+                "amount": amount, "category": category,
             })
 
     return results
 
-def parse_multi_with_api(text: str) -> list[dict]:
-    """Use the LLM to extract multiple expenses from OCR text."""
-    cache_key = "multi_" + hashlib.md5(text.encode()).hexdigest()
-    if cache_key in st.session_state.parse_cache:
-        st.session_state.cache_hit_count += 1
-        return st.session_state.parse_cache[cache_key]
-
-    prompt = f"""Extract ALL individual expenses/transactions from this text as a JSON array.
-Each item: {{"date":"YYYY-MM-DD","merchant":"name","category":"Food|Transport|Shopping|Entertainment|Groceries|Utilities|Health|Other","currency":"HKD|TWD|USD|CNY|JPY|EUR|GBP|SGD|KRW|MYR","amount":0.0,"items":"description"}}
+# Long documents are split into page/section chunks that are parsed concurrently on one shared
+# event loop, so a statement takes about as long as its slowest chunk rather than the sum
+LLM_CONCURRENCY = max(1, _get_int_secret("LLM_CONCURRENCY", 4))
+LLM_MAX_RETRIES = max(1, _get_int_secret("LLM_MAX_RETRIES", 3))
+LLM_RETRY_BASE_SECONDS = 1.0
+_PAGE_HEADER_RE = re.compile(r'^--- Page \d+ ---$', re.MULTILINE)
+
+@st.cache_resource
+def _get_llm_loop() -> asyncio.AbstractEventLoop:
+    """A process-wide event loop on its own thread; the async HTTP client stays bound to this one loop."""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="llm-loop", daemon=True).start()
+    return loop
+
+def _split_sections(text: str) -> list[str]:
+    """Pages (from the OCR page markers), or blank-line separated blocks for plain text."""
+    if _PAGE_HEADER_RE.search(text):
+        starts = [m.start() for m in _PAGE_HEADER_RE.finditer(text)]
+        if starts[0] > 0:
+            starts.insert(0, 0)
+        return [text[a:b].strip() for a, b in zip(starts, starts[1:] + [len(text)]) if text[a:b].strip()]
+    return [block.strip() for block in re.split(r'\n\s*\n', text) if block.strip()]
+
+def split_into_chunks(text: str, max_tokens: int = LLM_INPUT_TOKEN_BUDGET) -> list[str]:
+    """Pack whole sections into chunks of at most max_tokens (by _estimate_tokens).
+
+    Oversized sections are cut at line breaks, so every transaction reaches a prompt in full;
+    only a single line longer than the budget can exceed it."""
+    chunks, current, current_tokens = [], "", 0
+    for section in _split_sections(text):
+        pieces = [section]
+        if _estimate_tokens(section) > max_tokens:
+            pieces, piece, piece_tokens = [], "", 0
+            for line in section.splitlines():
+                line_tokens = _estimate_tokens(line) + 1
+                if piece and piece_tokens + line_tokens > max_tokens:
+                    pieces.append(piece)
+                    piece, piece_tokens = "", 0
+                piece = f"{piece}\n{line}" if piece else line
+                piece_tokens += line_tokens
+            pieces.append(piece)
+        for piece in pieces:
+            piece_tokens = _estimate_tokens(piece)
+            if current and current_tokens + piece_tokens + 1 > max_tokens:
+                chunks.append(current)
+                current, current_tokens = "", 0
+            current = f"{current}\n\n{piece}" if current else piece
+            current_tokens += piece_tokens + 1
+    if current:
+        chunks.append(current)
+    return chunks or [text]
+
+_CATEGORY_HINT = "Food|Transport|Shopping|Entertainment|Groceries|Utilities|Health|Other"
+_CURRENCY_HINT = "HKD|TWD|USD|CNY|JPY|EUR|GBP|SGD|KRW|MYR"
+_EXPENSE_JSON_HINT = (f'{{"date":"YYYY-MM-DD","merchant":"name","category":"{_CATEGORY_HINT}",'
+                      f'"currency":"{_CURRENCY_HINT}","amount":0.0,"items":"description"}}')
+
+def _single_prompt(text: str) -> str:
+    prompt = f"""Extract expense info from this text.
+Text: {compact_for_prompt(text)}
+Today: {datetime.now().strftime('%Y-%m-%d')}
+category: {_CATEGORY_HINT}; currency: {_CURRENCY_HINT}"""
+    if LLM_STRUCTURED_METHOD == "off":
+        prompt += f"\nReturn ONLY JSON: {_EXPENSE_JSON_HINT}"
+    return prompt
+
+def _multi_prompt(text: str) -> str:
+    # Never trimmed or deduplicated: split_into_chunks keeps chunks within the token budget, and
+    # identical lines can be separate transactions
+    lines = '\n'.join(_clean_prompt_lines(text, drop_repeats=False))
+    prompt = f"""Extract ALL individual expenses/transactions from this text.
+category: {_CATEGORY_HINT}; currency: {_CURRENCY_HINT}
 Today: {datetime.now().strftime('%Y-%m-%d')}
 Text:
-{text}
-Return ONLY a JSON array: [{{...}}, {{...}}]"""
-
-    try:
-        result = llm.invoke(prompt)
-        content = result.content.strip()
-        if "```" in content:
-            content = re.search(r'```(?:json)?\s*(.*?)```', content, re.DOTALL).group(1).strip()
-        data = json.loads(content)
-        if isinstance(data, dict):
-            data = [data]  # Single result wrapped
-        expenses = []
-        for item in data:
+{lines}"""
+    if LLM_STRUCTURED_METHOD == "off":
+        prompt += f'\nReturn ONLY JSON: {{"expenses": [{_EXPENSE_JSON_HINT}, ...]}}'
+    return prompt
+
+def _record_llm_call(seconds: float, usage: dict | None, failed: bool):
+    """Add one API call to the session's token, failure and latency metrics."""
+    metrics = st.session_state.llm_metrics
+    metrics["calls"] += 1
+    metrics["failures"] += int(failed)
+    metrics["latency_ms"] += round(seconds * 1000)
+    if usage:
+        metrics["input_tokens"] += usage.get("input_tokens", 0)
+        metrics["output_tokens"] += usage.get("output_tokens", 0)
+
+async def _aparse_chunk(runnable, chunk: str,
+                        semaphore: asyncio.Semaphore) -> tuple[list[dict] | None, Exception | None, list]:
+    """Parse one chunk, retrying failed calls with exponential backoff and jitter.
+
+    Returns (expenses or None, the last error, [(seconds, usage, failed)] per attempt); metrics are
+    recorded by the caller because session state is only reachable from the script thread."""
+    attempts = []
+    async with semaphore:
+        for attempt in range(LLM_MAX_RETRIES):
+            start = time.perf_counter()
             try:
-                e = Expense(**item)
-                expenses.append({
-                    "date": e.date, "merchant": e.merchant, "items": e.items,
-                    "currency": e.currency, "amount": e.amount, "category": e.category,
-                })
-            except Exception:
+                parsed, usage = _read_llm_reply("ExpenseList", await runnable.ainvoke(_multi_prompt(chunk)))
+            except Exception as e:
+                attempts.append((time.perf_counter() - start, None, True))
+                # A replay miss (LookupError) won't change on retry
+                if isinstance(e, LookupError) or attempt == LLM_MAX_RETRIES - 1:
+                    return None, e, attempts
+                delay = LLM_RETRY_BASE_SECONDS * 2 ** attempt * (0.5 + random.random())
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] [API RETRY] attempt {attempt + 1} failed "
+                      f"({e}); retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
                 continue
-        st.session_state.parse_cache[cache_key] = expenses
-        st.session_state.api_call_count += 1
-        _log_stats("API MULTI", f"{len(expenses)} expenses from text", None)
-        return expenses
-    except Exception as e:
-        st.session_state.api_call_count += 1
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] [API MULTI ERROR] [{CURRENT_USER}] {str(e)}")
-        return []
+            attempts.append((time.perf_counter() - start, usage, False))
+            return [e.model_dump() for e in parsed.expenses], None, attempts
+
+async def _aparse_chunks(runnable, chunks: list[str]) -> list:
+    semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+    return await asyncio.gather(*(_aparse_chunk(runnable, chunk, semaphore) for chunk in chunks))
+
+def merge_chunk_expenses(chunk_results: list[list[dict]]) -> list[dict]:
+    """Concatenate per-chunk results in order, dropping repeats of the same transaction across chunks.
+
+    Identical rows within one chunk are kept (two coffees on one day); a transaction is kept as many
+    times as the chunk that lists it most often, so overlap between chunks isn't double counted."""
+    merged, kept = [], Counter()
+    for expenses in chunk_results:
+        seen_here = Counter()
+        for expense in expenses:
+            key = (expense["date"], _normalize_merchant(expense["merchant"]),
+                   expense["currency"], round(float(expense["amount"]), 2))
+            seen_here[key] += 1
+            if seen_here[key] > kept[key]:
+                kept[key] += 1
+                merged.append(expense)
+    return merged
+
+def parse_multi_with_api(text: str) -> list[dict]:
+    """Use the LLM to extract multiple expenses from OCR text, one concurrent call per uncached chunk."""
+    cached = parse_cache_get("multi", text)
+    if cached is not None:
+        st.session_state.cache_hit_count += 1
+        return cached
+
+    chunks = split_into_chunks(text)
+    chunk_results: list = [parse_cache_get("multi", chunk) if len(chunks) > 1 else None for chunk in chunks]
+    pending = [i for i, result in enumerate(chunk_results) if result is None]
+    st.session_state.cache_hit_count += len(chunks) - len(pending)
+    start = time.perf_counter()
+    if pending:
+        future = asyncio.run_coroutine_threadsafe(
+            # _aparse_chunk retries with backoff itself; client retries on top would multiply the attempts
+            _aparse_chunks(_llm_runnable("ExpenseList", max_retries=0), [chunks[i] for i in pending]),
+            _get_llm_loop())
+        for i, (expenses, error, attempts) in zip(pending, future.result()):
+            chunk_results[i] = expenses if error is None else error
+            for seconds, usage, call_failed in attempts:
+                _record_llm_call(seconds, usage, call_failed)
+    st.session_state.api_call_count += len(pending)
+
+    failed = 0
+    for i, result in enumerate(chunk_results):
+        if isinstance(result, Exception):
+            failed += 1
+            chunk_results[i] = []
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] [API MULTI ERROR] [{CURRENT_USER}] "
+                  f"chunk {i + 1}/{len(chunks)}: {result}")
+        elif i in pending and len(chunks) > 1:
+            parse_cache_put("multi", chunks[i], result)
+    expenses = merge_chunk_expenses(chunk_results)
+    if not failed:
+        # A partial result is returned but not cached, so the failed chunks are retried next time
+        parse_cache_put("multi", text, expenses)
+    _log_stats("API MULTI", f"{len(expenses)} expenses from {len(chunks)} chunks "
+                            f"({len(pending)} called, {failed} failed) in {time.perf_counter() - start:.1f}s", None)
+    return expenses
 
 def parse_photo_expenses(text: str) -> tuple[list[dict], bool]:
     """Parse OCR text — try local multi-line first, fall back to API multi-parse."""
@@ -939,15 +2784,214 @@ def parse_photo_expenses(text: str) -> tuple[list[dict], bool]:
 
     return [], True
 
-def save_expense(date, merchant, category, currency, amount, items, source):
-    """Save a validated expense to the database."""
-    amount_hkd = convert_to_hkd(amount, currency)
-    conn.execute("""
-        INSERT INTO expenses (username, date, merchant, category, currency, amount, amount_hkd, items, source)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (CURRENT_USER, date, merchant, category, currency, amount, amount_hkd, items, source))
-    _commit()
-    return amount_hkd
+def save_expenses_bulk(rows: list[dict], source: str) -> list[float]:
+    """Validate, convert and insert many expenses in one transaction (and one cloud sync).
+
+    Rows that fail Expense validation are skipped; returns the HKD amount of each saved row."""
+    expenses = []
+    for row in rows:
+        try:
+            expenses.append(Expense(**row))
+        except ValidationError as e:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] [BULK SKIP] [{CURRENT_USER}] {row} -> {e}")
+    if not expenses:
+        return []
+
+    batch_df = pd.DataFrame([e.model_dump() for e in expenses])
+    batch_df['date'] = [_normalize_date(d) or d for d in batch_df['date']]
+    batch_df['amount_hkd'] = convert_series_to_hkd(batch_df['amount'], batch_df['currency'], batch_df['date'])
+    columns = ['date', 'merchant', 'category', 'currency', 'amount', 'amount_hkd', 'items']
+    params = [(CURRENT_USER, *values, source)
+              for values in zip(*(batch_df[col].tolist() for col in columns))]
+    with db_pool.transaction() as conn:
+        conn.executemany("""
+            INSERT INTO expenses (username, date, merchant, category, currency, amount, amount_hkd, items, source)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, params)
+    merchant_index = get_merchant_index(CURRENT_USER)
+    for e in expenses:
+        merchant_index.add(e.merchant, e.category, e.currency, e.amount)
+    return batch_df['amount_hkd'].tolist()
+
+def save_expense(date, merchant, category, currency, amount, items, source) -> float | None:
+    """Save a validated expense to the database; returns its HKD amount, or None if it failed validation."""
+    saved = save_expenses_bulk([{
+        "date": date, "merchant": merchant, "category": category,
+        "currency": currency, "amount": amount, "items": items,
+    }], source)
+    return saved[0] if saved else None
+
+# ========================
+# Monthly summary (aggregated in SQL, one month at a time)
+# ========================
+def get_available_months(username: str) -> list[str]:
+    """Return the distinct YYYY-MM months the user has expenses in, newest first."""
+    with db_pool.connection() as conn:
+        rows = conn.execute("""
+            SELECT DISTINCT substr(date, 1, 7) AS year_month FROM expenses
+            WHERE username = ? AND date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]*'
+            ORDER BY year_month DESC
+        """, (username,)).fetchall()
+    return [r[0] for r in rows]
+
+def _month_bounds(year_month: str) -> tuple[str, str]:
+    """Return [first day, first day of next month) for a YYYY-MM string."""
+    year, month = (int(part) for part in year_month.split('-'))
+    next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return f"{year:04d}-{month:02d}-01", f"{next_year:04d}-{next_month:02d}-01"
+
+def get_month_summary(username: str, year_month: str) -> dict:
+    """Compute the dashboard metrics and breakdowns for one month with GROUP BY queries."""
+    # A date range (not substr) so SQLite can seek the (username, date) index
+    where = "WHERE username = ? AND date >= ? AND date < ?"
+    params = (username, *_month_bounds(year_month))
+
+    with db_pool.connection() as conn:
+        total_hkd, num_transactions, num_days = conn.execute(
+            f"SELECT COALESCE(SUM(amount_hkd), 0), COUNT(*), COUNT(DISTINCT substr(date, 1, 10)) FROM expenses {where}",
+            params,
+        ).fetchone()
+
+        category_df = pd.read_sql_query(
+            f"SELECT category, COALESCE(SUM(amount_hkd), 0) AS total FROM expenses {where} "
+            f"GROUP BY category ORDER BY total ASC",
+            conn, params=params,
+        )
+        daily_df = pd.read_sql_query(
+            f"SELECT substr(date, 1, 10) AS day, COALESCE(SUM(amount_hkd), 0) AS total FROM expenses {where} "
+            f"GROUP BY day ORDER BY day",
+            conn, params=params,
+        )
+        daily_df['day'] = pd.to_datetime(daily_df['day'], errors='coerce').dt.date
+        merchant_df = pd.read_sql_query(
+            f"SELECT merchant, COALESCE(SUM(amount_hkd), 0) AS total, COUNT(*) AS visits FROM expenses {where} "
+            f"GROUP BY merchant ORDER BY total DESC LIMIT 10",
+            conn, params=params,
+        )
+        currency_df = pd.read_sql_query(
+            f"SELECT currency, COALESCE(SUM(amount_hkd), 0) AS total FROM expenses {where} "
+            f"GROUP BY currency ORDER BY total DESC",
+            conn, params=params,
+        )
+
+    return {
+        "total_hkd": float(total_hkd or 0),
+        "num_transactions": int(num_transactions or 0),
+        "num_days": int(num_days or 0),
+        "by_category": category_df,
+        "by_day": daily_df,
+        "by_merchant": merchant_df,
+        "by_currency": currency_df,
+    }
+
+# ========================
+# Expense table queries (keyset pagination on (date, id))
+# ========================
+PAGE_SIZE_OPTIONS = [25, 50, 100, 200]
+DEFAULT_PAGE_SIZE = _get_int_secret("EXPENSE_PAGE_SIZE", 50)
+
+def _expense_filter_clause(username: str, filters: dict) -> tuple[str, list]:
+    """Build the WHERE clause for the expense table filters."""
+    clauses = ["username = ?"]
+    params: list = [username]
+    if filters.get("date_from"):
+        clauses.append("date >= ?")
+        params.append(filters["date_from"])
+    if filters.get("date_to"):
+        clauses.append("date <= ?")
+        params.append(filters["date_to"])
+    if filters.get("categories"):
+        clauses.append(f"category IN ({','.join('?' * len(filters['categories']))})")
+        params.extend(filters["categories"])
+    if filters.get("merchant"):
+        escaped = re.sub(r'([\\%_])', r'\\\1', filters["merchant"])
+        clauses.append("merchant LIKE ? ESCAPE '\\'")
+        params.append(f"%{escaped}%")
+    return " AND ".join(clauses), params
+
+def fetch_expense_page(username: str, filters: dict, cursor: tuple | None, page_size: int) -> tuple[pd.DataFrame, bool]:
+    """Fetch one page ordered by (date, id) descending, starting after `cursor`.
+
+    Returns the page and whether another page follows it."""
+    where, params = _expense_filter_clause(username, filters)
+    if cursor is not None:
+        cursor_date, cursor_id = cursor
+        if cursor_date is None:
+            # NULL dates sort last, so only older NULL-dated rows remain
+            where += " AND date IS NULL AND id < ?"
+            params += [cursor_id]
+        else:
+            where += " AND (date < ? OR (date = ? AND id < ?) OR date IS NULL)"
+            params += [cursor_date, cursor_date, cursor_id]
+    with db_pool.connection() as conn:
+        page_df = pd.read_sql_query(
+            f"SELECT id, date, merchant, category, currency, amount, amount_hkd, items, source FROM expenses "
+            f"WHERE {where} ORDER BY date DESC, id DESC LIMIT ?",
+            conn, params=params + [page_size + 1],
+        )
+    return page_df.head(page_size), len(page_df) > page_size
+
+def count_expenses(username: str, filters: dict) -> int:
+    where, params = _expense_filter_clause(username, filters)
+    with db_pool.connection() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM expenses WHERE {where}", params).fetchone()[0]
+
+EDITABLE_COLUMNS = ['date', 'merchant', 'category', 'currency', 'amount', 'items']
+
+def find_changed_rows(original_df: pd.DataFrame, edited_df: pd.DataFrame) -> pd.DataFrame:
+    """Vectorized diff of the editor output against the page it was built from.
+
+    Both frames are keyed by expense id; returns the edited rows whose editable fields changed."""
+    orig = original_df.set_index('id')[EDITABLE_COLUMNS]
+    edited = edited_df[EDITABLE_COLUMNS].reindex(orig.index)
+    text_columns = [col for col in EDITABLE_COLUMNS if col != 'amount']
+    text_changed = (orig[text_columns].fillna('').astype(str)
+                    != edited[text_columns].fillna('').astype(str)).any(axis=1)
+    amount_changed = (pd.to_numeric(orig['amount'], errors='coerce').fillna(0.0)
+                      != pd.to_numeric(edited['amount'], errors='coerce').fillna(0.0))
+    return edited[text_changed | amount_changed]
+
+def _fetch_index_rows(conn, username: str, ids: list[int]) -> list[tuple]:
+    """Current (merchant, category, currency, amount) of the given expenses, for MerchantIndex updates."""
+    placeholders = ','.join('?' * len(ids))
+    return conn.execute(f"SELECT merchant, category, currency, amount FROM expenses "
+                        f"WHERE id IN ({placeholders}) AND username = ?", ids + [username]).fetchall()
+
+def update_expenses(username: str, changed_df: pd.DataFrame) -> int:
+    """Write edited rows (indexed by id) back with one executemany in a single transaction."""
+    amounts = pd.to_numeric(changed_df['amount'], errors='coerce').fillna(0.0)
+    dates = [_normalize_date(d) or d for d in changed_df['date']]
+    amounts_hkd = convert_series_to_hkd(amounts, changed_df['currency'], pd.Series(dates, index=changed_df.index))
+    params = list(zip(
+        dates, changed_df['merchant'], changed_df['category'], changed_df['currency'],
+        amounts.tolist(), amounts_hkd.tolist(), changed_df['items'],
+        [int(row_id) for row_id in changed_df.index], [username] * len(changed_df),
+    ))
+    with db_pool.transaction() as conn:
+        old_rows = _fetch_index_rows(conn, username, [int(row_id) for row_id in changed_df.index])
+        conn.executemany("""
+            UPDATE expenses SET date=?, merchant=?, category=?, currency=?, amount=?, amount_hkd=?, items=?
+            WHERE id=? AND username=?
+        """, params)
+    merchant_index = get_merchant_index(username)
+    for row in old_rows:
+        merchant_index.remove(*row)
+    for date, merchant, category, currency, amount, *_ in params:
+        merchant_index.add(merchant, category, currency, amount)
+    return len(params)
+
+def delete_expenses(username: str, ids: list) -> int:
+    ids = [int(row_id) for row_id in ids]
+    placeholders = ','.join('?' * len(ids))
+    with db_pool.transaction() as conn:
+        old_rows = _fetch_index_rows(conn, username, ids)
+        conn.execute(f"DELETE FROM expenses WHERE id IN ({placeholders}) AND username = ?", ids + [username])
+    merchant_index = get_merchant_index(username)
+    for row in old_rows:
+        merchant_index.remove(*row)
+    return len(ids)
+
+_mark_timing("data+queries")
 
 # ========================================
 # Streamlit UI (main app — user is logged in)
@@ -957,6 +3001,22 @@ st.write(t("main_desc"))
 
 CATEGORIES = ["Food", "Transport", "Shopping", "Entertainment", "Groceries", "Utilities", "Health", "Other"]
 
+# Sidebar: per-user category keyword overrides
+with st.sidebar:
+    with st.expander(f"🏷️ {t('kw_header')}"):
+        st.caption(t("kw_caption"))
+        with st.form("keyword_form", clear_on_submit=True):
+            kw_text = st.text_input(t("kw_keyword"))
+            kw_category = st.selectbox(t("quick_category"), CATEGORIES)
+            if st.form_submit_button(t("kw_add")) and kw_text.strip():
+                add_user_keyword(CURRENT_USER, kw_text, kw_category)
+        for kw_id, kw, kw_cat in get_user_keywords(CURRENT_USER):
+            kcol1, kcol2 = st.columns([3, 1])
+            kcol1.write(f"`{kw}` → {kw_cat}")
+            if kcol2.button("✕", key=f"kw_remove_{kw_id}", help=t("kw_remove")):
+                delete_user_keyword(CURRENT_USER, kw_id)
+                st.rerun()
+
 # Tabs
 tab_quick, tab_free, tab1, tab2 = st.tabs([
     f"⚡ {t('tab_quick')}", f"💬 {t('tab_free')}", f"📸 {t('tab_photo')}", f"🎤 {t('tab_voice')}"
@@ -977,21 +3037,19 @@ with tab_quick:
 
         submitted = st.form_submit_button(f"💾 {t('quick_submit')}")
         if submitted and q_merchant and q_amount > 0:
-            amount_hkd = convert_to_hkd(q_amount, q_currency)
-            conn.execute("""
-                INSERT INTO expenses (username, date, merchant, category, currency, amount, amount_hkd, items, source)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (CURRENT_USER, q_date.strftime('%Y-%m-%d'), q_merchant, q_category, q_currency,
-                  q_amount, amount_hkd, q_items or q_merchant, "quick_form"))
-            _commit()
-            st.session_state.local_parse_count += 1
-            _log_stats("FORM", f"{q_merchant} {q_amount} {q_currency}",
-                       Expense(date=q_date.strftime('%Y-%m-%d'), merchant=q_merchant,
-                               category=q_category, currency=q_currency, amount=q_amount, items=q_items or q_merchant))
-            st.success(t("quick_success", merchant=q_merchant, amount=q_amount,
-                         currency=q_currency, amount_hkd=amount_hkd,
-                         category=q_category, date=q_date.strftime('%Y-%m-%d')))
-            st.caption(t("quick_no_api"))
+            amount_hkd = save_expense(q_date.strftime('%Y-%m-%d'), q_merchant, q_category, q_currency,
+                                      q_amount, q_items or q_merchant, "quick_form")
+            if amount_hkd is None:
+                st.error(t("save_invalid"))
+            else:
+                st.session_state.local_parse_count += 1
+                _log_stats("FORM", f"{q_merchant} {q_amount} {q_currency}",
+                           Expense(date=q_date.strftime('%Y-%m-%d'), merchant=q_merchant,
+                                   category=q_category, currency=q_currency, amount=q_amount, items=q_items or q_merchant))
+                st.success(t("quick_success", merchant=q_merchant, amount=q_amount,
+                             currency=q_currency, amount_hkd=amount_hkd,
+                             category=q_category, date=q_date.strftime('%Y-%m-%d')))
+                st.caption(t("quick_no_api"))
 
 # === Free Text Tab ===
 with tab_free:
@@ -1032,49 +3090,96 @@ with tab_free:
 
             if st.form_submit_button(f"💾 {t('free_text_confirm')}"):
                 if f_merchant and f_amount > 0:
-                    amount_hkd = convert_to_hkd(f_amount, f_currency)
-                    conn.execute("""
-                        INSERT INTO expenses (username, date, merchant, category, currency, amount, amount_hkd, items, source)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (CURRENT_USER, f_date.strftime('%Y-%m-%d'), f_merchant, f_category, f_currency,
-                          f_amount, amount_hkd, f_items or f_merchant, "free_text"))
-                    _commit()
-                    st.session_state.local_parse_count += 1
-                    _log_stats("FREE TEXT", f"{f_merchant} {f_amount} {f_currency}",
-                               Expense(date=f_date.strftime('%Y-%m-%d'), merchant=f_merchant,
-                                       category=f_category, currency=f_currency, amount=f_amount, items=f_items or f_merchant))
-                    st.success(t("free_text_saved"))
-                    st.caption(t("quick_no_api"))
-                    del st.session_state.free_parsed
+                    if save_expense(f_date.strftime('%Y-%m-%d'), f_merchant, f_category, f_currency,
+                                    f_amount, f_items or f_merchant, "free_text") is None:
+                        st.error(t("save_invalid"))
+                    else:
+                        st.session_state.local_parse_count += 1
+                        _log_stats("FREE TEXT", f"{f_merchant} {f_amount} {f_currency}",
+                                   Expense(date=f_date.strftime('%Y-%m-%d'), merchant=f_merchant,
+                                           category=f_category, currency=f_currency, amount=f_amount, items=f_items or f_merchant))
+                        st.success(t("free_text_saved"))
+                        st.caption(t("quick_no_api"))
+                        del st.session_state.free_parsed
+
+def _render_job(job: dict, running_label: str):
+    if job["status"] == "queued":
+        st.caption(f"⏳ {job['name']}: {t('job_queued')}")
+    elif job["status"] == "running":
+        st.progress(min(1.0, job["progress"] or 0.0), text=f"{job['name']}: {running_label}")
+    elif job["status"] == "failed":
+        st.error(f"{job['name']}: {t('job_failed', error=job['error'])}")
+    else:
+        st.caption(f"✅ {job['name']}")
+
+def show_job_status(job_ids: list[str], running_label: str) -> list[dict]:
+    """Render the jobs and keep polling them in a fragment while any is unfinished.
+
+    The fragment reruns on its own every JOB_POLL_SECONDS; once a job finishes it triggers a full
+    rerun so the rest of the page can pick up the result. Returns the jobs as of this run."""
+    jobs = get_jobs(CURRENT_USER, job_ids)
+    finished = {job["id"] for job in jobs if job["status"] not in JOB_ACTIVE_STATUSES}
+    polling = len(finished) < len(jobs)
+
+    @st.fragment(run_every=JOB_POLL_SECONDS if polling else None)
+    def _job_status():
+        current = get_jobs(CURRENT_USER, job_ids)
+        for job in current:
+            _render_job(job, running_label)
+        if polling and {job["id"] for job in current if job["status"] not in JOB_ACTIVE_STATUSES} != finished:
+            st.rerun()
+
+    _job_status()
+    return jobs
 
 # === Photo Receipt Tab ===
 with tab1:
     if not HAS_OCR:
         st.warning("OCR is not available in this deployment (EasyOCR not installed). Use Quick Form or Free Text instead.")
-    uploaded_file = st.file_uploader(t("upload_label"), type=['png', 'jpg', 'jpeg', 'pdf']) if HAS_OCR else None
-    if uploaded_file:
-        file_bytes = uploaded_file.getvalue()
-        is_pdf = HAS_PDF and uploaded_file.name.lower().endswith('.pdf')
-
-        with st.spinner(t("spinner_ocr")):
-            if is_pdf:
-                doc = fitz.open(stream=file_bytes, filetype="pdf")
-                all_page_texts = []
-                for page_num in range(len(doc)):
-                    page = doc[page_num]
-                    pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-                    img_bytes = pix.tobytes("png")
-                    result = reader.readtext(img_bytes, detail=0, paragraph=True)
-                    page_text = "\n".join(result)
-                    if page_text.strip():
-                        all_page_texts.append(f"--- Page {page_num + 1} ---\n{page_text}")
-                doc.close()
-                extracted_text = "\n\n".join(all_page_texts) if all_page_texts else ""
-                if not extracted_text.strip():
-                    st.warning("No text found in the PDF. It may be a scanned image or empty.")
-            else:
-                result = reader.readtext(file_bytes, detail=0, paragraph=True)
-                extracted_text = "\n".join(result)
+    # Digital PDFs can still be read from their text layer without OCR
+    upload_types = ['png', 'jpg', 'jpeg', 'pdf'] if HAS_OCR else ['pdf'] if HAS_PDF else None
+    uploaded_files = (st.file_uploader(t("upload_label"), type=upload_types, accept_multiple_files=True)
+                      if upload_types else None) or []
+    # One OCR job per distinct file; re-adding the same receipt reuses its job
+    photo_jobs = st.session_state.setdefault("photo_jobs", {})
+    uploads = {hashlib.sha256(uploaded_file.getvalue()).hexdigest(): uploaded_file for uploaded_file in uploaded_files}
+    # A failed (or expired) job is forgotten once its file leaves the uploader, so uploading it again retries
+    removed = {job_id: digest for digest, job_id in photo_jobs.items() if digest not in uploads}
+    if removed:
+        kept = {job["id"] for job in get_jobs(CURRENT_USER, list(removed)) if job["status"] != "failed"}
+        for job_id, digest in removed.items():
+            if job_id not in kept:
+                del photo_jobs[digest]
+    job_ids = []
+    for digest, uploaded_file in uploads.items():
+        if digest not in photo_jobs:
+            photo_jobs[digest] = submit_job(CURRENT_USER, "ocr", uploaded_file.name, uploaded_file.getvalue())
+        job_ids.append(photo_jobs[digest])
+
+    selected_job = None
+    if job_ids:
+        done_jobs = {job["id"]: job for job in show_job_status(job_ids, t("spinner_ocr")) if job["status"] == "done"}
+        if len(done_jobs) > 1:
+            selected_id = st.selectbox(t("job_pick_receipt"), list(done_jobs),
+                                       format_func=lambda job_id: done_jobs[job_id]["name"])
+            selected_job = done_jobs[selected_id]
+        elif done_jobs:
+            selected_job = next(iter(done_jobs.values()))
+    if selected_job and st.session_state.get("photo_multi_job") != selected_job["id"]:
+        # A different receipt is under review; drop the rows parsed from the previous one
+        st.session_state.pop("photo_multi", None)
+        st.session_state.photo_multi_job = selected_job["id"]
+
+    if selected_job:
+        extracted_text = selected_job["result"]["text"]
+        page_methods = selected_job["result"]["methods"]
+        if selected_job["result"]["cached"]:
+            st.caption(t("ocr_cached"))
+        if page_methods:
+            st.caption(" · ".join(t("pdf_page_method", page=n + 1, method=t(f"pdf_method_{method}"))
+                                  for n, method in enumerate(page_methods)))
+            if not extracted_text.strip():
+                st.warning("No text found in the PDF. It may be a scanned image or empty.")
 
         st.write(t("extracted_text"))
         st.code(extracted_text)
@@ -1130,15 +3235,13 @@ with tab1:
             # Save all checked rows
             if st.button(f"💾 {t('multi_save_all', count=int(edited_review['✓'].sum()))}",
                          type="primary"):
-                saved_count = 0
-                for _, row in edited_review.iterrows():
-                    if row['✓'] and row.get('merchant') and float(row.get('amount', 0)) > 0:
-                        amount_hkd = save_expense(
-                            str(row['date']), str(row['merchant']), str(row['category']),
-                            str(row['currency']), float(row['amount']),
-                            str(row['items']) or str(row['merchant']), "receipt_photo"
-                        )
-                        saved_count += 1
+                rows_to_save = [{
+                    "date": str(row['date']), "merchant": str(row['merchant']),
+                    "category": str(row['category']), "currency": str(row['currency']),
+                    "amount": float(row['amount']), "items": str(row['items']) or str(row['merchant']),
+                } for _, row in edited_review.iterrows()
+                  if row['✓'] and row.get('merchant') and float(row.get('amount', 0)) > 0]
+                saved_count = len(save_expenses_bulk(rows_to_save, "receipt_photo"))
                 if saved_count > 0:
                     st.success(t("multi_saved", count=saved_count))
                     del st.session_state.photo_multi
@@ -1146,24 +3249,28 @@ with tab1:
 
 # === Voice Input Tab ===
 with tab2:
-    if not HAS_WHISPER:
+    if not HAS_STT:
         st.warning("Voice input is not available in this deployment (Whisper not installed). Use Quick Form or Free Text instead.")
-    audio_bytes = st.audio_input(t("voice_label")) if HAS_WHISPER else None
+    audio_bytes = st.audio_input(t("voice_label")) if HAS_STT else None
+    voice_job = None
     if audio_bytes:
-        temp_path = "temp_audio.wav"
-        with open(temp_path, "wb") as f:
-            f.write(audio_bytes.getvalue())
-
-        with st.spinner(t("spinner_transcribe")):
-            result = whisper_model.transcribe(temp_path)
-            transcribed_text = result["text"].strip()
-
+        audio_data = audio_bytes.getvalue()
+        digest = hashlib.sha256(audio_data).hexdigest()
+        if st.session_state.get("voice_job_digest") != digest:
+            # New recording: transcribe it in the background and forget the previous review
+            st.session_state.voice_job_digest = digest
+            st.session_state.voice_job_id = submit_job(CURRENT_USER, "transcribe",
+                                                       audio_bytes.name or "recording.wav", audio_data)
+            st.session_state.pop("voice_parsed", None)
+        jobs = show_job_status([st.session_state.voice_job_id], t("spinner_transcribe"))
+        if jobs and jobs[0]["status"] == "done":
+            voice_job = jobs[0]
+
+    if voice_job:
+        transcribed_text = voice_job["result"]["text"]
         st.write(t("transcribed_text"))
         st.code(transcribed_text)
 
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-
         # Step 1: Parse — store result for review
         if st.button(f"🧠 {t('btn_parse_voice_review')}"):
             with st.spinner(t("spinner_ai")):
@@ -1206,24 +3313,51 @@ with tab2:
                     if v_merchant and v_amount > 0:
                         amount_hkd = save_expense(v_date.strftime('%Y-%m-%d'), v_merchant, v_category,
                                                   v_currency, v_amount, v_items or v_merchant, "voice")
-                        _log_stats("VOICE", f"{v_merchant} {v_amount} {v_currency}",
-                                   Expense(date=v_date.strftime('%Y-%m-%d'), merchant=v_merchant,
-                                           category=v_category, currency=v_currency, amount=v_amount, items=v_items or v_merchant))
-                        st.success(t("success_added", merchant=v_merchant, amount=v_amount,
-                                     currency=v_currency, amount_hkd=amount_hkd,
-                                     category=v_category, date=v_date.strftime('%Y-%m-%d')))
-                        del st.session_state.voice_parsed
+                        if amount_hkd is None:
+                            st.error(t("save_invalid"))
+                        else:
+                            _log_stats("VOICE", f"{v_merchant} {v_amount} {v_currency}",
+                                       Expense(date=v_date.strftime('%Y-%m-%d'), merchant=v_merchant,
+                                               category=v_category, currency=v_currency, amount=v_amount, items=v_items or v_merchant))
+                            st.success(t("success_added", merchant=v_merchant, amount=v_amount,
+                                         currency=v_currency, amount_hkd=amount_hkd,
+                                         category=v_category, date=v_date.strftime('%Y-%m-%d')))
+                            del st.session_state.voice_parsed
 
 # ========================================
-# Display All Expenses (filtered by current user)
+# Display All Expenses (filtered by current user, one page at a time)
 # ========================================
 st.divider()
 st.header(f"📊 {t('header_all_expenses')}")
 
-raw_df = pd.read_sql_query(
-    "SELECT id, date, merchant, category, currency, amount, amount_hkd, items, source FROM expenses WHERE username = ? ORDER BY date DESC",
-    conn, params=(CURRENT_USER,)
-)
+with st.expander(f"🔎 {t('filters')}"):
+    fcol1, fcol2 = st.columns(2)
+    with fcol1:
+        filter_dates = st.date_input(t("filter_date_range"), value=(), key="filter_dates")
+        filter_merchant = st.text_input(t("filter_merchant"), key="filter_merchant")
+    with fcol2:
+        filter_categories = st.multiselect(t("filter_categories"), CATEGORIES, key="filter_categories")
+        page_size = st.selectbox(
+            t("page_size"), PAGE_SIZE_OPTIONS,
+            index=PAGE_SIZE_OPTIONS.index(DEFAULT_PAGE_SIZE) if DEFAULT_PAGE_SIZE in PAGE_SIZE_OPTIONS else 0,
+            key="page_size",
+        )
+
+expense_filters = {
+    "date_from": filter_dates[0].strftime('%Y-%m-%d') if len(filter_dates) > 0 else None,
+    "date_to": filter_dates[1].strftime('%Y-%m-%d') if len(filter_dates) > 1 else None,
+    "categories": filter_categories,
+    "merchant": filter_merchant.strip(),
+}
+
+# Keyset pagination: remember the (date, id) cursor each visited page starts after
+filter_signature = hashlib.md5(json.dumps([expense_filters, page_size]).encode()).hexdigest()[:8]
+if st.session_state.get("expense_filter_signature") != filter_signature:
+    st.session_state.expense_filter_signature = filter_signature
+    st.session_state.expense_page_cursors = [None]
+page_cursors = st.session_state.expense_page_cursors
+
+raw_df, has_next_page = fetch_expense_page(CURRENT_USER, expense_filters, page_cursors[-1], page_size)
 
 if not raw_df.empty:
     display_df = raw_df.copy()
@@ -1232,7 +3366,8 @@ if not raw_df.empty:
 
     # Editable table — users can edit date, merchant, category, currency, amount, items directly
     edited_df = st.data_editor(
-        display_df.drop(columns=['id']),
+        # Keyed by id so the edited frame can be diffed against raw_df without relying on row order
+        display_df.set_index('id'),
         use_container_width=True,
         hide_index=True,
         disabled=['amount_hkd', 'source'],
@@ -1244,7 +3379,8 @@ if not raw_df.empty:
             'amount': st.column_config.NumberColumn('amount', min_value=0.0, step=1.0, format="%.2f"),
             'amount_hkd': st.column_config.NumberColumn('amount_hkd', format="%.2f"),
         },
-        key="expense_editor",
+        # Page-specific key so edits made on one page never leak onto another
+        key=f"expense_editor_{filter_signature}_{len(page_cursors)}",
     )
 
     # Action buttons side by side
@@ -1253,30 +3389,9 @@ if not raw_df.empty:
     # Save Changes button
     with btn_col1:
         if st.button(f"💾 {t('save_changes')}", type="primary"):
-            update_count = 0
-            for idx in range(len(edited_df)):
-                row_id = raw_df.iloc[idx]['id']
-                orig = raw_df.iloc[idx]
-                ed = edited_df.iloc[idx]
-                # Check if any editable field changed
-                changed = (
-                    str(ed['date']) != str(orig['date']) or
-                    str(ed['merchant']) != str(orig['merchant']) or
-                    str(ed['category']) != str(orig['category']) or
-                    str(ed['currency']) != str(orig['currency']) or
-                    float(ed['amount']) != float(orig['amount']) or
-                    str(ed['items']) != str(orig['items'])
-                )
-                if changed:
-                    new_amount_hkd = convert_to_hkd(float(ed['amount']), ed['currency'])
-                    conn.execute("""
-                        UPDATE expenses SET date=?, merchant=?, category=?, currency=?, amount=?, amount_hkd=?, items=?
-                        WHERE id=? AND username=?
-                    """, (ed['date'], ed['merchant'], ed['category'], ed['currency'],
-                          float(ed['amount']), new_amount_hkd, ed['items'], int(row_id), CURRENT_USER))
-                    update_count += 1
-            if update_count > 0:
-                _commit()
+            changed_df = find_changed_rows(raw_df, edited_df)
+            if not changed_df.empty:
+                update_count = update_expenses(CURRENT_USER, changed_df)
                 st.success(t("save_changes_success", count=update_count))
                 st.rerun()
             else:
@@ -1287,25 +3402,42 @@ if not raw_df.empty:
         if st.button(f"🗑️ {t('delete_selected')}", type="secondary"):
             selected_mask = edited_df[t('col_select')] == True
             if selected_mask.any():
-                ids_to_delete = raw_df.loc[selected_mask.values, 'id'].tolist()
-                placeholders = ','.join('?' * len(ids_to_delete))
-                conn.execute(f"DELETE FROM expenses WHERE id IN ({placeholders}) AND username = ?",
-                             ids_to_delete + [CURRENT_USER])
-                _commit()
-                st.success(t("delete_success", count=len(ids_to_delete)))
+                deleted_count = delete_expenses(CURRENT_USER, edited_df.index[selected_mask.values].tolist())
+                st.success(t("delete_success", count=deleted_count))
                 st.rerun()
             else:
                 st.warning(t("delete_none"))
 
-    # =============================
-    # Monthly Summary Dashboard
-    # =============================
+    # Pagination controls
+    pcol1, pcol2, pcol3 = st.columns([1, 2, 1])
+    with pcol1:
+        if st.button(f"◀ {t('page_prev')}", disabled=len(page_cursors) == 1):
+            page_cursors.pop()
+            st.rerun()
+    with pcol2:
+        st.caption(t("page_info", page=len(page_cursors),
+                     count=count_expenses(CURRENT_USER, expense_filters)))
+    with pcol3:
+        if st.button(f"{t('page_next')} ▶", disabled=not has_next_page):
+            last = raw_df.iloc[-1]
+            page_cursors.append((last['date'], int(last['id'])))
+            st.rerun()
+elif len(page_cursors) > 1:
+    # Everything on this page was deleted — start again from the first page
+    st.session_state.expense_page_cursors = [None]
+    st.rerun()
+elif any(expense_filters.values()):
+    st.info(t("no_expenses_filtered"))
+else:
+    st.info(t("no_expenses_yet"))
+
+# =============================
+# Monthly Summary Dashboard
+# =============================
+available_months = get_available_months(CURRENT_USER)
+if available_months:
     st.divider()
     st.header(f"📈 {t('header_monthly')}")
-
-    raw_df['date_parsed'] = pd.to_datetime(raw_df['date'], errors='coerce')
-    raw_df['year_month'] = raw_df['date_parsed'].dt.strftime('%Y-%m')
-    available_months = sorted(raw_df['year_month'].dropna().unique(), reverse=True)
     current_month = datetime.now().strftime('%Y-%m')
 
     selected_month = st.selectbox(
@@ -1314,14 +3446,14 @@ if not raw_df.empty:
         index=available_months.index(current_month) if current_month in available_months else 0,
     )
 
-    month_df = raw_df[raw_df['year_month'] == selected_month].copy()
+    summary = get_month_summary(CURRENT_USER, selected_month)
     month_label = datetime.strptime(selected_month, '%Y-%m').strftime('%B %Y')
 
-    if not month_df.empty:
-        total_hkd = month_df['amount_hkd'].sum()
-        num_transactions = len(month_df)
+    if summary["num_transactions"] > 0:
+        total_hkd = summary["total_hkd"]
+        num_transactions = summary["num_transactions"]
         avg_per_transaction = total_hkd / num_transactions if num_transactions > 0 else 0
-        num_days = month_df['date_parsed'].dt.date.nunique()
+        num_days = summary["num_days"]
         avg_per_day = total_hkd / num_days if num_days > 0 else 0
 
         col1, col2, col3, col4 = st.columns(4)
@@ -1331,31 +3463,33 @@ if not raw_df.empty:
         col4.metric(t("metric_avg_day"), f"${avg_per_day:,.2f}")
 
         st.subheader(t("sub_category", month=month_label))
-        cat_df = month_df.groupby('category')['amount_hkd'].sum().sort_values(ascending=True).reset_index()
+        cat_df = summary["by_category"].copy()
         cat_df.columns = [t('col_category'), t('col_amount_hkd')]
         st.bar_chart(cat_df, x=t('col_category'), y=t('col_amount_hkd'), horizontal=True)
 
         st.subheader(t("sub_daily", month=month_label))
-        daily_df = month_df.groupby(month_df['date_parsed'].dt.date)['amount_hkd'].sum().reset_index()
+        daily_df = summary["by_day"].copy()
         daily_df.columns = ['Date', t('col_amount_hkd')]
-        daily_df = daily_df.sort_values('Date')
         st.line_chart(daily_df, x='Date', y=t('col_amount_hkd'))
 
         st.subheader(t("sub_merchants", month=month_label))
-        merch_df = month_df.groupby('merchant')['amount_hkd'].agg(['sum', 'count']).sort_values('sum', ascending=False).head(10).reset_index()
+        merch_df = summary["by_merchant"].copy()
         merch_df.columns = [t('col_merchant'), t('col_total_hkd'), t('col_visits')]
         merch_df[t('col_total_hkd')] = merch_df[t('col_total_hkd')].apply(lambda x: f"${x:,.2f}")
         st.dataframe(merch_df, use_container_width=True, hide_index=True)
 
-        cur_df = month_df.groupby('currency')['amount_hkd'].sum().sort_values(ascending=False).reset_index()
+        cur_df = summary["by_currency"].copy()
         cur_df.columns = [t('col_currency'), t('col_total_hkd')]
         if len(cur_df) > 1:
             st.subheader(t("sub_currency", month=month_label))
             st.bar_chart(cur_df, x=t('col_currency'), y=t('col_total_hkd'))
     else:
         st.info(t("no_expenses_month", month=month_label))
-else:
-    st.info(t("no_expenses_yet"))
 
 # Footer
 st.caption(t("footer"))
+_log_run_timing("ui")
+
+# Models otherwise load when the Photo/Voice tab first needs them; start now that the page is painted
+if MODEL_PREWARM:
+    _start_model_prewarm()
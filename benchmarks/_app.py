@@ -0,0 +1,38 @@
+"""Load app.py's functions for the offline benchmarks.
+
+The app is a Streamlit script, so it is run once in a Streamlit test session (against a throwaway
+copy, so the real database and .env are untouched) and its module namespace is handed back."""
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+APP_PATH = Path(__file__).resolve().parent.parent / "app.py"
+
+
+def _run_app(app_path: str):
+    import streamlit as st
+
+    namespace = {"__name__": "__main__", "__file__": app_path}
+    with open(app_path, encoding="utf-8") as f:
+        exec(compile(f.read(), app_path, "exec"), namespace)
+    st.session_state.app_namespace = namespace
+
+
+def load_app(**settings: str) -> dict:
+    """Run the app with the given settings (as environment variables) and return its globals."""
+    from streamlit.testing.v1 import AppTest
+
+    workdir = tempfile.mkdtemp(prefix="expense-bench-")
+    app_copy = os.path.join(workdir, "app.py")
+    shutil.copy(APP_PATH, app_copy)
+    for key in ("TURSO_DATABASE_URL", "TURSO_AUTH_TOKEN", "OCR_CACHE_DIR", "MODEL_PREWARM"):
+        os.environ.pop(key, None)
+    os.environ.update({"LLM_BACKEND": "replay", "LLM_REPLAY_DIR": os.path.join(workdir, "llm_replay"), **settings})
+
+    at = AppTest.from_function(_run_app, args=(app_copy,), default_timeout=300)
+    at.session_state["logged_in_user"] = "benchmark"
+    at.run()
+    if at.exception:
+        raise RuntimeError(f"app.py failed to load: {[e.message for e in at.exception]}")
+    return at.session_state["app_namespace"]
@@ -0,0 +1,41 @@
+"""Scoring and resource helpers shared by the benchmarks."""
+import re
+import resource
+import sys
+
+_PUNCT_RE = re.compile(r'[^\w\s]')
+_TOKEN_RE = re.compile(r'[\u3400-\u9fff]|[^\s\u3400-\u9fff]+')
+
+
+def edit_distance(a, b) -> int:
+    """Levenshtein distance between two sequences (strings or token lists)."""
+    previous = list(range(len(b) + 1))
+    for i, item_a in enumerate(a, start=1):
+        current = [i]
+        for j, item_b in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (item_a != item_b)))
+        previous = current
+    return previous[-1]
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.casefold().split())
+
+
+def char_accuracy(truth: str, text: str) -> float:
+    """1 - character error rate against the ground truth, floored at 0."""
+    truth, text = normalize(truth), normalize(text)
+    return max(0.0, 1 - edit_distance(truth, text) / max(len(truth), 1))
+
+
+def word_error_rate(truth: str, text: str) -> float:
+    """Word error rate; each CJK character counts as a word, since Chinese has no spaces."""
+    truth_tokens = _TOKEN_RE.findall(_PUNCT_RE.sub('', truth.casefold()))
+    text_tokens = _TOKEN_RE.findall(_PUNCT_RE.sub('', text.casefold()))
+    return edit_distance(truth_tokens, text_tokens) / max(len(truth_tokens), 1)
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process so far, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
@@ -0,0 +1,141 @@
+"""Compare receipt OCR with and without preprocessing: latency and accuracy on a fixed sample set.
+
+The default samples are receipts rendered from known text, so accuracy is measured against ground
+truth (character accuracy, 1 - CER). They're generated the same way on every run: a phone photo of
+a receipt on a desk, a flat scan, and a small, already-tight crop. Real receipts can be used
+instead with --images DIR; a sidecar NAME.txt next to an image holds its ground truth, and images
+without one are scored by their similarity to the raw-path text.
+
+    python benchmarks/ocr_benchmark.py                 # both paths, generated samples
+    python benchmarks/ocr_benchmark.py --images ~/receipts --repeat 3
+    python benchmarks/ocr_benchmark.py --prep-only     # preprocessing cost only, no EasyOCR needed
+
+Settings such as OCR_MAX_SIDE or OCR_BINARIZE are read from the environment, as in the app.
+"""
+import argparse
+import difflib
+import io
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image, ImageDraw, ImageFont
+
+from _app import load_app
+from _metrics import char_accuracy, normalize
+
+RECEIPT_LINES = [
+    "STARBUCKS COFFEE", "Shop 12, Times Square", "2025-03-01 08:42",
+    "Caffe Latte Grande 42.00", "Blueberry Muffin 28.00", "Extra Shot 6.00",
+    "Subtotal 76.00", "Service 0.00", "TOTAL HK$ 76.00", "Octopus 76.00", "Thank you",
+]
+
+
+def _render_receipt(line_height: int, width: int) -> Image.Image:
+    font = ImageFont.load_default(size=int(line_height * 0.7))
+    receipt = Image.new("L", (width, line_height * (len(RECEIPT_LINES) + 2)), 245)
+    draw = ImageDraw.Draw(receipt)
+    for row, line in enumerate(RECEIPT_LINES, start=1):
+        draw.text((line_height // 2, row * line_height), line, fill=20, font=font)
+    return receipt
+
+
+def generated_samples() -> list[tuple[str, bytes, str]]:
+    """(name, JPEG bytes, ground truth) for the built-in samples."""
+    truth = "\n".join(RECEIPT_LINES)
+    samples = []
+
+    # Phone photo: large frame, receipt slightly rotated on a darker desk
+    receipt = _render_receipt(line_height=150, width=1800).rotate(2, expand=True, fillcolor=90)
+    photo = Image.new("L", (3024, 4032), 90)
+    photo.paste(receipt, ((photo.width - receipt.width) // 2, (photo.height - receipt.height) // 2))
+    samples.append(("phone_photo", photo))
+
+    # Flat scan: the paper fills the frame, text at scanner resolution
+    samples.append(("flat_scan", _render_receipt(line_height=90, width=1400)))
+
+    # Small crop: text already near the target height, nothing to remove
+    samples.append(("small_crop", _render_receipt(line_height=40, width=700)))
+
+    encoded = []
+    for name, image in samples:
+        buffer = io.BytesIO()
+        image.convert("RGB").save(buffer, format="JPEG", quality=90)
+        encoded.append((name, buffer.getvalue(), truth))
+    return encoded
+
+
+def image_samples(directory: Path) -> list[tuple[str, bytes, str | None]]:
+    samples = []
+    for path in sorted(directory.iterdir()):
+        if path.suffix.lower() in (".png", ".jpg", ".jpeg"):
+            truth_path = path.with_suffix(".txt")
+            truth = truth_path.read_text(encoding="utf-8") if truth_path.exists() else None
+            samples.append((path.name, path.read_bytes(), truth))
+    return samples
+
+
+def similarity(a: str, b: str) -> float:
+    return difflib.SequenceMatcher(None, normalize(a), normalize(b), autojunk=False).ratio()
+
+
+def timed(fn, repeat: int):
+    """(last result, median seconds) over repeat calls."""
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        seconds.append(time.perf_counter() - start)
+    return result, statistics.median(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--images", type=Path, help="directory of receipt images (default: generated samples)")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per image and path; the median is reported")
+    parser.add_argument("--prep-only", action="store_true", help="time preprocessing only, without OCR")
+    args = parser.parse_args()
+
+    app = load_app(OCR_PREPROCESS="1")
+    samples = image_samples(args.images) if args.images else generated_samples()
+    if not samples:
+        sys.exit("No images found")
+
+    if args.prep_only:
+        print(f"{'image':<16}{'input':>12}{'output':>12}{'prep':>9}")
+        for name, data, _ in samples:
+            pixels, seconds = timed(lambda: app["preprocess_receipt_image"](data), args.repeat)
+            size = Image.open(io.BytesIO(data)).size
+            print(f"{name:<16}{f'{size[0]}x{size[1]}':>12}{f'{pixels.shape[1]}x{pixels.shape[0]}':>12}"
+                  f"{seconds:>8.3f}s")
+        return
+
+    if not app["HAS_OCR"]:
+        sys.exit("EasyOCR is not installed; run with --prep-only or install easyocr")
+    app["load_ocr_reader"]()  # Model load isn't part of either path's latency
+
+    print(f"{'image':<16}{'raw':>9}{'prepped':>9}{'speedup':>9}{'raw acc':>9}{'prep acc':>10}")
+    totals = {"raw": 0.0, "prepped": 0.0}
+    accuracies = {"raw": [], "prepped": []}
+    for name, data, truth in samples:
+        raw_text, raw_seconds = timed(lambda: app["_ocr_raw"](Image.open(io.BytesIO(data))), args.repeat)
+        prep_text, prep_seconds = timed(lambda: app["ocr_image"](data), args.repeat)
+        if truth is not None:
+            raw_acc, prep_acc = char_accuracy(truth, raw_text), char_accuracy(truth, prep_text)
+        else:
+            raw_acc, prep_acc = 1.0, similarity(raw_text, prep_text)
+        totals["raw"] += raw_seconds
+        totals["prepped"] += prep_seconds
+        accuracies["raw"].append(raw_acc)
+        accuracies["prepped"].append(prep_acc)
+        print(f"{name:<16}{raw_seconds:>8.2f}s{prep_seconds:>8.2f}s{raw_seconds / max(prep_seconds, 1e-6):>8.1f}x"
+              f"{raw_acc:>9.1%}{prep_acc:>10.1%}")
+
+    print(f"{'total':<16}{totals['raw']:>8.2f}s{totals['prepped']:>8.2f}s"
+          f"{totals['raw'] / max(totals['prepped'], 1e-6):>8.1f}x"
+          f"{statistics.mean(accuracies['raw']):>9.1%}{statistics.mean(accuracies['prepped']):>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Compare speech-to-text backends and precisions on the same clips: speed, accuracy and memory.
+
+Each backend/precision is loaded in its own Python process, so every peak-memory figure covers
+one model only. Reported per option:
+- load time
+- real-time factor (transcription seconds per second of audio; lower is faster)
+- WER against a NAME.txt sidecar when there is one
+- process memory before the model loaded, and its peak after transcribing every clip
+
+    python benchmarks/stt_benchmark.py clips/*.wav
+    python benchmarks/stt_benchmark.py clips/ --options faster-whisper:int8 whisper:float32 --model-size small
+
+Clips can be any format decode_audio handles (WAV natively, anything else via ffmpeg).
+"""
+import argparse
+import importlib.util
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from _metrics import peak_rss_mb, word_error_rate
+
+AUDIO_SUFFIXES = {".wav", ".mp3", ".m4a", ".ogg", ".webm", ".flac"}
+
+
+def default_options() -> list[str]:
+    options = []
+    if importlib.util.find_spec("faster_whisper"):
+        options += ["faster-whisper:int8", "faster-whisper:float32"]
+    if importlib.util.find_spec("whisper"):
+        options += ["whisper:float32", "whisper:int8"]
+    return options
+
+
+def collect_clips(paths: list[Path]) -> list[Path]:
+    clips = []
+    for path in paths:
+        if path.is_dir():
+            clips += sorted(p for p in path.iterdir() if p.suffix.lower() in AUDIO_SUFFIXES)
+        else:
+            clips.append(path)
+    return clips
+
+
+def run_worker(option: str, clips: list[str], model_size: str, language: str | None, threads: int) -> dict:
+    """Load one backend in this process, transcribe every clip and report timings and memory."""
+    from _app import load_app
+
+    backend, _, precision = option.partition(":")
+    app = load_app()
+    baseline_mb = peak_rss_mb()
+    start = time.perf_counter()
+    stt = app["load_stt_backend"](backend, model_size, precision or "auto", language, threads)
+    load_seconds = time.perf_counter() - start
+
+    results = []
+    for clip in clips:
+        audio = app["decode_audio"](Path(clip).read_bytes())
+        start = time.perf_counter()
+        text = stt.transcribe(audio)
+        seconds = time.perf_counter() - start
+        truth_path = Path(clip).with_suffix(".txt")
+        results.append({
+            "clip": Path(clip).name,
+            "duration": audio.size / app["WHISPER_SAMPLE_RATE"],
+            "seconds": seconds,
+            "wer": word_error_rate(truth_path.read_text(encoding="utf-8"), text) if truth_path.exists() else None,
+        })
+    return {"option": stt.describe(), "load_seconds": load_seconds, "baseline_mb": baseline_mb,
+            "peak_mb": peak_rss_mb(), "clips": results}
+
+
+def run_option(option: str, clips: list[Path], args) -> dict | None:
+    command = [sys.executable, __file__, "--worker", option, "--model-size", args.model_size,
+               "--threads", str(args.threads), *map(str, clips)]
+    if args.language:
+        command += ["--language", args.language]
+    proc = subprocess.run(command, capture_output=True, text=True)
+    report = next((line for line in reversed(proc.stdout.splitlines()) if line.startswith("{")), None)
+    if proc.returncode != 0 or report is None:
+        print(f"{option}: failed\n{proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else ''}")
+        return None
+    return json.loads(report)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("clips", nargs="+", type=Path, help="audio files or directories of clips")
+    parser.add_argument("--options", nargs="+", help="backend:precision pairs (default: every installed backend)")
+    parser.add_argument("--model-size", default="base")
+    parser.add_argument("--language", help='"en" or "zh"; omitted lets the model detect it')
+    parser.add_argument("--threads", type=int, default=0, help="CPU threads (0 keeps the runtime's default)")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    clips = collect_clips(args.clips)
+    if not clips:
+        sys.exit("No clips found")
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, [str(clip) for clip in clips], args.model_size,
+                                    args.language, args.threads)))
+        return
+
+    options = args.options or default_options()
+    if not options:
+        sys.exit("Neither faster-whisper nor openai-whisper is installed")
+
+    print(f"{len(clips)} clip(s), {sum(1 for c in clips if c.with_suffix('.txt').exists())} with ground truth, "
+          f"model size {args.model_size}\n")
+    print(f"{'option':<32}{'load':>8}{'RTF':>8}{'WER':>8}{'base MB':>9}{'peak MB':>9}")
+    for option in options:
+        report = run_option(option, clips, args)
+        if report is None:
+            continue
+        duration = sum(clip["duration"] for clip in report["clips"])
+        seconds = sum(clip["seconds"] for clip in report["clips"])
+        wers = [clip["wer"] for clip in report["clips"] if clip["wer"] is not None]
+        wer = f"{statistics.mean(wers):.1%}" if wers else "-"
+        print(f"{report['option']:<32}{report['load_seconds']:>7.1f}s{seconds / max(duration, 1e-6):>8.2f}"
+              f"{wer:>8}{report['baseline_mb']:>9.0f}{report['peak_mb']:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Run app.py inside a Streamlit test session against a throwaway copy and database."""
+import json
+import shutil
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+APP_PATH = Path(__file__).resolve().parent.parent / "app.py"
+
+
+def _run_in_app(app_path: str, check):
+    """Script body for AppTest: execute the app, then call check(app globals) in the same run."""
+    import streamlit as st
+
+    namespace = {"__name__": "__main__", "__file__": app_path}
+    with open(app_path, encoding="utf-8") as f:
+        exec(compile(f.read(), app_path, "exec"), namespace)
+    st.session_state.checked = check(namespace)
+
+
+@pytest.fixture
+def run_in_app(tmp_path, monkeypatch):
+    """run_in_app(check, username) runs the app for that user and returns check(app globals).
+
+    Every call is a fresh script run against the same database and LLM recordings, so settings
+    changed with monkeypatch.setenv in between take effect; no network or API key is needed."""
+    app_copy = tmp_path / "app.py"
+    shutil.copy(APP_PATH, app_copy)
+    for key in ("TURSO_DATABASE_URL", "TURSO_AUTH_TOKEN", "XAI_API_KEY", "LLM_RECORD", "OCR_CACHE_DIR",
+                "MODEL_PREWARM"):
+        monkeypatch.delenv(key, raising=False)
+    monkeypatch.setenv("LLM_BACKEND", "replay")
+    monkeypatch.setenv("LLM_REPLAY_DIR", str(tmp_path / "llm_replay"))
+    # Process-wide resources (the connection pool, indexes, clients) would still point at the
+    # previous test's database
+    st.cache_resource.clear()
+    st.cache_data.clear()
+
+    def run(check, username: str = "tester"):
+        at = AppTest.from_function(_run_in_app, args=(str(app_copy), check), default_timeout=120)
+        at.session_state["logged_in_user"] = username
+        at.run()
+        assert not at.exception, [e.message for e in at.exception]
+        return at.session_state["checked"]
+
+    return run
+
+
+@pytest.fixture
+def evaluate_in_app(run_in_app):
+    """evaluate(calls) returns [function(argument)] for [(function name, argument)], models as dicts."""
+
+    def evaluate(calls: list) -> list:
+        def check(app):
+            results = []
+            for name, arg in calls:
+                value = app[name](arg)
+                results.append(value.model_dump() if hasattr(value, "model_dump") else value)
+            return results
+
+        return run_in_app(check, "golden")
+
+    return evaluate
+
+
+@pytest.fixture
+def set_today():
+    """set_today(app, "YYYY-MM-DD") makes the app's datetime.now() return noon on that day for the
+    rest of the script run."""
+
+    def freeze(app: dict, day: str):
+        frozen = datetime.strptime(day, "%Y-%m-%d").replace(hour=12)
+
+        class FrozenDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return frozen
+
+        app["datetime"] = FrozenDatetime
+
+    return freeze
+
+
+class _ChatCompletions(BaseHTTPRequestHandler):
+    """Minimal OpenAI-compatible chat endpoint; the server's reply(prompt) gives the message content,
+    or None for an HTTP 500."""
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = request["messages"][-1]["content"]
+        server = self.server
+        with server.lock:
+            server.prompts.append(prompt)
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            content = server.reply(prompt)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+        if content is None:
+            body, status = b'{"error": {"message": "stub failure"}}', 500
+        else:
+            body, status = json.dumps({
+                "id": "stub", "object": "chat.completion", "created": 0, "model": request["model"],
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+            }).encode(), 200
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_llm_server(monkeypatch):
+    """A local OpenAI-compatible server the app is pointed at (LLM_BACKEND=openai-compatible).
+
+    Set server.reply to a function of the prompt; server.prompts lists every request received and
+    server.max_in_flight the most requests handled at once."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ChatCompletions)
+    server.reply = lambda prompt: None
+    server.prompts, server.lock, server.in_flight, server.max_in_flight = [], threading.Lock(), 0, 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("LLM_BACKEND", "openai-compatible")
+    monkeypatch.setenv("LLM_BASE_URL", f"http://127.0.0.1:{server.server_port}/v1")
+    yield server
+    server.shutdown()
@@ -0,0 +1,60 @@
+"""Category resolution: the user's keyword rules, the per-merchant history index and how they rank."""
+
+
+def test_merchant_index_tracks_history(run_in_app):
+    def check(app):
+        index = app["MerchantIndex"]([("Cafe Mio", "Food", "HKD", 40.0), ("cafe mio!", "Food", "HKD", 38.0),
+                                      ("Cafe Mio", "Shopping", "USD", 90.0), ("7-Eleven", "Groceries", "HKD", 12.0)])
+        before = index.lookup("CAFE MIO")
+        index.remove("Cafe Mio", "Shopping", "USD", 90.0)
+        index.add("Cafe Mio", "Food", "HKD", 41.0)
+        after = index.lookup("cafe mio")
+        index.remove("7-Eleven", "Groceries", "HKD", 12.0)
+        return (before, after, index.lookup("7-Eleven"),
+                index.find_in_text("two lattes at cafe mio this morning"), index.find_in_text("cafe mioo"))
+
+    before, after, removed, found, partial_word = run_in_app(check)
+    assert before == {"merchant": "Cafe Mio", "category": "Food", "currency": "HKD", "amount": 40.0}
+    assert after == {"merchant": "Cafe Mio", "category": "Food", "currency": "HKD", "amount": 40.0}
+    assert removed is None
+    assert found == "Cafe Mio"
+    assert partial_word is None
+
+
+def test_history_beats_builtin_keywords_but_not_user_rules(run_in_app):
+    def check(app):
+        app["save_expenses_bulk"]([{"date": "2025-03-01", "merchant": "Cafe Mio", "category": "Shopping",
+                                    "currency": "USD", "amount": 9, "items": "beans"}], "test")
+        from_history = app["try_local_parse"]("Cafe Mio 40").model_dump()
+        app["add_user_keyword"]("tester", "mio", "Entertainment")
+        with_rule = app["try_local_parse"]("Cafe Mio 40").model_dump()
+        return from_history, with_rule
+
+    from_history, with_rule = run_in_app(check)
+    # "cafe" is a built-in Food keyword; the user's history at this merchant overrides it
+    assert (from_history["category"], from_history["currency"]) == ("Shopping", "USD")
+    assert (with_rule["category"], with_rule["currency"]) == ("Entertainment", "USD")
+
+
+def test_user_keyword_rules_override_builtin_keywords(run_in_app):
+    def check(app):
+        guess = app["guess_category"]
+        results = {"builtin": guess("Starbucks coffee")}
+        app["add_user_keyword"]("tester", "  Coffee ", "Entertainment")
+        app["add_user_keyword"]("tester", "coffee beans", "Groceries")
+        app["add_user_keyword"]("someone_else", "starbucks", "Health")
+        results["override"] = guess("Starbucks COFFEE")
+        results["longest"] = guess("coffee beans 1kg")
+        app["add_user_keyword"]("tester", "coffee", "Shopping")  # Same keyword again: replaces the category
+        results["replaced"] = guess("coffee")
+        results["stored"] = [(keyword, category) for _, keyword, category in app["get_user_keywords"]("tester")]
+        for keyword_id, keyword, _ in app["get_user_keywords"]("tester"):
+            if keyword == "coffee":
+                app["delete_user_keyword"]("tester", keyword_id)
+        results["deleted"] = guess("Starbucks coffee")
+        return results
+
+    assert run_in_app(check) == {
+        "builtin": "Food", "override": "Entertainment", "longest": "Groceries", "replaced": "Shopping",
+        "stored": [("coffee", "Shopping"), ("coffee beans", "Groceries")], "deleted": "Food",
+    }
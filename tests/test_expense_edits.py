@@ -0,0 +1,43 @@
+"""Saving edits from the expenses table: the diff against the page, and the batched update."""
+
+
+def test_only_edited_rows_are_written(run_in_app):
+    def check(app):
+        with app["db_pool"].transaction() as conn:
+            conn.executemany("INSERT INTO expenses (username, date, merchant, category, currency, amount, "
+                             "amount_hkd, items, source) VALUES (?, ?, ?, 'Food', 'HKD', ?, ?, ?, 'test')",
+                             [("tester", "2025-03-01", "Cafe Mio", 40, 40, "latte"),
+                              ("tester", "2025-03-02", "MTR", 12, 12, None),
+                              ("tester", "2025-03-03", "Uniqlo", 99, 99, "socks"),
+                              ("someone_else", "2025-03-03", "Uniqlo", 5, 5, "socks")])
+        page_df, _ = app["fetch_expense_page"]("tester", {}, None, 10)
+        edited_df = page_df.set_index("id")
+        # The editor hands back equal values in other types: these rows must not count as edits
+        edited_df["amount"] = edited_df["amount"].astype(object)
+        edited_df.loc[2, ["amount", "items"]] = ["12.0", ""]
+        edited_df.loc[1, "items"] = "latte"
+        # Real edits
+        edited_df.loc[3, ["merchant", "date", "currency"]] = ["UNIQLO Central", "2025/3/4", "USD"]
+        edited_df.loc[1, "amount"] = 45.5
+
+        changed_df = app["find_changed_rows"](page_df, edited_df)
+        changed_ids = sorted(changed_df.index.tolist())
+        # A row of another user smuggled into the batch is left alone
+        changed_df.loc[4] = changed_df.loc[3]
+        app["update_expenses"]("tester", changed_df)
+        with app["db_pool"].connection() as conn:
+            rows = conn.execute("SELECT id, date, merchant, currency, amount, amount_hkd FROM expenses "
+                                "ORDER BY id").fetchall()
+        index = app["get_merchant_index"]("tester")
+        return (changed_ids, rows, app["convert_to_hkd"](99, "USD", "2025-03-04"),
+                index.lookup("Uniqlo"), index.lookup("uniqlo central"), index.lookup("Cafe Mio")["amount"])
+
+    changed_ids, rows, usd_in_hkd, old_name, new_name, cafe_amount = run_in_app(check)
+    assert changed_ids == [1, 3]
+    assert rows == [(1, "2025-03-01", "Cafe Mio", "HKD", 45.5, 45.5),
+                    (2, "2025-03-02", "MTR", "HKD", 12.0, 12.0),
+                    (3, "2025-03-04", "UNIQLO Central", "USD", 99.0, usd_in_hkd),
+                    (4, "2025-03-03", "Uniqlo", "HKD", 5.0, 5.0)]
+    assert old_name is None
+    assert new_name["currency"] == "USD"
+    assert cafe_amount == 45.5
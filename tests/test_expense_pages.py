@@ -0,0 +1,62 @@
+"""Keyset pagination and filters of the expenses table."""
+
+ROWS = [  # (username, date, merchant, category)
+    ("tester", "2025-03-01", "Cafe Mio", "Food"), ("tester", "2025-03-03", "MTR", "Transport"),
+    ("tester", "2025-03-03", "100% Juice", "Food"), ("tester", None, "Undated", "Other"),
+    ("tester", "2025-03-02", "Juice_Bar", "Food"), ("tester", "2025-03-03", "Cafe Mio", "Food"),
+    ("tester", None, "Undated 2", "Food"), ("tester", "2025-02-28", "Uniqlo", "Shopping"),
+    ("someone_else", "2025-03-02", "Cafe Mio", "Food"),
+]
+
+
+def _walk_pages(filters: dict, page_size: int):
+    """[page ids] for every page, following the cursor the way the Next button does."""
+
+    def check(app):
+        with app["db_pool"].transaction() as conn:
+            conn.executemany("INSERT INTO expenses (username, date, merchant, category, currency, amount, "
+                             "amount_hkd, items, source) VALUES (?, ?, ?, ?, 'HKD', 1, 1, '', 'test')", ROWS)
+        pages, cursor = [], None
+        while True:
+            page_df, has_next = app["fetch_expense_page"]("tester", filters, cursor, page_size)
+            pages.append(page_df["id"].tolist())
+            if not has_next:
+                break
+            last = page_df.iloc[-1]
+            cursor = (last["date"], int(last["id"]))
+        return pages, app["count_expenses"]("tester", filters)
+
+    return check
+
+
+def _expected_ids(keep) -> list[int]:
+    """Ids (1-based insertion order) of the matching rows, by date then id descending, undated last."""
+    matching = [(row_id, date) for row_id, (user, date, merchant, category) in enumerate(ROWS, start=1)
+                if user == "tester" and keep(date, merchant, category)]
+    dated = sorted((row for row in matching if row[1] is not None), key=lambda row: (row[1], row[0]), reverse=True)
+    undated = sorted((row for row in matching if row[1] is None), reverse=True)
+    return [row_id for row_id, _ in dated + undated]
+
+
+def test_pages_cover_every_row_once_in_order(run_in_app):
+    pages, count = run_in_app(_walk_pages({}, page_size=3))
+    assert [len(page) for page in pages] == [3, 3, 2]
+    assert sum(pages, []) == _expected_ids(lambda date, merchant, category: True)
+    assert count == 8
+
+
+def test_filters_narrow_pages_and_count(run_in_app):
+    filters = {"date_from": "2025-03-01", "date_to": "2025-03-03", "categories": ["Food"], "merchant": "juice"}
+    pages, count = run_in_app(_walk_pages(filters, page_size=1))
+    assert sum(pages, []) == _expected_ids(
+        lambda date, merchant, category: date is not None and "2025-03-01" <= date <= "2025-03-03"
+        and category == "Food" and "juice" in merchant.lower())
+    assert count == 2
+
+
+def test_like_wildcards_in_the_merchant_filter_are_literal(run_in_app):
+    assert run_in_app(_walk_pages({"merchant": "%"}, page_size=10)) == ([[3]], 1)
+
+
+def test_underscore_in_the_merchant_filter_is_literal(run_in_app):
+    assert run_in_app(_walk_pages({"merchant": "_"}, page_size=10)) == ([[5]], 1)
@@ -0,0 +1,84 @@
+"""Historical FX rates: CSV backfill, per-date conversion (scalar and vectorized) and recomputation."""
+import pandas as pd
+import pytest
+
+HISTORY_CSV = b"""Date,Currency,Rate
+2025-03-01,USD,0.125
+2025-03-10, usd ,0.130
+2025/03/05,JPY,20
+not a date,USD,0.2
+2025-03-06,USD,-1
+2025-03-07,US,0.2
+"""
+
+# (currency, date, HKD for 10 units) with today 2025-03-20 and the fallback sidebar rates (USD 0.128)
+CASES = [
+    ("USD", "2025-02-01", 80.0),           # before the history starts: earliest known rate
+    ("USD", "2025-03-05", 80.0),           # latest rate on or before the date
+    ("USD", "2025-03-10", 76.92),
+    ("USD", "2025-03-10 08:30", 76.92),
+    ("USD", "2025-03-19", 76.92),
+    ("USD", "2025-03-20", 78.12),          # today and later: the sidebar rate
+    ("USD", "2025-04-01", 78.12),
+    ("USD", None, 78.12),                  # undated: the sidebar rate
+    ("USD", "", 78.12),
+    ("USD", "  ", 78.12),
+    ("usd", "2025-03-05", 80.0),
+    ("JPY", "2025-03-06", 0.5),
+    ("GBP", "2025-03-05", 100.0),          # no history for the currency: the sidebar rate
+    ("HKD", "2025-03-05", 10.0),
+    ("XYZ", "2025-03-05", 10.0),           # unknown currency: left as is
+]
+
+
+@pytest.fixture
+def fx_app(run_in_app, set_today):
+    """run(check) with today frozen at 2025-03-20, fallback sidebar rates and HISTORY_CSV imported."""
+
+    def run(check):
+        def with_history(app):
+            set_today(app, "2025-03-20")
+            app["st"].session_state.fx_rates = dict(app["FALLBACK_FX_RATES"])
+            imported = app["import_fx_rates_csv"](HISTORY_CSV)
+            return imported, check(app)
+
+        return run_in_app(with_history)
+
+    return run
+
+
+def test_csv_import_skips_invalid_rows(fx_app):
+    (imported, skipped), stored = fx_app(lambda app: len(app["get_fx_store"]()))
+    assert (imported, skipped, stored) == (3, 3, 3)
+
+
+def test_scalar_and_vectorized_conversion_use_the_rate_for_the_date(fx_app):
+    def check(app):
+        scalar = [app["convert_to_hkd"](10, currency, date) for currency, date, _ in CASES]
+        vectorized = app["convert_series_to_hkd"](
+            pd.Series([10.0] * len(CASES)), pd.Series([currency for currency, _, _ in CASES]),
+            pd.Series([date for _, date, _ in CASES], dtype=object)).tolist()
+        return scalar, vectorized
+
+    _, (scalar, vectorized) = fx_app(check)
+    expected = [hkd for _, _, hkd in CASES]
+    assert scalar == expected
+    assert vectorized == expected
+
+
+def test_recompute_rewrites_only_stale_amounts(fx_app):
+    def check(app):
+        with app["db_pool"].transaction() as conn:
+            conn.executemany("INSERT INTO expenses (username, date, merchant, category, currency, amount, "
+                             "amount_hkd, items, source) VALUES (?, ?, 'M', 'Food', ?, 10, ?, '', 'test')",
+                             [("tester", "2025-03-05", "USD", 78.12), ("tester", None, "USD", None),
+                              ("tester", "2025-03-05", "HKD", 10.0), ("someone_else", "2025-03-05", "USD", 1.0)])
+        changed = app["recompute_amounts_hkd"]("tester")
+        unchanged = app["recompute_amounts_hkd"]("tester")
+        with app["db_pool"].connection() as conn:
+            rows = conn.execute("SELECT username, amount_hkd FROM expenses ORDER BY id").fetchall()
+        return changed, unchanged, rows
+
+    _, (changed, unchanged, rows) = fx_app(check)
+    assert (changed, unchanged) == (2, 0)
+    assert rows == [("tester", 80.0), ("tester", 78.12), ("tester", 10.0), ("someone_else", 1.0)]
@@ -0,0 +1,63 @@
+"""JobQueue: running handlers in the background, and failing jobs whose owner is gone."""
+import os
+import socket
+import subprocess
+import sys
+import time
+
+
+def test_jobs_report_progress_results_and_errors(run_in_app):
+    def handler(payload, name, username, report_progress):
+        report_progress(0.5)
+        if payload == b"bad":
+            raise ValueError("unreadable receipt")
+        return {"text": payload.decode(), "name": name, "username": username}
+
+    def check(app):
+        queue = app["JobQueue"]({"ocr": 2})
+        ids = [queue.submit("tester", "ocr", "good.jpg", b"receipt text", handler),
+               queue.submit("tester", "ocr", "bad.jpg", b"bad", handler)]
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            jobs = app["get_jobs"]("tester", ids)
+            if all(job["status"] not in app["JOB_ACTIVE_STATUSES"] for job in jobs):
+                break
+            time.sleep(0.05)
+        return jobs, app["get_jobs"]("someone_else", ids)
+
+    (good, bad), other_user = run_in_app(check)
+    assert (good["status"], good["progress"], good["result"]) == (
+        "done", 1.0, {"text": "receipt text", "name": "good.jpg", "username": "tester"})
+    assert (bad["status"], bad["progress"], bad["error"]) == ("failed", 0.5, "unreadable receipt")
+    assert other_user == []
+
+
+def test_only_jobs_of_exited_local_processes_are_failed(run_in_app):
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    host = socket.gethostname()
+    jobs = [  # (id, owner, status, hours since last update)
+        ("exited", f"{host}:{exited.pid}", "running", 0),
+        ("alive", f"{host}:{os.getppid()}", "queued", 0),
+        ("other_host", f"elsewhere:{exited.pid}", "running", 0),
+        ("unowned", None, "queued", 0),
+        ("abandoned", f"elsewhere:{exited.pid}", "running", 48),
+        ("old_done", f"elsewhere:{exited.pid}", "done", 48),
+    ]
+
+    def check(app):
+        with app["db_pool"].transaction() as conn:
+            conn.executemany("INSERT INTO jobs (id, username, kind, name, status, owner, updated_at) "
+                             "VALUES (?, 'tester', 'ocr', 'r.jpg', ?, ?, datetime('now', ?))",
+                             [(job_id, status, owner, f"-{hours} hours") for job_id, owner, status, hours in jobs])
+        app["JobQueue"]({"ocr": 1})
+        with app["db_pool"].connection() as conn:
+            return dict(conn.execute("SELECT id, status || ': ' || COALESCE(error, '') FROM jobs").fetchall())
+
+    assert run_in_app(check) == {
+        "exited": "failed: Interrupted by a restart",
+        "alive": "queued: ",
+        "other_host": "running: ",
+        "unowned": "queued: ",
+        "abandoned": "failed: Abandoned",
+    }
@@ -0,0 +1,109 @@
+"""Multi-expense parsing in chunks: packing, concurrent calls with retries, and merging the results."""
+import json
+import re
+import threading
+import time
+
+PAGES = [[f"Shop {page}{line} {10 * page + line}.50" for line in range(1, 4)] for page in range(1, 5)]
+STATEMENT = "\n\n".join(f"--- Page {page} ---\nStatement of account, page {page} of 4\n" + "\n".join(lines)
+                        for page, lines in enumerate(PAGES, start=1))
+
+
+def _expense(merchant, amount, date="2025-03-01"):
+    return {"date": date, "merchant": merchant, "category": "Other", "currency": "HKD", "amount": amount,
+            "items": merchant}
+
+
+def _reply_with_shops(prompt):
+    """The expenses a perfect model would find in the prompt."""
+    text = prompt.split("Text:", 1)[1]
+    return json.dumps({"expenses": [_expense(f"Shop {shop}", float(amount))
+                                    for shop, amount in re.findall(r"Shop (\d+) ([\d.]+)", text)]})
+
+
+def test_chunks_keep_pages_whole_within_the_budget(run_in_app):
+    def check(app):
+        budget = app["_estimate_tokens"](STATEMENT) // 3
+        long_section = "\n".join(f"Coffee shop number {n} 12.00" for n in range(60))
+        return (budget, [(chunk, app["_estimate_tokens"](chunk)) for chunk in app["split_into_chunks"](STATEMENT, budget)],
+                app["split_into_chunks"](long_section, 40), app["_estimate_tokens"])
+
+    budget, chunks, long_chunks, estimate = run_in_app(check)
+    assert len(chunks) > 1
+    assert all(tokens <= budget for _, tokens in chunks)
+    # Every line arrives once, in order, and no page is split across chunks
+    assert "\n\n".join(chunk for chunk, _ in chunks) == STATEMENT
+    assert all(chunk.startswith("--- Page") for chunk, _ in chunks)
+    # A section over the budget is cut between lines
+    assert len(long_chunks) > 1 and all(estimate(chunk) <= 40 for chunk in long_chunks)
+    assert "\n".join(long_chunks).splitlines() == [f"Coffee shop number {n} 12.00" for n in range(60)]
+
+
+def test_merge_drops_overlap_between_chunks_but_keeps_repeats_within_one(run_in_app):
+    coffee, taxi, lunch = _expense("Cafe", 40.0), _expense("Taxi", 80.0), _expense("Lunch", 60.0)
+    chunk_results = [[coffee, coffee, taxi],
+                     [dict(coffee, merchant="CAFE "), taxi, lunch],  # overlap with the first chunk
+                     [coffee, coffee, coffee]]
+
+    merged = run_in_app(lambda app: app["merge_chunk_expenses"](chunk_results))
+    assert merged == [coffee, coffee, taxi, lunch, coffee]
+
+
+def test_chunks_are_parsed_concurrently_and_retried(run_in_app, stub_llm_server, monkeypatch):
+    monkeypatch.setenv("LLM_INPUT_TOKEN_BUDGET", "40")  # one page per chunk
+    monkeypatch.setenv("LLM_MAX_RETRIES", "3")
+    monkeypatch.setenv("LLM_CONCURRENCY", "4")
+    failures_left = {"Shop 21": 2}  # The page 2 chunk fails twice before it succeeds
+    lock = threading.Lock()
+
+    def reply(prompt):
+        time.sleep(0.3)
+        with lock:
+            for marker, left in failures_left.items():
+                if marker in prompt and left:
+                    failures_left[marker] -= 1
+                    return None
+        return _reply_with_shops(prompt)
+
+    stub_llm_server.reply = reply
+
+    def check(app):
+        app["LLM_RETRY_BASE_SECONDS"] = 0.01
+        chunks = app["split_into_chunks"](STATEMENT)
+        first = app["parse_multi_with_api"](STATEMENT)
+        calls_before_cached = len(stub_llm_server.prompts)
+        second = app["parse_multi_with_api"](STATEMENT)
+        return len(chunks), first, second, calls_before_cached, app["st"].session_state.llm_metrics
+
+    chunk_count, first, second, calls, metrics = run_in_app(check)
+    assert chunk_count == 4
+    assert [(e["merchant"], e["amount"]) for e in first] == [
+        (line.rsplit(" ", 1)[0], float(line.rsplit(" ", 1)[1])) for lines in PAGES for line in lines]
+    assert second == first
+    # One call per chunk plus the two retries (the HTTP client doesn't retry on top), all overlapping
+    assert calls == len(stub_llm_server.prompts) == 4 + 2
+    assert stub_llm_server.max_in_flight > 1
+    assert (metrics["calls"], metrics["failures"]) == (6, 2)
+
+
+def test_failed_chunks_are_retried_on_the_next_parse_only(run_in_app, stub_llm_server, monkeypatch):
+    monkeypatch.setenv("LLM_INPUT_TOKEN_BUDGET", "40")
+    monkeypatch.setenv("LLM_MAX_RETRIES", "2")
+    healthy = {"value": False}
+    stub_llm_server.reply = lambda prompt: (
+        _reply_with_shops(prompt) if healthy["value"] or "Shop 31" not in prompt else None)
+
+    def check(app):
+        app["LLM_RETRY_BASE_SECONDS"] = 0.01
+        partial = app["parse_multi_with_api"](STATEMENT)
+        calls_after_partial = len(stub_llm_server.prompts)
+        healthy["value"] = True
+        complete = app["parse_multi_with_api"](STATEMENT)
+        return partial, calls_after_partial, complete, stub_llm_server.prompts[calls_after_partial:]
+
+    partial, calls_after_partial, complete, retried_prompts = run_in_app(check)
+    assert [e["merchant"] for e in partial] == [f"Shop {n}" for n in (11, 12, 13, 21, 22, 23, 41, 42, 43)]
+    assert calls_after_partial == 3 + 2  # the failing chunk used all LLM_MAX_RETRIES attempts
+    # The good chunks were cached; only the failed one is sent again
+    assert len(retried_prompts) == 1 and "Shop 31" in retried_prompts[0]
+    assert len(complete) == 12
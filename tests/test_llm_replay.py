@@ -0,0 +1,34 @@
+"""LLM_RECORD / LLM_BACKEND=replay: a recording keeps answering on later days, with no model calls."""
+import json
+
+import pytest
+
+EXPENSE = {"date": "2025-03-01", "merchant": "Cafe Mio", "category": "Food", "currency": "HKD",
+           "amount": 42.0, "items": "latte"}
+
+
+@pytest.mark.parametrize("function", ["parse_expense_with_api", "parse_multi_with_api"])
+def test_recording_replays_on_a_later_day(run_in_app, set_today, stub_llm_server, monkeypatch, function):
+    text = "flat white and a croissant, the usual place"
+
+    def parse_on(day):
+        def check(app):
+            set_today(app, day)
+            with app["db_pool"].transaction() as conn:
+                conn.execute("DELETE FROM parse_cache")  # answer from the LLM (or its recording) only
+            result = app[function](text)
+            return result.model_dump() if hasattr(result, "model_dump") else result
+        return check
+
+    stub_llm_server.reply = lambda prompt: json.dumps({"expenses": [EXPENSE]} if "Extract ALL" in prompt else EXPENSE)
+    monkeypatch.setenv("LLM_RECORD", "1")
+    recorded = run_in_app(parse_on("2025-03-01"))
+    assert len(stub_llm_server.prompts) == 1
+    assert "Today: 2025-03-01" in stub_llm_server.prompts[0]
+
+    monkeypatch.setenv("LLM_BACKEND", "replay")
+    monkeypatch.delenv("LLM_RECORD")
+    replayed = run_in_app(parse_on("2025-03-09"))
+    assert replayed == recorded
+    assert recorded in (EXPENSE, [EXPENSE])
+    assert len(stub_llm_server.prompts) == 1
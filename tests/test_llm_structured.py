@@ -0,0 +1,65 @@
+"""Structured LLM replies and prompt compaction: validated models, repaired replies, token budget."""
+import json
+
+import pytest
+
+EXPENSE = {"date": "2025-03-01", "merchant": "Cafe Mio", "category": "Food", "currency": "HKD",
+           "amount": 42.0, "items": "latte"}
+
+
+def test_prompt_compaction_drops_noise_and_keeps_head_and_tail(run_in_app):
+    receipt = "\n".join(["CAFE MIO", "------------", "|", "x", "菜", "2025-03-01", "Latte 42.00", "Latte 42.00",
+                         *[f"Loyalty point line {n}" for n in range(200)], "TOTAL HK$ 84.00"])
+
+    def check(app):
+        return (app["compact_for_prompt"](receipt), app["compact_for_prompt"](receipt, budget=60),
+                app["_estimate_tokens"], app["_multi_prompt"](receipt))
+
+    compact, trimmed, estimate, multi_prompt = run_in_app(check)
+    assert compact.splitlines()[:5] == ["CAFE MIO", "菜", "2025-03-01", "Latte 42.00", "Loyalty point line 0"]
+    assert estimate(trimmed) <= 60
+    assert trimmed.splitlines()[0] == "CAFE MIO" and trimmed.splitlines()[-1] == "TOTAL HK$ 84.00"
+    assert "[...]" in trimmed
+    # Multi-expense prompts are chunked rather than trimmed, and repeated lines are separate purchases
+    assert multi_prompt.count("Latte 42.00") == 2 and "Loyalty point line 199" in multi_prompt
+
+
+@pytest.mark.parametrize("method, reply", [
+    ("json_schema", json.dumps(EXPENSE)),
+    # Without a schema-constrained reply, a fenced answer is repaired by the output parser
+    ("function_calling", f"Here you go:\n```json\n{json.dumps(EXPENSE)}\n```"),
+    ("off", f"```json\n{json.dumps(EXPENSE)}\n```"),
+])
+def test_single_expense_reply_is_validated(run_in_app, stub_llm_server, monkeypatch, method, reply):
+    monkeypatch.setenv("LLM_STRUCTURED_METHOD", method)
+    stub_llm_server.reply = lambda prompt: reply
+
+    def check(app):
+        expense = app["parse_expense_with_api"]("latte at cafe mio, the usual")
+        return expense.model_dump() if expense else None, dict(app["st"].session_state.llm_metrics)
+
+    expense, metrics = run_in_app(check)
+    assert expense == EXPENSE
+    assert metrics["calls"] == 1 and metrics["failures"] == 0
+    assert (metrics["input_tokens"], metrics["output_tokens"]) == (100, 20)
+
+
+def test_valid_items_of_a_partly_invalid_list_are_kept(run_in_app, stub_llm_server, monkeypatch):
+    monkeypatch.setenv("LLM_STRUCTURED_METHOD", "off")
+    stub_llm_server.reply = lambda prompt: json.dumps(
+        {"expenses": [EXPENSE, {"merchant": "no amount"}, dict(EXPENSE, merchant="MTR", amount="12")]})
+
+    merchants = run_in_app(lambda app: [e["merchant"] for e in app["parse_multi_with_api"]("a long statement")])
+    assert merchants == ["Cafe Mio", "MTR"]
+
+
+def test_unparseable_reply_counts_as_a_failure(run_in_app, stub_llm_server, monkeypatch):
+    monkeypatch.setenv("LLM_STRUCTURED_METHOD", "off")
+    stub_llm_server.reply = lambda prompt: "Sorry, I can't read that receipt."
+
+    def check(app):
+        return app["parse_expense_with_api"]("smudged receipt"), dict(app["st"].session_state.llm_metrics)
+
+    expense, metrics = run_in_app(check)
+    assert expense is None
+    assert (metrics["calls"], metrics["failures"]) == (1, 1)
@@ -0,0 +1,55 @@
+"""Golden corpus pinning the local (no-LLM) parser.
+
+Expected outputs live in golden/local_parse.json. Dates equal to the day the test runs (or the day
+before) are stored as "<today>" / "<yesterday>". After an intentional behaviour change, regenerate
+with UPDATE_GOLDEN=1 and review the diff."""
+import json
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+
+GOLDEN_PATH = Path(__file__).resolve().parent / "golden" / "local_parse.json"
+
+CORPUS = [
+    "Coffee at Starbucks 150 dollars today", "Starbucks coffee 150 HKD", "spent 50 on lunch", "paid $30 for taxi",
+    "花了100元 吃飯", "午餐 80元", "在全聯 買菜 花了 350", "星巴克咖啡 150 元", "Uber 45", "lunch 2025-01-15 $45",
+    "2025-01-15 lunch", "dinner at Ramen Ichiran for 1200 JPY", "HK$ 88 at McDonald", "NT$200 bento", "RM 15 grab",
+    "£12.50 pizza", "€9 cafe", "Netflix subscription 15.99 USD", "movie tickets 2 for 240", "electric bill 560",
+    "from Amazon 30 dollars", "pharmacy 120.5 港元", "日元 5000 sushi", "韓元 9000 coffee", "RMB 300 shopping",
+    "US dollars 40 nike", "SGD 20 parking", "KTV 500", "bought clothes at uniqlo for 299", "I paid 1,234 at costco",
+    "SUPERMARKET\nMilk 20\nBread 15\nTOTAL 35.00", "7-Eleven\n2025-02-01\nTotal: $28.50", "Receipt\n合計 NT$ 450",
+    "2025-03-03\nStarbucks $45.00\nMTR 12.00\n7-Eleven -$28.00\n$99.90 Uniqlo",
+    "Apple Pay\nMcDonald's HK$32.50\nTaxi 80 HKD",
+    "no amount here", "12 150元", "abc150元 def", "yesterday spent 3.5 at cafe", "消費 200 捷運", "付了 $45 早餐",
+    "Grab ride 2025-12-01 RM12", "250", "coffee", "Total 0 free", "1234567 big number", "3 items 45.60 at 7-11",
+    "2025-01-01\n2025/02/03\nShop A 10\nShop B US$ 20.5 USD", "100 TWD 50 HKD", "HKD 50 元", "ramen 1,200円",
+]
+
+FUNCTIONS = ["try_local_parse", "try_local_parse_multi", "detect_currency", "guess_category"]
+
+
+def _relative_dates(value):
+    """Replace today's and yesterday's dates with placeholders so the corpus doesn't age."""
+    today = datetime.now()
+    markers = {today.strftime('%Y-%m-%d'): "<today>",
+               (today - timedelta(days=1)).strftime('%Y-%m-%d'): "<yesterday>"}
+    if isinstance(value, dict):
+        return {key: _relative_dates(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_relative_dates(item) for item in value]
+    return markers.get(value, value)
+
+
+def test_local_parser_matches_golden_corpus(evaluate_in_app):
+    calls = [(function, text) for function in FUNCTIONS for text in CORPUS]
+    values = iter(_relative_dates(evaluate_in_app(calls)))
+    actual = {function: {text: next(values) for text in CORPUS} for function in FUNCTIONS}
+
+    if os.getenv("UPDATE_GOLDEN"):
+        GOLDEN_PATH.write_text(json.dumps(actual, ensure_ascii=False, indent=1) + "\n", encoding="utf-8")
+    expected = json.loads(GOLDEN_PATH.read_text(encoding="utf-8"))
+
+    mismatches = [(function, text, expected[function].get(text), actual[function][text])
+                  for function in FUNCTIONS for text in CORPUS
+                  if expected[function].get(text) != actual[function][text]]
+    assert not mismatches, "\n".join(f"{f}({t!r}): expected {e!r}, got {a!r}" for f, t, e, a in mismatches)
@@ -0,0 +1,30 @@
+"""Schema migrations: a database from the first release is brought up to date once, in order."""
+import sqlite3
+
+
+def test_legacy_database_is_migrated(run_in_app, tmp_path):
+    legacy = sqlite3.connect(tmp_path / "expenses.db")
+    legacy.execute("""CREATE TABLE expenses (id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT, merchant TEXT,
+                      category TEXT, amount REAL, items TEXT, source TEXT)""")
+    legacy.executemany("INSERT INTO expenses (date, merchant, category, amount, items, source) VALUES (?, ?, 'Food', 1, '', '')",
+                       [("2025/3/5", "A"), ("March 7, 2025", "B"), ("2025-03-09", "C"), ("not a date", "D")])
+    legacy.commit()
+    legacy.close()
+
+    def check(app):
+        with app["db_pool"].connection() as conn:
+            versions = [row[0] for row in conn.execute("SELECT version FROM schema_version ORDER BY version")]
+        app["run_migrations"]()  # Already applied: nothing runs twice
+        with app["db_pool"].connection() as conn:
+            rerun_versions = [row[0] for row in conn.execute("SELECT version FROM schema_version ORDER BY version")]
+            columns = app["_table_columns"](conn, "expenses")
+            dates = conn.execute("SELECT merchant, date FROM expenses ORDER BY id").fetchall()
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+        return versions, rerun_versions, columns, dates, tables, [version for version, _ in app["MIGRATIONS"]]
+
+    versions, rerun_versions, columns, dates, tables, expected_versions = run_in_app(check)
+    assert versions == rerun_versions == expected_versions == sorted(expected_versions)
+    assert {"username", "currency", "amount_hkd"} <= columns
+    assert dates == [("A", "2025-03-05"), ("B", "2025-03-07"), ("C", "2025-03-09"), ("D", "not a date")]
+    assert {"idx_expenses_user_date", "idx_expenses_user_category_date", "parse_cache", "category_keywords",
+            "jobs", "fx_rates"} <= tables
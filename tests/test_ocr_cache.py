@@ -0,0 +1,53 @@
+"""OcrResultCache and extract_receipt_text: receipts are read once, memory and disk stay bounded."""
+import os
+
+import pytest
+
+
+def test_memory_entries_are_least_recently_used(run_in_app):
+    def check(app):
+        cache = app["OcrResultCache"](max_entries=2)
+        cache.put("a", ("A", []), "tester")
+        cache.put("b", ("B", []), "tester")
+        cache.get("a")
+        cache.put("c", ("C", []), "tester")
+        return [cache.get(key) for key in ("a", "b", "c")]
+
+    assert run_in_app(check) == [("A", []), None, ("C", [])]
+
+
+def test_disk_entries_are_shared_and_pruned_oldest_first(run_in_app, tmp_path):
+    cache_dir = str(tmp_path / "ocr_cache")
+
+    def check(app):
+        writer = app["OcrResultCache"](max_entries=1, cache_dir=cache_dir, max_disk_entries=2)
+        writer.put("a", ("A", ["text"]), "tester")
+        writer.put("b", ("B", ["ocr"]), "tester")
+        os.utime(os.path.join(cache_dir, "a.json"), (1, 1))
+        os.utime(os.path.join(cache_dir, "b.json"), (2, 2))
+        # Another process: a disk hit marks "a" as recently used, so "b" is pruned for "c"
+        reader = app["OcrResultCache"](max_entries=1, cache_dir=cache_dir, max_disk_entries=2)
+        hit = reader.get("a")
+        reader.put("c", ("C", []), "tester")
+        return hit, sorted(os.listdir(cache_dir))
+
+    assert run_in_app(check) == (("A", ["text"]), ["a.json", "c.json"])
+
+
+def test_receipts_are_extracted_once(run_in_app):
+    pymupdf = pytest.importorskip("pymupdf")
+    document = pymupdf.open()
+    document.new_page().insert_text((72, 72), "Cafe Mio\nLatte 42.00\nTOTAL HK$ 42.00 paid by Octopus card")
+    pdf_bytes = document.tobytes()
+
+    def check(app):
+        pages = []
+        first = app["extract_receipt_text"](pdf_bytes, True, "tester", on_page=lambda *args: pages.append(args))
+        second = app["extract_receipt_text"](pdf_bytes, True, "tester", on_page=lambda *args: pages.append(args))
+        return first, second, len(pages)
+
+    (text, methods, first_cached), second, page_calls = run_in_app(check)
+    assert "TOTAL HK$ 42.00" in text
+    assert first_cached is False
+    assert second == (text, methods, True)
+    assert page_calls == 1
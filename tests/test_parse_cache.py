@@ -0,0 +1,59 @@
+"""The LLM parse cache: expiry, eviction and moving relative dates to the day of the hit."""
+import pytest
+
+
+def _record(date, merchant="Cafe Mio"):
+    return {"date": date, "merchant": merchant, "category": "Food", "currency": "HKD", "amount": 40.0,
+            "items": "latte"}
+
+
+@pytest.mark.parametrize("text, recorded, replayed", [
+    ("coffee yesterday 40", "2025-03-09", "2025-03-19"),      # relative day: keeps its offset
+    ("coffee 40", "2025-03-10", "2025-03-20"),                # no day named: parsed as "today"
+    ("coffee last month 40", "2025-02-10", "2025-02-10"),     # outside the rebase window
+    ("coffee on 2025-03-09 40", "2025-03-09", "2025-03-09"),  # ISO date
+    ("coffee 9/3 40", "2025-03-09", "2025-03-09"),            # numeric day/month
+    ("coffee on Mar 9 40", "2025-03-09", "2025-03-09"),       # month name
+    ("咖啡 3月9日 40", "2025-03-09", "2025-03-09"),             # 月/日
+])
+def test_hits_rebase_only_relative_dates(run_in_app, set_today, text, recorded, replayed):
+    def check(app):
+        set_today(app, "2025-03-10")
+        app["parse_cache_put"]("single", text, [_record(recorded)])
+        set_today(app, "2025-03-20")
+        # Keyed on normalized text: case and spacing don't matter
+        return app["parse_cache_get"]("single", f"  {text.upper()} ")
+
+    assert run_in_app(check) == [_record(replayed)]
+
+
+def test_expired_entries_miss_and_are_evicted(run_in_app, monkeypatch):
+    monkeypatch.setenv("PARSE_CACHE_TTL_DAYS", "3")
+
+    def check(app):
+        app["parse_cache_put"]("single", "old", [_record("2025-03-01")])
+        with app["db_pool"].transaction() as conn:
+            conn.execute("UPDATE parse_cache SET created_at = created_at - 4 * 86400")
+        expired = app["parse_cache_get"]("single", "old")
+        app["parse_cache_put"]("single", "new", [_record("2025-03-01")])
+        with app["db_pool"].connection() as conn:
+            remaining = conn.execute("SELECT COUNT(*) FROM parse_cache").fetchone()[0]
+        return expired, remaining, app["parse_cache_get"]("single", "new") is not None
+
+    assert run_in_app(check) == (None, 1, True)
+
+
+def test_least_recently_used_entries_are_evicted(run_in_app, monkeypatch):
+    monkeypatch.setenv("PARSE_CACHE_MAX_ENTRIES", "2")
+
+    def check(app):
+        app["parse_cache_put"]("single", "a", [_record("2025-03-01", "A")])
+        app["parse_cache_put"]("single", "b", [_record("2025-03-01", "B")])
+        with app["db_pool"].transaction() as conn:
+            # Age both entries, then use "a" again so "b" is the least recently used
+            conn.execute("UPDATE parse_cache SET last_used_at = last_used_at - 10 WHERE kind = 'single'")
+        app["parse_cache_get"]("single", "a")
+        app["parse_cache_put"]("single", "c", [_record("2025-03-01", "C")])
+        return [app["parse_cache_get"]("single", text) is not None for text in ("a", "b", "c")]
+
+    assert run_in_app(check) == [True, False, True]
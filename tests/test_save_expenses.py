@@ -0,0 +1,31 @@
+"""save_expenses_bulk / save_expense: validation, HKD conversion and the rows written."""
+
+
+def _row(merchant, amount, currency="HKD", date="2025-03-01"):
+    return {"date": date, "merchant": merchant, "category": "Food", "currency": currency,
+            "amount": amount, "items": merchant}
+
+
+def test_bulk_save_skips_invalid_rows(run_in_app):
+    def check(app):
+        saved = app["save_expenses_bulk"](
+            [_row("Cafe", 40), _row("Broken", "not a number"), _row("Diner", 10, "USD", "2025/03/02")], "test")
+        with app["db_pool"].connection() as conn:
+            rows = conn.execute("SELECT username, date, merchant, currency, amount, amount_hkd, source "
+                                "FROM expenses ORDER BY id").fetchall()
+        return saved, rows, app["convert_to_hkd"](10, "USD", "2025-03-02")
+
+    saved, rows, usd_in_hkd = run_in_app(check)
+    assert saved == [40.0, usd_in_hkd]
+    assert rows == [("tester", "2025-03-01", "Cafe", "HKD", 40.0, 40.0, "test"),
+                    ("tester", "2025-03-02", "Diner", "USD", 10.0, usd_in_hkd, "test")]
+
+
+def test_save_expense_returns_none_for_an_invalid_row(run_in_app):
+    def check(app):
+        invalid = app["save_expense"]("2025-03-01", None, "Food", "HKD", 12, "tea", "quick_form")
+        valid = app["save_expense"]("2025-03-01", "Tea House", "Food", "HKD", 12, "tea", "quick_form")
+        with app["db_pool"].connection() as conn:
+            return invalid, valid, conn.execute("SELECT merchant FROM expenses").fetchall()
+
+    assert run_in_app(check) == (None, 12.0, [("Tea House",)])